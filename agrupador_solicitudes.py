@@ -0,0 +1,133 @@
+"""
+Agrupación de solicitudes idénticas en curso (single-flight).
+
+Cuando varias solicitudes con la misma clave llegan mientras la primera todavía
+se calcula, solo la primera ejecuta el cálculo y las demás esperan su resultado
+(o su excepción). A diferencia de la caché, no guarda nada: una vez terminado el
+cálculo, la siguiente solicitud con esa clave calcula de nuevo. Protege al modelo
+de ráfagas de perfiles iguales aunque la caché esté desactivada o la clave sea
+nueva.
+
+La agrupación ocurre entre los hilos de un proceso; con servidor_prefork.py cada
+trabajador agrupa solo sus propias solicitudes.
+"""
+
+import threading
+import time
+
+import metricas
+
+
+class _Calculo:
+    """Cálculo en curso de una clave."""
+
+    __slots__ = ('terminado', 'resultado', 'error')
+
+    def __init__(self):
+        self.terminado = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class AgrupadorSolicitudes:
+    """
+    Ejecuta una sola vez los cálculos concurrentes con la misma clave.
+    """
+
+    def __init__(self, operacion='recomendaciones', tiempo_espera=None):
+        """
+        Args:
+            operacion (str): Nombre de la operación en las métricas
+            tiempo_espera (float, opcional): Segundos máximos que una solicitud espera
+                el cálculo de otra; al agotarse calcula por su cuenta. None para
+                esperar sin límite
+        """
+        self.operacion = operacion
+        self.tiempo_espera = tiempo_espera
+
+        self._calculos = {}
+        self._lock = threading.Lock()
+
+        self.calculadas = 0
+        self.agrupadas = 0
+        self.esperas_agotadas = 0
+
+        ayuda = 'Solicitudes por resultado de la agrupación de cálculos idénticos en curso'
+        self._calculadas = metricas.REGISTRO.contador('cultivos_agrupacion_total', ayuda,
+                                                      operacion=operacion, resultado='calculada')
+        self._agrupadas = metricas.REGISTRO.contador('cultivos_agrupacion_total', ayuda,
+                                                     operacion=operacion, resultado='agrupada')
+        self._esperas_agotadas = metricas.REGISTRO.contador('cultivos_agrupacion_total', ayuda,
+                                                            operacion=operacion, resultado='espera_agotada')
+        self._espera = metricas.REGISTRO.histograma('cultivos_agrupacion_espera_segundos',
+                                                    'Tiempo que una solicitud agrupada esperó el resultado de otra',
+                                                    operacion=operacion)
+
+    def ejecutar(self, clave, calcular):
+        """
+        Resultado de `calcular()` para `clave`, compartido con las llamadas concurrentes.
+
+        Args:
+            clave (hashable): Identificador del cálculo; debe incluir todo lo que
+                cambia el resultado (p. ej. la versión de los datos)
+            calcular (callable): Función sin argumentos que calcula el resultado
+
+        Returns:
+            El resultado del cálculo. Puede compartirse entre solicitudes y no debe
+            modificarse.
+
+        Raises:
+            Exception: La excepción del cálculo, también en las solicitudes agrupadas
+        """
+        with self._lock:
+            calculo = self._calculos.get(clave)
+            if calculo is not None:
+                propio = False
+            else:
+                calculo = self._calculos[clave] = _Calculo()
+                propio = True
+
+        if not propio:
+            return self._esperar(calculo, calcular)
+
+        self._calculadas.inc()
+        try:
+            calculo.resultado = calcular()
+            return calculo.resultado
+        except Exception as e:
+            calculo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calculos[clave]
+                self.calculadas += 1
+            calculo.terminado.set()
+
+    def _esperar(self, calculo, calcular):
+        """Espera el cálculo de otra solicitud y retorna su resultado."""
+        inicio = time.perf_counter()
+        if not calculo.terminado.wait(self.tiempo_espera):
+            with self._lock:
+                self.esperas_agotadas += 1
+            self._esperas_agotadas.inc()
+            return calcular()
+
+        self._espera.observar_desde(inicio)
+        with self._lock:
+            self.agrupadas += 1
+        self._agrupadas.inc()
+        if calculo.error is not None:
+            raise calculo.error
+        return calculo.resultado
+
+    def estadisticas(self):
+        """Contadores de uso del agrupador."""
+        with self._lock:
+            total = self.calculadas + self.agrupadas
+            return {
+                'en_curso': len(self._calculos),
+                'calculadas': self.calculadas,
+                'agrupadas': self.agrupadas,
+                'esperas_agotadas': self.esperas_agotadas,
+                'tasa_agrupadas': self.agrupadas / total if total else 0.0
+            }
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark del arranque en frío del servidor.
+
+Inicia varias veces un proceso nuevo que importa server.py, crea la aplicación
+(`crear_app`) y escucha en un puerto libre, y mide:
+
+- la importación de server.py y la creación de la aplicación (dentro del proceso),
+- el tiempo desde que se lanza el proceso hasta que escucha,
+- la primera respuesta de POST /api/recomendaciones (con la carga diferida de los
+  datos complementarios) y el tiempo total hasta recibirla.
+
+Con --presupuesto, termina con código 1 si la mediana del tiempo hasta la primera
+respuesta supera el presupuesto, para detener un despliegue que lo exceda.
+
+Uso:
+    python benchmark_arranque.py [--db cultivos.db] [--repeticiones 5] [--presupuesto 3.0]
+                                 [--instantanea cultivos.snap] [--precargar] [--importaciones 10]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Módulos cuyo costo de importación se reporta si quedan cargados al iniciar
+MODULOS_PESADOS = ('flask', 'numpy', 'pandas', 'scipy', 'sklearn')
+
+PERFIL_PRUEBA = {'temperatura': 22, 'precipitacion': 1500, 'altitud': 1200, 'experiencia': 'Media'}
+
+# Código del servidor: importa, crea la aplicación, escribe los tiempos en stdout y escucha
+_CODIGO_SERVIDOR = r"""
+import json, sys, time
+inicio = time.perf_counter()
+import server
+importado = time.perf_counter()
+app = server.crear_app(json.loads(sys.argv[1]))
+creado = time.perf_counter()
+from werkzeug.serving import make_server
+servidor = make_server('127.0.0.1', 0, app)
+print(json.dumps({'importacion_s': importado - inicio, 'creacion_s': creado - importado,
+                  'puerto': servidor.server_port,
+                  'modulos': [m for m in json.loads(sys.argv[2]) if m in sys.modules]}), flush=True)
+servidor.serve_forever()
+"""
+
+_DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+def medir_arranque(configuracion):
+    """
+    Inicia un servidor en un proceso nuevo y mide su arranque hasta la primera respuesta.
+
+    Args:
+        configuracion (dict): Opciones de `server.crear_app`
+
+    Returns:
+        dict: Tiempos en segundos y módulos pesados cargados al iniciar
+    """
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, '-c', _CODIGO_SERVIDOR, json.dumps(configuracion), json.dumps(MODULOS_PESADOS)],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, cwd=_DIRECTORIO
+    )
+    try:
+        # El modelo también escribe mensajes en stdout; los tiempos van en la línea JSON
+        linea = ''
+        while not linea.startswith('{'):
+            linea = proceso.stdout.readline()
+            if not linea:
+                raise RuntimeError("El servidor terminó antes de escuchar")
+        medicion = json.loads(linea)
+        escuchando = time.perf_counter()
+
+        def solicitar():
+            conexion = http.client.HTTPConnection('127.0.0.1', medicion['puerto'], timeout=120)
+            conexion.request('POST', '/api/recomendaciones', json.dumps(PERFIL_PRUEBA),
+                             {'Content-Type': 'application/json'})
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            conexion.close()
+            if respuesta.status != 200:
+                raise RuntimeError(f"La solicitud de prueba respondió {respuesta.status}")
+            return time.perf_counter()
+
+        primera = solicitar()
+        segunda = solicitar()
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+    medicion.update({
+        'hasta_escuchar_s': escuchando - inicio,
+        'primera_respuesta_s': primera - escuchando,
+        'segunda_respuesta_s': segunda - primera,
+        'hasta_primera_respuesta_s': primera - inicio
+    })
+    return medicion
+
+
+def importaciones_directas(limite):
+    """
+    Módulos que importa server.py, ordenados por su tiempo de importación acumulado
+    (python -X importtime en un proceso nuevo).
+
+    Returns:
+        list: Pares (módulo, segundos)
+    """
+    resultado = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import server'],
+                               capture_output=True, text=True, cwd=_DIRECTORIO)
+    importaciones = []
+    for linea in resultado.stderr.splitlines():
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        _, acumulado, nombre = linea[len('import time:'):].split('|')
+        # Cada nivel de anidamiento agrega dos espacios al nombre
+        importaciones.append(((len(nombre) - len(nombre.lstrip())) // 2, nombre.strip(), int(acumulado) / 1e6))
+
+    # Cada módulo aparece después de los que importa: las importaciones directas de
+    # server son las de nivel 1 anteriores a él, hasta el módulo de nivel 0 previo
+    modulos = []
+    posicion = max(i for i, (nivel, nombre, _) in enumerate(importaciones) if nivel == 0 and nombre == 'server')
+    for nivel, nombre, segundos in reversed(importaciones[:posicion]):
+        if nivel == 0:
+            break
+        if nivel == 1:
+            modulos.append((nombre, segundos))
+    return sorted(modulos, key=lambda modulo: -modulo[1])[:limite]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='cultivos.db')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--presupuesto', type=float, help='Segundos máximos hasta la primera respuesta (mediana)')
+    parser.add_argument('--instantanea', help='Instantánea de datos de instantanea_datos.py')
+    parser.add_argument('--precargar', action='store_true', help='Cargar los datos complementarios al iniciar')
+    parser.add_argument('--importaciones', type=int, default=10,
+                        help='Módulos importados por server.py que se listan (0 para omitir)')
+    args = parser.parse_args()
+
+    configuracion = {
+        'DB_PATH': os.path.abspath(args.db),
+        'INTERVALO_RECARGA_DATOS': 0,
+        'PRECARGAR_DATOS': '1' if args.precargar else '0'
+    }
+    if args.instantanea:
+        configuracion['INSTANTANEA_DATOS'] = os.path.abspath(args.instantanea)
+
+    if args.importaciones:
+        print("Importaciones de server.py (tiempo acumulado):")
+        for modulo, segundos in importaciones_directas(args.importaciones):
+            print(f"  {modulo:<28} {segundos * 1000:>9.1f} ms")
+        print()
+
+    columnas = ('importacion_s', 'creacion_s', 'hasta_escuchar_s', 'primera_respuesta_s', 'segunda_respuesta_s',
+                'hasta_primera_respuesta_s')
+    print(f"{'rep.':>4} {'import. ms':>11} {'crear app ms':>13} {'escucha ms':>11} {'1.a resp. ms':>13} "
+          f"{'2.a resp. ms':>13} {'total ms':>9}")
+    mediciones = []
+    for repeticion in range(1, args.repeticiones + 1):
+        medicion = medir_arranque(configuracion)
+        mediciones.append(medicion)
+        print(f"{repeticion:>4} " + ' '.join(
+            f"{medicion[columna] * 1000:>{ancho}.1f}" for columna, ancho in zip(columnas, (11, 13, 11, 13, 13, 9))
+        ))
+
+    mediana = {columna: statistics.median(m[columna] for m in mediciones) for columna in columnas}
+    print(f"{'med.':>4} " + ' '.join(
+        f"{mediana[columna] * 1000:>{ancho}.1f}" for columna, ancho in zip(columnas, (11, 13, 11, 13, 13, 9))
+    ))
+    print(f"\nMódulos pesados cargados al escuchar: {', '.join(mediciones[-1]['modulos']) or 'ninguno'}")
+
+    if args.presupuesto is not None:
+        total = mediana['hasta_primera_respuesta_s']
+        if total > args.presupuesto:
+            print(f"Presupuesto de arranque excedido: {total:.2f} s > {args.presupuesto:.2f} s")
+            sys.exit(1)
+        print(f"Dentro del presupuesto de arranque: {total:.2f} s <= {args.presupuesto:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
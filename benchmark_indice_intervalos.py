@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark del filtrado por condiciones básicas: máscaras completas frente al
+índice de intervalos, sobre catálogos sintéticos de distintos tamaños.
+
+Uso:
+    python benchmark_indice_intervalos.py [--consultas 200] [--tamanos 36,1000,10000,50000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from indice_intervalos import IndiceIntervalos
+from modelo_recomendacion import (
+    ModeloRecomendacionCultivos, MARGEN_TEMPERATURA, MARGEN_PRECIPITACION, MARGEN_ALTITUD
+)
+
+# Rangos de los datos sintéticos (similares a los de la tabla condiciones)
+RANGOS = {
+    'temperatura': (5, 35, 2, 10),          # (mínimo, máximo, ancho mínimo, ancho máximo)
+    'precipitacion': (300, 4000, 200, 1200),
+    'altitud': (0, 3500, 200, 1500)
+}
+
+MARGENES = (MARGEN_TEMPERATURA, MARGEN_PRECIPITACION, MARGEN_ALTITUD)
+
+
+def generar_condiciones(num_filas, rng):
+    """Genera intervalos aleatorios [mínimo, máximo] por dimensión."""
+    dimensiones = []
+    for minimo, maximo, ancho_min, ancho_max in RANGOS.values():
+        inicio = rng.uniform(minimo, maximo, num_filas)
+        ancho = rng.uniform(ancho_min, ancho_max, num_filas)
+        dimensiones.append((inicio, inicio + ancho))
+    return dimensiones
+
+
+def generar_consultas(num_consultas, rng):
+    """Genera perfiles aleatorios (temperatura, precipitación, altitud)."""
+    return np.column_stack([
+        rng.uniform(minimo, maximo, num_consultas) for minimo, maximo, _, _ in RANGOS.values()
+    ])
+
+
+def filtrar_con_mascaras(dimensiones, consulta):
+    """Ruta actual: máscaras booleanas completas con relajación por margen."""
+    mascara = None
+    for (minimos, maximos), valor, margen in zip(dimensiones, consulta, MARGENES):
+        mascara = ModeloRecomendacionCultivos._mascara_rango(minimos, maximos, valor, margen, mascara)
+    return mascara
+
+
+def filtrar_con_indice(indices, consulta):
+    """Ruta con índice: consultas de punto e intersección de bitsets."""
+    bits = None
+    for indice, valor, margen in zip(indices, consulta, MARGENES):
+        bits = ModeloRecomendacionCultivos._consultar_rango(indice, valor, margen, bits)
+    return indices[0].a_mascara(bits)
+
+
+def medir(funcion, consultas):
+    """Tiempo promedio por consulta en microsegundos."""
+    inicio = time.perf_counter()
+    for consulta in consultas:
+        funcion(consulta)
+    return (time.perf_counter() - inicio) / len(consultas) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--consultas', type=int, default=200)
+    parser.add_argument('--tamanos', default='36,500,2000,10000,20000,50000,100000')
+    parser.add_argument('--semilla', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.semilla)
+    consultas = generar_consultas(args.consultas, rng)
+    tamanos = [int(t) for t in args.tamanos.split(',')]
+
+    print(f"{'filas':>8} {'mascaras (us)':>14} {'indice (us)':>12} {'construccion (ms)':>18} {'aceleracion':>12}")
+
+    cruce = None
+    for num_filas in tamanos:
+        dimensiones = generar_condiciones(num_filas, rng)
+
+        inicio = time.perf_counter()
+        indices = [IndiceIntervalos(minimos, maximos) for minimos, maximos in dimensiones]
+        construccion = (time.perf_counter() - inicio) * 1e3
+
+        # Ambas rutas deben seleccionar exactamente las mismas filas
+        for consulta in consultas[:20]:
+            if not np.array_equal(filtrar_con_mascaras(dimensiones, consulta), filtrar_con_indice(indices, consulta)):
+                raise AssertionError(f"Resultados distintos con {num_filas} filas para la consulta {consulta}")
+
+        t_mascaras = medir(lambda c: filtrar_con_mascaras(dimensiones, c), consultas)
+        t_indice = medir(lambda c: filtrar_con_indice(indices, c), consultas)
+
+        if cruce is None and t_indice < t_mascaras:
+            cruce = num_filas
+
+        print(f"{num_filas:>8} {t_mascaras:>14.1f} {t_indice:>12.1f} {construccion:>18.1f} {t_mascaras / t_indice:>11.2f}x")
+
+    if cruce is None:
+        print("\nEl índice no superó a las máscaras en los tamaños probados.")
+    else:
+        print(f"\nEl índice supera a las máscaras a partir de ~{cruce} filas "
+              f"(umbral configurado en el modelo: UMBRAL_INDICE_INTERVALOS).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark de rendimiento de POST /api/recomendaciones con el lanzador pre-fork
+(servidor_prefork.py) y distinto número de trabajadores.
+
+Para cada número de trabajadores se inicia el lanzador, se espera a que responda y
+varios procesos cliente envían perfiles aleatorios durante un tiempo fijo.
+
+Uso:
+    python benchmark_prefork.py [--trabajadores 1,2,4,8] [--clientes 16] [--duracion 10]
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _esperar_servidor(puerto, proceso, timeout=120):
+    """Espera a que el servidor responda en el puerto."""
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError("El lanzador terminó antes de iniciar")
+        try:
+            conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=5)
+            conexion.request('GET', '/api/datos/estado')
+            if conexion.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"El servidor no respondió en {timeout} s")
+
+
+def _cliente(puerto, duracion, semilla, cola):
+    """Envía solicitudes durante `duracion` segundos y devuelve las latencias."""
+    rng = random.Random(semilla)
+    latencias = []
+    errores = 0
+    limite = time.perf_counter() + duracion
+
+    while time.perf_counter() < limite:
+        cuerpo = json.dumps({
+            'temperatura': round(rng.uniform(5, 32), 1),
+            'precipitacion': round(rng.uniform(400, 4000)),
+            'altitud': round(rng.uniform(0, 3500)),
+            'experiencia': rng.choice(['Baja', 'Media', 'Alta'])
+        })
+        inicio = time.perf_counter()
+        try:
+            conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=30)
+            conexion.request('POST', '/api/recomendaciones', cuerpo, {'Content-Type': 'application/json'})
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            conexion.close()
+            if respuesta.status != 200:
+                errores += 1
+                continue
+        except OSError:
+            errores += 1
+            continue
+        latencias.append(time.perf_counter() - inicio)
+
+    cola.put((latencias, errores))
+
+
+def medir(lanzador, trabajadores, clientes, duracion):
+    """Inicia el lanzador con `trabajadores` procesos y mide el rendimiento."""
+    puerto = _puerto_libre()
+    proceso = subprocess.Popen(
+        [sys.executable, lanzador, '--trabajadores', str(trabajadores), '--host', '127.0.0.1',
+         '--puerto', str(puerto), '--intervalo-recarga', '0'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        _esperar_servidor(puerto, proceso)
+
+        cola = multiprocessing.Queue()
+        procesos = [
+            multiprocessing.Process(target=_cliente, args=(puerto, duracion, semilla, cola))
+            for semilla in range(clientes)
+        ]
+        for p in procesos:
+            p.start()
+        resultados = [cola.get() for _ in procesos]
+        for p in procesos:
+            p.join()
+    finally:
+        proceso.send_signal(signal.SIGTERM)
+        proceso.wait(timeout=60)
+
+    latencias = sorted(latencia for parcial, _ in resultados for latencia in parcial)
+    errores = sum(e for _, e in resultados)
+
+    def percentil(p):
+        return latencias[min(int(p * len(latencias)), len(latencias) - 1)] * 1000 if latencias else float('nan')
+
+    return {
+        'trabajadores': trabajadores,
+        'solicitudes_por_segundo': len(latencias) / duracion,
+        'p50_ms': percentil(0.50),
+        'p99_ms': percentil(0.99),
+        'errores': errores
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trabajadores', default='1,2,4,8')
+    parser.add_argument('--clientes', type=int, default=16)
+    parser.add_argument('--duracion', type=float, default=10.0, help='Segundos de carga por configuración')
+    parser.add_argument('--lanzador', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            'servidor_prefork.py'))
+    args = parser.parse_args()
+
+    print(f"Núcleos disponibles: {os.cpu_count()}; clientes: {args.clientes}; {args.duracion:g} s por configuración")
+    print(f"{'trabajadores':>12} {'sol./s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errores':>8}")
+    for trabajadores in (int(n) for n in args.trabajadores.split(',')):
+        r = medir(args.lanzador, trabajadores, args.clientes, args.duracion)
+        print(f"{r['trabajadores']:>12} {r['solicitudes_por_segundo']:>10.1f} {r['p50_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['errores']:>8}")
+
+
+if __name__ == "__main__":
+    main()
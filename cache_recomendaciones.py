@@ -0,0 +1,197 @@
+"""
+Caché de resultados de recomendación con política LRU y expiración por tiempo.
+
+Las claves se construyen a partir de una forma canónica de los parámetros del
+usuario: los valores numéricos se convierten a float y los textos se normalizan,
+de modo que el resultado guardado es exactamente el de los parámetros recibidos.
+Opcionalmente, los valores numéricos se redondean a una resolución configurable
+(por ejemplo, `CUANTIZACION_APROXIMADA`: temperaturas a 0.5 °C y precipitaciones
+a 50 mm) para que perfiles prácticamente iguales compartan resultado; en ese caso
+las respuestas son aproximadas, porque se calculan con los valores redondeados.
+Cada entrada guarda la versión de los datos con que se calculó y deja de ser
+válida cuando el modelo carga una versión distinta.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Parámetros numéricos que intervienen en la recomendación
+PARAMETROS_NUMERICOS = ('temperatura', 'precipitacion', 'altitud', 'ph_suelo', 'presupuesto',
+                        'tiempo_disponible', 'id_zona')
+
+# Parámetros obligatorios: el valor 0 es válido y no equivale a omitirlos
+PARAMETROS_OBLIGATORIOS = ('temperatura', 'precipitacion', 'altitud')
+
+# Resolución sugerida para una caché aproximada (la cuantización es opcional)
+CUANTIZACION_APROXIMADA = {
+    'temperatura': 0.5,        # °C
+    'precipitacion': 50,       # mm
+    'altitud': 50,             # msnm
+    'ph_suelo': 0.1,
+    'presupuesto': 100000,     # COP
+    'tiempo_disponible': 1,    # días
+    'id_zona': 1               # identificador de zona
+}
+
+# Parámetros de texto que intervienen en la recomendación
+PARAMETROS_TEXTO = ('tipo_suelo', 'modo_suelo', 'experiencia', 'departamento', 'preferencia_mercado')
+
+
+def canonizar(parametros_usuario, cuantizacion=None):
+    """
+    Obtiene la forma canónica de los parámetros del usuario.
+
+    Args:
+        parametros_usuario (dict): Parámetros de `recomendar_cultivos`
+        cuantizacion (dict, opcional): Resolución de cada parámetro numérico; sin
+            cuantización (o con resolución 0) los valores numéricos se conservan. Un
+            valor distinto de 0 nunca se redondea a 0
+
+    Returns:
+        tuple: (clave hashable, diccionario de parámetros canónicos)
+    """
+    canonicos = {}
+
+    for clave in PARAMETROS_NUMERICOS:
+        resolucion = (cuantizacion or {}).get(clave, 0)
+        valor = parametros_usuario.get(clave)
+        # Los valores vacíos equivalen a no especificar el parámetro
+        if valor is None or (not valor and clave not in PARAMETROS_OBLIGATORIOS):
+            continue
+        valor = float(valor)
+        if resolucion:
+            redondeado = round(valor / resolucion) * resolucion
+            # Evitar residuos de punto flotante en la clave (p. ej. 5.800000000000001)
+            redondeado = round(redondeado, 6)
+            # Un valor pequeño no se convierte en 0, que desactivaría su filtro
+            if redondeado or clave in PARAMETROS_OBLIGATORIOS:
+                valor = redondeado
+        canonicos[clave] = valor
+
+    for clave in PARAMETROS_TEXTO:
+        valor = parametros_usuario.get(clave)
+        if valor:
+            canonicos[clave] = ' '.join(str(valor).lower().split())
+
+    return tuple(sorted(canonicos.items())), canonicos
+
+
+class CacheRecomendaciones:
+    """
+    Caché LRU/TTL segura entre hilos para resultados de `recomendar_cultivos`.
+    """
+
+    def __init__(self, tamano_maximo=10000, ttl_segundos=3600, cuantizacion=None):
+        """
+        Inicializa la caché.
+
+        Args:
+            tamano_maximo (int): Número máximo de entradas antes de desalojar la menos usada
+            ttl_segundos (float, opcional): Vigencia de cada entrada; None para no expirar
+            cuantizacion (dict, opcional): Resolución por parámetro numérico (p. ej.
+                CUANTIZACION_APROXIMADA); sin ella la clave usa los valores exactos.
+                Con cuantización, el resultado se calcula con los valores redondeados y
+                es aproximado para los perfiles que comparten la clave
+        """
+        self.tamano_maximo = tamano_maximo
+        self.ttl_segundos = ttl_segundos
+        self.cuantizacion = dict(cuantizacion or {})
+
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.expiraciones = 0
+        self.invalidaciones = 0
+
+    def canonizar(self, parametros_usuario):
+        """
+        Obtiene la forma canónica de los parámetros del usuario.
+
+        Returns:
+            tuple: (clave hashable, diccionario de parámetros canónicos)
+        """
+        return canonizar(parametros_usuario, self.cuantizacion)
+
+    def obtener(self, clave, version):
+        """
+        Busca un resultado vigente para la clave y la versión de datos indicadas.
+
+        Returns:
+            El resultado guardado o None si no existe o ya no es válido
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave) if self._verificar_version(version) else None
+            if entrada is None:
+                self.fallos += 1
+                return None
+
+            resultado, expira = entrada
+            if expira is not None and expira <= time.monotonic():
+                del self._entradas[clave]
+                self.expiraciones += 1
+                self.fallos += 1
+                return None
+
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return resultado
+
+    def guardar(self, clave, resultado, version):
+        """Guarda un resultado calculado con la versión de datos indicada."""
+        expira = time.monotonic() + self.ttl_segundos if self.ttl_segundos is not None else None
+
+        with self._lock:
+            # Un resultado calculado con datos anteriores no se guarda
+            if not self._verificar_version(version):
+                return
+
+            self._entradas[clave] = (resultado, expira)
+            self._entradas.move_to_end(clave)
+
+            while len(self._entradas) > self.tamano_maximo:
+                self._entradas.popitem(last=False)
+                self.desalojos += 1
+
+    def _verificar_version(self, version):
+        """
+        Vacía la caché cuando llega una versión de datos más reciente (requiere el lock).
+
+        Returns:
+            bool: False si `version` es anterior a la versión vigente
+        """
+        if self._version is not None and version < self._version:
+            return False
+
+        if version != self._version:
+            if self._entradas:
+                self._entradas.clear()
+                self.invalidaciones += 1
+            self._version = version
+
+        return True
+
+    def limpiar(self):
+        """Elimina todas las entradas."""
+        with self._lock:
+            self._entradas.clear()
+            self.invalidaciones += 1
+
+    def estadisticas(self):
+        """Contadores de uso de la caché."""
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'tamano_maximo': self.tamano_maximo,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos,
+                'expiraciones': self.expiraciones,
+                'invalidaciones': self.invalidaciones,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0
+            }
@@ -0,0 +1,202 @@
+"""
+Consulta del catálogo de cultivos (GET /api/cultivos).
+
+El filtro por tipo, la proyección de campos, el orden y la paginación se resuelven
+en una sola consulta SQL: solo se leen las columnas pedidas, las uniones con
+condiciones y costos se omiten si no se piden, el filtro por tipo usa el índice
+idx_cultivos_tipo y las páginas se recorren con un cursor (paginación por clave),
+sin OFFSET.
+"""
+
+import base64
+import json
+import sqlite3
+
+# Campos de primer nivel de cada cultivo y columnas de las secciones anidadas
+CAMPOS_CULTIVO = ('id_cultivo', 'nombre', 'descripcion', 'tipo', 'ciclo_dias', 'densidad_siembra', 'imagen')
+COLUMNAS_CONDICIONES = ('temp_min', 'temp_max', 'precipitacion_min', 'precipitacion_max',
+                        'tipo_suelo', 'ph_min', 'ph_max', 'altitud_min', 'altitud_max')
+COLUMNAS_COSTOS = ('inversion_min', 'inversion_max', 'costo_operativo', 'precio_interno', 'precio_export',
+                   'rentabilidad')
+CAMPOS_CATALOGO = CAMPOS_CULTIVO + ('condiciones', 'costos')
+
+# Columnas por las que se puede ordenar ('-' al inicio para orden descendente)
+ORDENES_CATALOGO = ('id_cultivo', 'nombre', 'tipo', 'ciclo_dias')
+
+MAX_LIMITE_CATALOGO = 500
+
+
+class ConsultaCatalogo:
+    """
+    Parámetros validados de una consulta del catálogo.
+    """
+
+    def __init__(self, tipos=None, campos=None, orden='id_cultivo', limite=None, cursor=None):
+        """
+        Args:
+            tipos (list, opcional): Tipos de cultivo a incluir (coincidencia exacta)
+            campos (list, opcional): Campos de cada cultivo; id_cultivo siempre se incluye
+            orden (str): Columna de ORDENES_CATALOGO, con '-' para orden descendente
+            limite (int, opcional): Cultivos por página
+            cursor (str, opcional): Cursor retornado con la página anterior
+
+        Raises:
+            ValueError: Si algún parámetro no es válido
+        """
+        self.tipos = tuple(sorted(set(tipos))) if tipos else None
+
+        if campos:
+            desconocidos = [campo for campo in campos if campo not in CAMPOS_CATALOGO]
+            if desconocidos:
+                raise ValueError(f"Campos desconocidos: {', '.join(desconocidos)}. "
+                                 f"Campos válidos: {', '.join(CAMPOS_CATALOGO)}")
+            self.campos = tuple(campo for campo in CAMPOS_CATALOGO if campo == 'id_cultivo' or campo in campos)
+        else:
+            self.campos = CAMPOS_CATALOGO
+
+        self.descendente = orden.startswith('-')
+        self.orden = orden.lstrip('-')
+        if self.orden not in ORDENES_CATALOGO:
+            raise ValueError(f"El orden debe ser uno de: {', '.join(ORDENES_CATALOGO)} (con '-' para descendente)")
+
+        if limite is not None and not 1 <= limite <= MAX_LIMITE_CATALOGO:
+            raise ValueError(f"El límite debe estar entre 1 y {MAX_LIMITE_CATALOGO}")
+        self.limite = limite
+
+        self.cursor = cursor
+        self.posicion = self._decodificar_cursor(cursor) if cursor else None
+
+    @classmethod
+    def desde_argumentos(cls, argumentos):
+        """
+        Crea la consulta a partir de los argumentos de la URL.
+
+        Acepta tipo y fields repetidos o separados por comas, sort y limit/cursor.
+        """
+        def lista(clave):
+            valores = [valor.strip() for texto in argumentos.getlist(clave) for valor in texto.split(',')]
+            return [valor for valor in valores if valor] or None
+
+        limite = argumentos.get('limit')
+        try:
+            limite = int(limite) if limite not in (None, '') else None
+        except ValueError:
+            raise ValueError("El límite debe ser un número entero")
+
+        return cls(lista('tipo'), lista('fields'), argumentos.get('sort') or 'id_cultivo', limite,
+                   argumentos.get('cursor') or None)
+
+    @property
+    def clave(self):
+        """Clave de la consulta para la caché de respuestas."""
+        return ('catalogo', self.tipos, self.campos, self.orden, self.descendente, self.limite, self.cursor)
+
+    def _codificar_cursor(self, fila):
+        contenido = json.dumps([self.orden, self.descendente, fila['_orden'], fila['_id']], separators=(',', ':'))
+        return base64.urlsafe_b64encode(contenido.encode()).decode().rstrip('=')
+
+    def _decodificar_cursor(self, cursor):
+        try:
+            orden, descendente, valor, id_cultivo = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except (ValueError, TypeError):
+            raise ValueError("Cursor no válido")
+        # La posición se pasa a SQLite: solo se aceptan escalares
+        if not isinstance(valor, (str, int, float, type(None))) or isinstance(id_cultivo, bool) \
+                or not isinstance(id_cultivo, int):
+            raise ValueError("Cursor no válido")
+        if orden != self.orden or descendente != self.descendente:
+            raise ValueError("El cursor corresponde a otro orden")
+        return valor, id_cultivo
+
+    def sql(self):
+        """
+        Consulta SQL y sus parámetros.
+
+        Returns:
+            tuple: (texto de la consulta, lista de parámetros)
+        """
+        columnas = [f"c.{campo} AS {campo}" for campo in self.campos if campo in CAMPOS_CULTIVO]
+        columnas += [f"c.{self.orden} AS _orden", "c.id_cultivo AS _id"]
+        uniones = []
+        if 'condiciones' in self.campos:
+            columnas += ["cd.id_condicion AS _id_condicion"] + [f"cd.{col} AS cd_{col}" for col in COLUMNAS_CONDICIONES]
+            # Primera fila de condiciones de cada cultivo
+            uniones.append("LEFT JOIN condiciones cd "
+                           "ON cd.rowid = (SELECT MIN(rowid) FROM condiciones WHERE id_cultivo = c.id_cultivo)")
+        if 'costos' in self.campos:
+            columnas += ["co.id_costo AS _id_costo"] + [f"co.{col} AS co_{col}" for col in COLUMNAS_COSTOS]
+            uniones.append("LEFT JOIN costos co "
+                           "ON co.rowid = (SELECT MIN(rowid) FROM costos WHERE id_cultivo = c.id_cultivo)")
+
+        condiciones = []
+        parametros = []
+        if self.tipos:
+            condiciones.append(f"c.tipo IN ({', '.join('?' * len(self.tipos))})")
+            parametros += self.tipos
+
+        # Los valores nulos van al final en ambos sentidos; los empates se ordenan por id
+        comparacion = '<' if self.descendente else '>'
+        sentido = ' DESC' if self.descendente else ''
+        orden = f"c.{self.orden}"
+        if self.posicion is not None:
+            valor, id_cultivo = self.posicion
+            if self.orden == 'id_cultivo':
+                condiciones.append(f"c.id_cultivo {comparacion} ?")
+                parametros.append(id_cultivo)
+            elif valor is None:
+                condiciones.append(f"{orden} IS NULL AND c.id_cultivo {comparacion} ?")
+                parametros.append(id_cultivo)
+            else:
+                condiciones.append(f"({orden} IS NULL OR ({orden}, c.id_cultivo) {comparacion} (?, ?))")
+                parametros += [valor, id_cultivo]
+
+        if self.orden == 'id_cultivo':
+            orden_sql = f"c.id_cultivo{sentido}"
+        else:
+            orden_sql = f"{orden} IS NULL, {orden}{sentido}, c.id_cultivo{sentido}"
+
+        consulta = f"SELECT {', '.join(columnas)} FROM cultivos c {' '.join(uniones)}"
+        if condiciones:
+            consulta += f" WHERE {' AND '.join(condiciones)}"
+        consulta += f" ORDER BY {orden_sql}"
+        if self.limite is not None:
+            # Una fila extra indica si hay otra página
+            consulta += " LIMIT ?"
+            parametros.append(self.limite + 1)
+
+        return consulta, parametros
+
+    def leer(self, conn):
+        """
+        Ejecuta la consulta.
+
+        Args:
+            conn (sqlite3.Connection): Conexión a la base de datos
+
+        Returns:
+            tuple: (lista de cultivos, cursor de la página siguiente o None)
+        """
+        consulta, parametros = self.sql()
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        filas = cursor.execute(consulta, parametros).fetchall()
+
+        siguiente = None
+        if self.limite is not None and len(filas) > self.limite:
+            filas = filas[:self.limite]
+            siguiente = self._codificar_cursor(filas[-1])
+
+        cultivos = []
+        for fila in filas:
+            cultivo = {campo: fila[campo] for campo in self.campos if campo in CAMPOS_CULTIVO}
+            if 'condiciones' in self.campos:
+                cultivo['condiciones'] = (
+                    {col: fila[f"cd_{col}"] for col in COLUMNAS_CONDICIONES} if fila['_id_condicion'] is not None else {}
+                )
+            if 'costos' in self.campos:
+                cultivo['costos'] = (
+                    {col: fila[f"co_{col}"] for col in COLUMNAS_COSTOS} if fila['_id_costo'] is not None else None
+                )
+            cultivos.append(cultivo)
+
+        return cultivos, siguiente
@@ -0,0 +1,115 @@
+"""
+Índice de intervalos para consultas de punto ("¿qué filas contienen este valor?")
+sobre rangos [mínimo, máximo], como los de temperatura, precipitación y altitud
+de la tabla `condiciones`.
+
+Los extremos se guardan ordenados por dimensión. Una consulta ubica con búsqueda
+binaria las filas cuyo mínimo es <= valor y las filas cuyo máximo es >= valor;
+cada uno de esos conjuntos es un prefijo o un sufijo del orden correspondiente y
+se materializa como bitset (palabras de 64 bits) a partir de bitsets precalculados
+cada `tamano_bloque` posiciones. La intersección de ambos bitsets es el resultado.
+"""
+
+import numpy as np
+
+
+class IndiceIntervalos:
+    """
+    Índice de consultas de punto sobre una colección de intervalos [mínimo, máximo].
+    """
+
+    def __init__(self, minimos, maximos, tamano_bloque=None):
+        """
+        Construye el índice.
+
+        Args:
+            minimos (array): Extremo inferior de cada fila
+            maximos (array): Extremo superior de cada fila
+            tamano_bloque (int, opcional): Distancia entre bitsets precalculados; por
+                defecto crece con la raíz cuadrada del número de filas para acotar
+                la memoria del índice
+        """
+        minimos = np.asarray(minimos, dtype=np.float64)
+        maximos = np.asarray(maximos, dtype=np.float64)
+
+        self.num_filas = len(minimos)
+        self.num_palabras = (self.num_filas + 63) // 64
+
+        if tamano_bloque is None:
+            tamano_bloque = max(64, int(4 * np.sqrt(self.num_filas)))
+        self.tamano_bloque = tamano_bloque
+
+        # Las filas con extremos nulos nunca contienen un valor
+        validas = np.flatnonzero(~(np.isnan(minimos) | np.isnan(maximos)))
+
+        # Filas ordenadas por mínimo ascendente: las que cumplen mínimo <= v son un prefijo
+        self._orden_min = validas[np.argsort(minimos[validas], kind='stable')]
+        self._min_ordenados = minimos[self._orden_min]
+        self._prefijos = self._bitsets_acumulados(self._orden_min)
+        self._posiciones_min = self._posiciones(self._orden_min)
+
+        # Filas ordenadas por máximo descendente: las que cumplen máximo >= v son un prefijo
+        self._orden_max = validas[np.argsort(-maximos[validas], kind='stable')]
+        self._max_ordenados_neg = -maximos[self._orden_max]
+        self._sufijos = self._bitsets_acumulados(self._orden_max)
+        self._posiciones_max = self._posiciones(self._orden_max)
+
+    @staticmethod
+    def _posiciones(orden):
+        """
+        Palabra y bit de cada fila de `orden`, con el bit partido en sus mitades
+        baja y alta de 32 bits para acumularlo de forma exacta con bincount.
+        """
+        palabras = orden >> 6
+        bits = np.left_shift(np.uint64(1), (orden & 63).astype(np.uint64))
+        bajos = (bits & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        altos = (bits >> np.uint64(32)).astype(np.float64)
+        return palabras, bajos, altos
+
+    def _bitsets_acumulados(self, orden):
+        """Bitsets de los primeros 0, B, 2B, ... elementos de `orden`."""
+        num_bloques = len(orden) // self.tamano_bloque + 1
+        acumulados = np.zeros((num_bloques, self.num_palabras), dtype=np.uint64)
+
+        for j in range(1, num_bloques):
+            acumulados[j] = acumulados[j - 1]
+            self._activar(acumulados[j], orden[(j - 1) * self.tamano_bloque:j * self.tamano_bloque])
+
+        return acumulados
+
+    @staticmethod
+    def _activar(bits, filas):
+        """Activa en `bits` las posiciones indicadas."""
+        np.bitwise_or.at(bits, filas >> 6, np.left_shift(np.uint64(1), (filas & 63).astype(np.uint64)))
+
+    def _prefijo(self, acumulados, orden, posiciones, k):
+        """Bitset de los primeros k elementos de `orden`."""
+        j = k // self.tamano_bloque
+        inicio = j * self.tamano_bloque
+        if inicio == k:
+            return acumulados[j].copy()
+
+        # Los bits de filas distintas no se solapan, así que sumarlos equivale a
+        # un OR; bincount lo hace de forma vectorizada y sin pérdida por mitades
+        palabras, bajos, altos = (p[inicio:k] for p in posiciones)
+        suma_bajos = np.bincount(palabras, weights=bajos, minlength=self.num_palabras).astype(np.uint64)
+        suma_altos = np.bincount(palabras, weights=altos, minlength=self.num_palabras).astype(np.uint64)
+        return acumulados[j] | (suma_altos << np.uint64(32)) | suma_bajos
+
+    def consultar(self, valor, margen=0):
+        """
+        Filas cuyo intervalo, ampliado por `margen` a cada lado, contiene el valor.
+
+        Returns:
+            numpy.ndarray: Bitset (uint64) con una posición por fila
+        """
+        k_min = np.searchsorted(self._min_ordenados, valor + margen, side='right')
+        k_max = np.searchsorted(self._max_ordenados_neg, -(valor - margen), side='right')
+
+        bits = self._prefijo(self._prefijos, self._orden_min, self._posiciones_min, k_min)
+        bits &= self._prefijo(self._sufijos, self._orden_max, self._posiciones_max, k_max)
+        return bits
+
+    def a_mascara(self, bits):
+        """Convierte un bitset en una máscara booleana de longitud `num_filas`."""
+        return np.unpackbits(bits.view(np.uint8), bitorder='little', count=self.num_filas).astype(bool)
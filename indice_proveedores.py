@@ -0,0 +1,114 @@
+"""
+Índice en memoria de proveedores de insumos.
+
+Guarda las ofertas de la relación proveedor-insumo en el orden de la consulta de
+origen, junto con las ofertas de cada insumo ordenadas por precio y la información
+fija de cada proveedor, ya formateadas. Armar la lista de proveedores de un
+cultivo solo requiere búsquedas en diccionarios, sin consultas SQL.
+"""
+
+import pandas as pd
+
+
+class IndiceProveedores:
+    """
+    Índice insumo -> ofertas (ordenadas por precio) y proveedor -> información fija.
+    """
+
+    def __init__(self, ofertas_df, insumos_cultivo_df):
+        """
+        Construye el índice.
+
+        Args:
+            ofertas_df (DataFrame): Unión de proveedores, proveedor_insumo e insumos
+                (una fila por oferta de un proveedor para un insumo)
+            insumos_cultivo_df (DataFrame): Insumos requeridos por cada cultivo
+        """
+        # Insumos de cada cultivo, sin repetir y en orden de aparición
+        self._insumos_por_cultivo = {}
+        for id_cultivo, id_insumo in zip(insumos_cultivo_df['id_cultivo'], insumos_cultivo_df['id_insumo']):
+            insumos = self._insumos_por_cultivo.setdefault(id_cultivo, {})
+            insumos.setdefault(id_insumo, None)
+
+        self._proveedores = {}
+        self._ofertas = []
+        ofertas_por_insumo = {}
+
+        for posicion, fila in enumerate(ofertas_df.to_dict('records')):
+            id_proveedor = fila['id_proveedor']
+            if id_proveedor not in self._proveedores:
+                self._proveedores[id_proveedor] = {
+                    'id_proveedor': id_proveedor,
+                    'nombre': fila['nombre'],
+                    'tipo': fila['tipo'],
+                    'contacto': fila['contacto'],
+                    'ubicacion': fila['ubicacion'],
+                    'sitio_web': fila['sitio_web'],
+                    'telefono': fila['telefono']
+                }
+
+            oferta = {
+                'id_insumo': fila['id_insumo'],
+                'nombre': fila['nombre_insumo'],
+                'categoria': fila['categoria_insumo'],
+                'precio': f"{fila['precio']:,.0f} COP/{fila['unidad_medida']}",
+                'disponibilidad': fila['disponibilidad']
+            }
+            disponibilidad = fila['disponibilidad'].lower() if isinstance(fila['disponibilidad'], str) else None
+            self._ofertas.append((id_proveedor, disponibilidad, oferta))
+
+            precio = fila['precio'] if pd.notna(fila['precio']) else float('inf')
+            ofertas_por_insumo.setdefault(fila['id_insumo'], []).append((precio, posicion))
+
+        # Posiciones de las ofertas de cada insumo, de la más barata a la más cara
+        self._ofertas_por_insumo = {
+            id_insumo: [posicion for _, posicion in sorted(ofertas)]
+            for id_insumo, ofertas in ofertas_por_insumo.items()
+        }
+
+    def tiene_insumos(self, id_cultivo):
+        """Indica si el cultivo tiene insumos registrados."""
+        return id_cultivo in self._insumos_por_cultivo
+
+    def proveedores_de_cultivo(self, id_cultivo, max_ofertas_por_insumo=None, disponibilidad=None):
+        """
+        Proveedores que ofrecen los insumos de un cultivo, con sus ofertas.
+
+        Args:
+            id_cultivo (int): ID del cultivo
+            max_ofertas_por_insumo (int, opcional): Conservar solo las N ofertas más
+                baratas de cada insumo
+            disponibilidad (str o list, opcional): Conservar solo las ofertas con alguna
+                de estas disponibilidades (sin distinguir mayúsculas)
+
+        Returns:
+            list: Proveedores con la lista de sus ofertas ('insumos'); los datos de cada
+                oferta se comparten entre respuestas y no deben modificarse
+
+        Raises:
+            ValueError: Si max_ofertas_por_insumo es menor que 1
+        """
+        if max_ofertas_por_insumo is not None and max_ofertas_por_insumo < 1:
+            raise ValueError("max_ofertas_por_insumo debe ser un entero mayor o igual que 1")
+        if isinstance(disponibilidad, str):
+            disponibilidad = [disponibilidad]
+        disponibles = {valor.lower() for valor in disponibilidad} if disponibilidad else None
+
+        posiciones = []
+        for id_insumo in self._insumos_por_cultivo.get(id_cultivo, ()):
+            ofertas = self._ofertas_por_insumo.get(id_insumo, ())
+            if disponibles is not None:
+                ofertas = [posicion for posicion in ofertas if self._ofertas[posicion][1] in disponibles]
+            if max_ofertas_por_insumo is not None:
+                ofertas = ofertas[:max_ofertas_por_insumo]
+            posiciones.extend(ofertas)
+
+        # Agrupar por proveedor respetando el orden de las ofertas en la consulta de origen
+        proveedores = {}
+        for posicion in sorted(posiciones):
+            id_proveedor, _, oferta = self._ofertas[posicion]
+            if id_proveedor not in proveedores:
+                proveedores[id_proveedor] = {**self._proveedores[id_proveedor], 'insumos': []}
+            proveedores[id_proveedor]['insumos'].append(oferta)
+
+        return list(proveedores.values())
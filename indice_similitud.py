@@ -0,0 +1,245 @@
+"""
+Índice de similitud entre cultivos.
+
+Cada cultivo se describe con un vector de sus condiciones (rangos de temperatura,
+precipitación, altitud y pH), su economía (ciclo, inversión y rentabilidad),
+estandarizados con StandardScaler, y de las plagas que lo afectan (una columna
+por plaga). El índice guarda solo los K vecinos más parecidos de cada cultivo
+según la similitud coseno.
+
+Cuando cambian pocos cultivos, `actualizado` recalcula solo sus filas y las de los
+cultivos que los tenían como vecinos (O(cambios x M)) en lugar de la matriz
+completa M x M. La actualización solo se hace si el promedio y la desviación de
+las columnas numéricas no cambian (p. ej. si solo cambiaron las plagas); si no,
+todos los vectores estandarizados cambian y el índice se reconstruye, de modo que
+el resultado es siempre el de una construcción completa con los mismos datos.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Columnas numéricas de cada cultivo (promedio de sus filas de condiciones)
+COLUMNAS_SIMILITUD = (
+    'temp_min', 'temp_max', 'precipitacion_min', 'precipitacion_max', 'altitud_min', 'altitud_max',
+    'ph_min', 'ph_max', 'ciclo_dias', 'inversion_min', 'inversion_max', 'rentabilidad'
+)
+
+# Peso de cada plaga compartida frente a una desviación estándar de las columnas numéricas
+PESO_PLAGAS = 1.0
+
+K_VECINOS = 10
+
+# Elementos de la matriz de similitud que se calculan por bloque de filas
+ELEMENTOS_POR_BLOQUE = 1_000_000
+
+# Fracción máxima de cultivos modificados para actualizar el índice en lugar de reconstruirlo
+MAX_FRACCION_INCREMENTAL = 0.1
+
+
+def _escalador():
+    # scikit-learn solo se importa con el primer índice
+    from sklearn.preprocessing import StandardScaler
+    return StandardScaler()
+
+
+def _misma_escala(a, b):
+    """Indica si dos StandardScaler ajustados estandarizan igual."""
+    return (np.array_equal(a.mean_, b.mean_, equal_nan=True)
+            and np.array_equal(a.scale_, b.scale_, equal_nan=True))
+
+
+def _similitud_coseno(a, b):
+    # scikit-learn solo se necesita aquí y al estandarizar; se importa con el primer índice
+    from sklearn.metrics.pairwise import cosine_similarity
+    return cosine_similarity(a, b)
+
+
+def vectores_cultivos(filas_df, plagas_df):
+    """
+    Vectores sin estandarizar de cada cultivo.
+
+    Args:
+        filas_df (DataFrame): Cultivos unidos con sus condiciones y costos
+        plagas_df (DataFrame): Relación de plagas con cultivos (id_plaga, id_cultivo)
+
+    Returns:
+        tuple: (ids de cultivo, nombres, matriz numérica, matriz de plagas, ids de plaga)
+    """
+    numericas = filas_df[['id_cultivo', *COLUMNAS_SIMILITUD]].apply(pd.to_numeric, errors='coerce')
+    por_cultivo = numericas.groupby('id_cultivo', sort=False).mean()
+    ids = por_cultivo.index.to_numpy(dtype=np.int64)
+    nombres = filas_df.drop_duplicates('id_cultivo').set_index('id_cultivo')['nombre'].reindex(ids).to_numpy(dtype=object)
+
+    ids_plaga = np.unique(plagas_df['id_plaga'].to_numpy(dtype=np.int64))
+    plagas = np.zeros((len(ids), len(ids_plaga)))
+    filas = pd.Index(ids).get_indexer(plagas_df['id_cultivo'])
+    columnas = np.searchsorted(ids_plaga, plagas_df['id_plaga'].to_numpy(dtype=np.int64))
+    presentes = filas >= 0
+    plagas[filas[presentes], columnas[presentes]] = 1.0
+
+    return ids, nombres, por_cultivo.to_numpy(dtype=np.float64), plagas, ids_plaga
+
+
+class IndiceSimilitud:
+    """
+    Tabla de los K cultivos más parecidos a cada cultivo (inmutable una vez construida).
+    """
+
+    def __init__(self, filas_df, plagas_df, k=K_VECINOS):
+        """
+        Construye el índice completo.
+
+        Args:
+            filas_df (DataFrame): Cultivos unidos con sus condiciones y costos
+            plagas_df (DataFrame): Relación de plagas con cultivos
+            k (int): Vecinos que se guardan por cultivo
+        """
+        self.k = k
+
+        self.ids, self.nombres, self._numericas, self._plagas, self._ids_plaga = vectores_cultivos(filas_df, plagas_df)
+
+        # Las columnas sin valores se ignoran; los faltantes valen el promedio (0 al estandarizar)
+        self._escala = _escalador().fit(self._numericas) if len(self.ids) else None
+        self._vectores = self._estandarizar(self._numericas, self._plagas)
+        self._posiciones = {id_cultivo: fila for fila, id_cultivo in enumerate(self.ids.tolist())}
+
+        self.vecinos, self.similitudes = self._vecinos_de(np.arange(len(self.ids)))
+        self.actualizaciones = 0
+
+    def _estandarizar(self, numericas, plagas):
+        if self._escala is None:
+            return np.zeros((len(numericas), numericas.shape[1] + plagas.shape[1]))
+        with np.errstate(invalid='ignore'):
+            estandarizadas = np.nan_to_num(self._escala.transform(numericas), nan=0.0)
+        return np.hstack([estandarizadas, PESO_PLAGAS * plagas])
+
+    def _vecinos_de(self, filas):
+        """Calcula los K vecinos de las filas indicadas contra todos los cultivos."""
+        k = self.vecinos_esperados()
+        vecinos = np.zeros((len(filas), k), dtype=np.intp)
+        similitudes = np.zeros((len(filas), k))
+        if len(filas) == 0 or k == 0:
+            return vecinos, similitudes
+
+        # Por bloques de filas para no materializar la matriz M x M completa
+        tamano_bloque = max(1, ELEMENTOS_POR_BLOQUE // len(self.ids))
+        for inicio in range(0, len(filas), tamano_bloque):
+            bloque = filas[inicio:inicio + tamano_bloque]
+            similitud = _similitud_coseno(self._vectores[bloque], self._vectores)
+            # Un cultivo no es vecino de sí mismo
+            similitud[np.arange(len(bloque)), bloque] = -np.inf
+            # Preseleccionar los k mayores antes de ordenar
+            candidatos = np.argpartition(-similitud, k - 1, axis=1)[:, :k] if k < similitud.shape[1] else \
+                np.broadcast_to(np.arange(similitud.shape[1]), similitud.shape)
+            vecinos[inicio:inicio + len(bloque)], similitudes[inicio:inicio + len(bloque)] = self._mejores(
+                np.take_along_axis(similitud, candidatos, axis=1), candidatos, k
+            )
+        return vecinos, similitudes
+
+    @staticmethod
+    def _mejores(similitud, candidatos, k):
+        """Los k candidatos más parecidos de cada fila (empates: el de menor posición primero)."""
+        orden = np.lexsort((candidatos, -similitud), axis=-1)[:, :k]
+        return np.take_along_axis(candidatos, orden, axis=1), np.take_along_axis(similitud, orden, axis=1)
+
+    def actualizado(self, filas_df, plagas_df):
+        """
+        Índice para los datos nuevos, actualizando solo los cultivos que cambiaron.
+
+        Returns:
+            IndiceSimilitud: Índice nuevo (este no se modifica), igual al que se
+                construiría desde cero con los mismos datos; se reconstruye por completo
+                si cambió la escala de las columnas numéricas, el conjunto de plagas o
+                más de MAX_FRACCION_INCREMENTAL de los cultivos
+        """
+        ids, nombres, numericas, plagas, ids_plaga = vectores_cultivos(filas_df, plagas_df)
+        if self._escala is None or len(ids) == 0 or not np.array_equal(ids_plaga, self._ids_plaga):
+            return IndiceSimilitud(filas_df, plagas_df, self.k)
+
+        # Con otro promedio o desviación cambian los vectores de todos los cultivos
+        if not _misma_escala(_escalador().fit(numericas), self._escala):
+            return IndiceSimilitud(filas_df, plagas_df, self.k)
+
+        anteriores = np.array([self._posiciones.get(id_cultivo, -1) for id_cultivo in ids.tolist()], dtype=np.intp)
+        existentes = anteriores >= 0
+        previas = self._numericas[anteriores[existentes]]
+        iguales = np.zeros(len(ids), dtype=bool)
+        iguales[existentes] = (
+            np.all((numericas[existentes] == previas) | (np.isnan(numericas[existentes]) & np.isnan(previas)), axis=1)
+            & np.all(plagas[existentes] == self._plagas[anteriores[existentes]], axis=1)
+        )
+        cambiados = np.flatnonzero(~iguales)
+        eliminados = len(self.ids) - int(existentes.sum())
+
+        if len(cambiados) + eliminados > MAX_FRACCION_INCREMENTAL * len(ids):
+            return IndiceSimilitud(filas_df, plagas_df, self.k)
+
+        nuevo = object.__new__(IndiceSimilitud)
+        nuevo.k = self.k
+        nuevo.ids, nuevo.nombres, nuevo._numericas, nuevo._plagas, nuevo._ids_plaga = (
+            ids, nombres, numericas, plagas, ids_plaga
+        )
+        nuevo._escala = self._escala
+        nuevo._posiciones = {id_cultivo: fila for fila, id_cultivo in enumerate(ids.tolist())}
+        nuevo.actualizaciones = self.actualizaciones + 1
+
+        nuevo._vectores = np.empty((len(ids), self._vectores.shape[1]))
+        nuevo._vectores[iguales] = self._vectores[anteriores[iguales]]
+        if len(cambiados):
+            nuevo._vectores[cambiados] = nuevo._estandarizar(numericas[cambiados], plagas[cambiados])
+
+        # Vecinos anteriores, con la posición de cada uno en el índice nuevo (-1 si ya no está)
+        posicion_nueva = np.full(len(self.ids) + 1, -1, dtype=np.intp)
+        posicion_nueva[anteriores[existentes]] = np.flatnonzero(existentes)
+        vecinos = np.zeros((len(ids), self.vecinos.shape[1]), dtype=np.intp)
+        similitudes = np.zeros((len(ids), self.vecinos.shape[1]))
+        vecinos[existentes] = posicion_nueva[self.vecinos[anteriores[existentes]]]
+        similitudes[existentes] = self.similitudes[anteriores[existentes]]
+
+        # Filas que se recalculan por completo: los cultivos modificados y los que
+        # tenían como vecino a un cultivo modificado o eliminado
+        modificados = np.zeros(len(ids) + 1, dtype=bool)
+        modificados[cambiados] = True
+        modificados[-1] = True
+        recalcular = ~iguales | np.any(modificados[vecinos], axis=1)
+        if nuevo.vecinos_esperados() != vecinos.shape[1]:
+            recalcular[:] = True
+        filas = np.flatnonzero(recalcular)
+
+        nuevo.vecinos = np.zeros((len(ids), nuevo.vecinos_esperados()), dtype=np.intp)
+        nuevo.similitudes = np.zeros((len(ids), nuevo.vecinos_esperados()))
+        nuevo.vecinos[filas], nuevo.similitudes[filas] = nuevo._vecinos_de(filas)
+
+        # El resto conserva sus vecinos, salvo que un cultivo modificado sea ahora más parecido
+        resto = np.flatnonzero(~recalcular)
+        if len(resto):
+            similitud = _similitud_coseno(nuevo._vectores[resto], nuevo._vectores[cambiados]) if len(cambiados) else \
+                np.zeros((len(resto), 0))
+            candidatos = np.hstack([vecinos[resto], np.broadcast_to(cambiados, (len(resto), len(cambiados)))])
+            nuevo.vecinos[resto], nuevo.similitudes[resto] = self._mejores(
+                np.hstack([similitudes[resto], similitud]), candidatos, nuevo.vecinos_esperados()
+            )
+
+        return nuevo
+
+    def vecinos_esperados(self):
+        """Número de vecinos de cada cultivo (K, o M - 1 si hay menos cultivos)."""
+        return min(self.k, max(len(self.ids) - 1, 0))
+
+    def similares(self, id_cultivo, k=None):
+        """
+        Cultivos más parecidos a uno dado.
+
+        Args:
+            id_cultivo (int): ID del cultivo
+            k (int, opcional): Número de cultivos (como máximo el K del índice)
+
+        Returns:
+            list: Pares (posición en el índice, similitud) en orden de similitud, o
+                None si el cultivo no está en el índice
+        """
+        fila = self._posiciones.get(id_cultivo)
+        if fila is None:
+            return None
+        k = self.vecinos.shape[1] if k is None else min(k, self.vecinos.shape[1])
+        return list(zip(self.vecinos[fila, :k].tolist(), self.similitudes[fila, :k].tolist()))
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Instantánea binaria por columnas de las tablas que usa el modelo.
+
+`exportar_instantanea` lee en una sola transacción las tablas principales y las
+consultas complementarias de ModeloRecomendacionCultivos, con sus sumas de
+verificación, y las escribe en un único archivo:
+
+    CULTSNAP | formato (uint32) | reservado (uint32) | largo del encabezado (uint64)
+    encabezado JSON (tablas, columnas, tipos, desplazamientos y firmas)
+    bloques de datos alineados a 64 bytes
+
+Las columnas numéricas se guardan como arreglos NumPy; las de texto como una
+tabla de desplazamientos (int64, n + 1), una máscara de valores presentes (uint8)
+y los bytes UTF-8 concatenados. `InstantaneaDatos` abre el archivo con memoria
+mapeada: las columnas numéricas son vistas de solo lectura sobre el archivo (sin
+copias), de modo que todos los procesos que lo abren comparten sus páginas a
+través de la caché del sistema operativo.
+
+Uso:
+    python instantanea_datos.py exportar [--db cultivos.db] [--salida cultivos.snap]
+    python instantanea_datos.py reporte [--db cultivos.db] [--instantanea cultivos.snap] [--trabajadores 4]
+"""
+
+import argparse
+import json
+import os
+import struct
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+MAGICO = b'CULTSNAP'
+FORMATO_INSTANTANEA = 1
+ENCABEZADO = struct.Struct('<8sIIQ')
+ALINEACION = 64
+
+
+def _leer_tablas(conn):
+    """
+    Lee las tablas principales y complementarias en una transacción de lectura.
+
+    Returns:
+        tuple: (tablas principales, firmas principales, consultas complementarias,
+            firmas de sus tablas de origen)
+    """
+    from modelo_recomendacion import (
+        ModeloRecomendacionCultivos, TABLAS_PRINCIPALES, CONSULTAS_COMPLEMENTARIAS, TABLAS_COMPLEMENTARIAS
+    )
+
+    conn.execute("BEGIN")
+    tablas = {tabla: pd.read_sql(f"SELECT * FROM {tabla}", conn) for tabla in TABLAS_PRINCIPALES}
+    firmas = {tabla: ModeloRecomendacionCultivos._firma_df(df) for tabla, df in tablas.items()}
+
+    firmas_complementarias = {}
+    complementarios = {}
+    for nombre, consulta in CONSULTAS_COMPLEMENTARIAS.items():
+        for tabla in TABLAS_COMPLEMENTARIAS[nombre]:
+            if tabla not in firmas_complementarias:
+                firmas_complementarias[tabla] = ModeloRecomendacionCultivos._firma_tabla(conn, tabla)
+        complementarios[nombre] = pd.read_sql(consulta, conn)
+
+    return tablas, firmas, complementarios, firmas_complementarias
+
+
+def _bloques_columna(serie):
+    """
+    Codifica una columna.
+
+    Returns:
+        tuple: (descripción de la columna, lista de (clave, bytes) de sus bloques)
+    """
+    if pd.api.types.is_numeric_dtype(serie.dtype) or pd.api.types.is_bool_dtype(serie.dtype):
+        valores = np.ascontiguousarray(serie.to_numpy())
+        return {'tipo': 'numerico', 'dtype': valores.dtype.str}, [('valores', valores.tobytes())]
+
+    presentes = serie.notna().to_numpy()
+    codificados = [str(valor).encode('utf-8') if presente else b''
+                   for valor, presente in zip(serie.tolist(), presentes)]
+    desplazamientos = np.zeros(len(codificados) + 1, dtype='<i8')
+    np.cumsum([len(valor) for valor in codificados], out=desplazamientos[1:])
+
+    return {'tipo': 'texto'}, [
+        ('desplazamientos', desplazamientos.tobytes()),
+        ('presentes', presentes.astype(np.uint8).tobytes()),
+        ('bytes', b''.join(codificados))
+    ]
+
+
+def exportar_instantanea(db_path, ruta):
+    """
+    Exporta a `ruta` las tablas que usa el modelo.
+
+    El archivo se escribe junto al destino y se renombra al final, de modo que los
+    procesos que tienen abierta una instantánea anterior la siguen leyendo intacta.
+
+    Args:
+        db_path (str): Ruta al archivo de base de datos SQLite
+        ruta (str): Archivo de salida
+
+    Returns:
+        dict: Encabezado de la instantánea
+    """
+    from pool_conexiones import PoolConexiones
+
+    pool = PoolConexiones(db_path, tamano=1)
+    try:
+        with pool.conexion() as conn:
+            tablas, firmas, complementarios, firmas_complementarias = _leer_tablas(conn)
+    finally:
+        pool.cerrar()
+
+    encabezado = {
+        'formato': FORMATO_INSTANTANEA,
+        'creada': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'origen': os.path.basename(db_path),
+        'firmas': firmas,
+        'firmas_complementarias': firmas_complementarias,
+        'complementarias': list(complementarios),
+        'tablas': {}
+    }
+
+    # Primero se describen las columnas con desplazamientos relativos a la zona de datos
+    bloques = []
+    posicion = 0
+    for nombre, df in {**tablas, **complementarios}.items():
+        columnas = []
+        for columna in df.columns:
+            descripcion, datos_columna = _bloques_columna(df[columna])
+            descripcion['nombre'] = columna
+            for clave, contenido in datos_columna:
+                descripcion[clave] = [posicion, len(contenido)]
+                bloques.append((posicion, contenido))
+                posicion += -(-len(contenido) // ALINEACION) * ALINEACION
+            columnas.append(descripcion)
+        encabezado['tablas'][nombre] = {'filas': len(df), 'columnas': columnas}
+
+    texto = json.dumps(encabezado, ensure_ascii=False).encode('utf-8')
+    inicio_datos = -(-(ENCABEZADO.size + len(texto)) // ALINEACION) * ALINEACION
+
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'wb') as f:
+        f.write(ENCABEZADO.pack(MAGICO, FORMATO_INSTANTANEA, 0, len(texto)))
+        f.write(texto)
+        for desplazamiento, contenido in bloques:
+            f.seek(inicio_datos + desplazamiento)
+            f.write(contenido)
+        f.truncate(inicio_datos + posicion)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+    return encabezado
+
+
+class InstantaneaDatos:
+    """
+    Instantánea binaria abierta con memoria mapeada.
+    """
+
+    def __init__(self, ruta):
+        """
+        Abre una instantánea creada con `exportar_instantanea`.
+
+        Args:
+            ruta (str): Archivo de la instantánea
+        """
+        self.ruta = ruta
+        self._mapa = np.memmap(ruta, dtype=np.uint8, mode='r')
+
+        magico, formato, _, largo = ENCABEZADO.unpack(self._mapa[:ENCABEZADO.size].tobytes())
+        if magico != MAGICO:
+            raise ValueError(f"{ruta} no es una instantánea de datos")
+        if formato != FORMATO_INSTANTANEA:
+            raise ValueError(f"Formato de instantánea no soportado: {formato}")
+
+        self.metadatos = json.loads(self._mapa[ENCABEZADO.size:ENCABEZADO.size + largo].tobytes())
+        self._inicio_datos = -(-(ENCABEZADO.size + largo) // ALINEACION) * ALINEACION
+        self.firmas = self.metadatos['firmas']
+        self.firmas_complementarias = self.metadatos['firmas_complementarias']
+
+    def _bloque(self, posicion_y_largo, dtype=np.uint8):
+        """Vista de solo lectura de un bloque de datos, sin copiarlo."""
+        posicion, largo = posicion_y_largo
+        inicio = self._inicio_datos + posicion
+        return np.frombuffer(self._mapa, dtype=dtype, count=largo // np.dtype(dtype).itemsize, offset=inicio)
+
+    def _columna(self, descripcion):
+        if descripcion['tipo'] == 'numerico':
+            return self._bloque(descripcion['valores'], np.dtype(descripcion['dtype']))
+
+        # Las cadenas de texto se decodifican una sola vez al abrir la tabla
+        desplazamientos = self._bloque(descripcion['desplazamientos'], np.dtype('<i8')).tolist()
+        presentes = self._bloque(descripcion['presentes']).tolist()
+        contenido = self._bloque(descripcion['bytes']).tobytes()
+        valores = np.empty(len(presentes), dtype=object)
+        valores[:] = [
+            contenido[inicio:fin].decode('utf-8') if presente else None
+            for inicio, fin, presente in zip(desplazamientos, desplazamientos[1:], presentes)
+        ]
+        # Misma inferencia de tipo que pd.read_sql para las columnas de texto
+        return pd.Series(valores).array
+
+    def tabla(self, nombre):
+        """
+        DataFrame de una tabla; las columnas numéricas comparten memoria con el archivo.
+        """
+        descripcion = self.metadatos['tablas'][nombre]
+        columnas = {columna['nombre']: self._columna(columna) for columna in descripcion['columnas']}
+        return pd.DataFrame(columnas, index=pd.RangeIndex(descripcion['filas']), copy=False)
+
+    def tablas_principales(self):
+        """DataFrames de las tablas principales (las que no son consultas complementarias)."""
+        complementarias = set(self.metadatos['complementarias'])
+        return {nombre: self.tabla(nombre) for nombre in self.metadatos['tablas'] if nombre not in complementarias}
+
+    def complementarios(self):
+        """Datos complementarios con el formato de `_leer_complementarios` del modelo."""
+        complementarios = {'firmas': dict(self.firmas_complementarias)}
+        for nombre in self.metadatos['complementarias']:
+            complementarios[nombre] = self.tabla(nombre)
+        return complementarios
+
+
+# Código de cada trabajador del reporte: carga el modelo, responde una solicitud y
+# escribe en stdout los tiempos y la memoria del proceso
+_CODIGO_TRABAJADOR = r"""
+import json, sys, time
+inicio = time.perf_counter()
+from modelo_recomendacion import ModeloRecomendacionCultivos
+importado = time.perf_counter()
+modelo = ModeloRecomendacionCultivos(sys.argv[1], instantanea=sys.argv[2] or None)
+cargado = time.perf_counter()
+modelo.recomendar_cultivos({'temperatura': 22, 'precipitacion': 1500, 'altitud': 1200})
+from instantanea_datos import _memoria_proceso
+print(json.dumps({'importacion_s': importado - inicio, 'carga_s': cargado - importado,
+                  'primera_respuesta_s': time.perf_counter() - cargado, **_memoria_proceso()}))
+"""
+
+
+def _memoria_proceso():
+    """RSS, PSS y memoria compartida del proceso en KiB (Linux, /proc/self/smaps_rollup)."""
+    memoria = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for linea in f:
+                campo, _, valor = linea.partition(':')
+                if campo in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty'):
+                    memoria[campo.lower() + '_kb'] = int(valor.split()[0])
+    except OSError:
+        pass
+    return memoria
+
+
+def _trabajadores_en_frio(db_path, instantanea, trabajadores):
+    """Inicia los trabajadores como procesos nuevos, todos a la vez."""
+    procesos = [
+        subprocess.Popen([sys.executable, '-c', _CODIGO_TRABAJADOR, db_path, instantanea or ''],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        for _ in range(trabajadores)
+    ]
+    return [json.loads(proceso.communicate()[0].strip().splitlines()[-1]) for proceso in procesos]
+
+
+def _trabajadores_bifurcados(db_path, instantanea, trabajadores):
+    """Carga el modelo en el proceso padre y bifurca los trabajadores (os.fork)."""
+    from modelo_recomendacion import ModeloRecomendacionCultivos
+
+    inicio = time.perf_counter()
+    modelo = ModeloRecomendacionCultivos(db_path, instantanea=instantanea)
+    modelo.precargar()
+    carga = time.perf_counter() - inicio
+
+    resultados = []
+    for _ in range(trabajadores):
+        lectura, escritura = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(lectura)
+            inicio_hijo = time.perf_counter()
+            modelo.recomendar_cultivos({'temperatura': 22, 'precipitacion': 1500, 'altitud': 1200})
+            medicion = {'importacion_s': 0.0, 'carga_s': carga,
+                        'primera_respuesta_s': time.perf_counter() - inicio_hijo, **_memoria_proceso()}
+            os.write(escritura, json.dumps(medicion).encode())
+            os._exit(0)
+        os.close(escritura)
+        with os.fdopen(lectura) as f:
+            resultados.append(json.loads(f.read()))
+        os.waitpid(pid, 0)
+
+    modelo.cerrar_conexion()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    exportar = subparsers.add_parser('exportar', aliases=['snapshot'], help='Exporta la instantánea')
+    exportar.add_argument('--db', default='cultivos.db')
+    exportar.add_argument('--salida', default='cultivos.snap')
+
+    reporte = subparsers.add_parser('reporte', help='Tiempo de inicio y memoria por trabajador: SQLite frente a instantánea')
+    reporte.add_argument('--db', default='cultivos.db')
+    reporte.add_argument('--instantanea', default='cultivos.snap')
+    reporte.add_argument('--trabajadores', type=int, default=4)
+
+    args = parser.parse_args()
+
+    if args.comando in ('exportar', 'snapshot'):
+        inicio = time.perf_counter()
+        encabezado = exportar_instantanea(args.db, args.salida)
+        filas = sum(tabla['filas'] for tabla in encabezado['tablas'].values())
+        print(f"{len(encabezado['tablas'])} tablas ({filas} filas) exportadas a {args.salida} "
+              f"({os.path.getsize(args.salida) / 1024:.1f} KiB) en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+        return
+
+    if not os.path.exists(args.instantanea):
+        exportar_instantanea(args.db, args.instantanea)
+
+    print(f"{'origen':>12} {'inicio':>9} {'trabaj.':>8} {'import. ms':>11} {'carga ms':>9} {'1.a resp. ms':>13} "
+          f"{'RSS KiB':>9} {'PSS KiB':>9} {'compart. KiB':>13}")
+    for modo, lanzar in (('en frío', _trabajadores_en_frio), ('bifurcado', _trabajadores_bifurcados)):
+        for origen, instantanea in (('sqlite', None), ('instantanea', args.instantanea)):
+            resultados = lanzar(args.db, instantanea, args.trabajadores)
+
+            def promedio(campo):
+                return sum(r.get(campo, 0) for r in resultados) / len(resultados)
+
+            print(f"{origen:>12} {modo:>9} {len(resultados):>8} {promedio('importacion_s') * 1000:>11.1f} "
+                  f"{promedio('carga_s') * 1000:>9.1f} {promedio('primera_respuesta_s') * 1000:>13.1f} "
+                  f"{promedio('rss_kb'):>9.0f} {promedio('pss_kb'):>9.0f} "
+                  f"{promedio('shared_clean_kb') + promedio('shared_dirty_kb'):>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
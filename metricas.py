@@ -0,0 +1,377 @@
+"""
+Métricas de rendimiento en el formato de texto de Prometheus.
+
+Cada proceso guarda sus contadores e histogramas en un arreglo de float64 y
+registrar un valor es solo una suma en ese arreglo. Si DIRECTORIO_METRICAS indica
+un directorio, el arreglo de cada proceso es un archivo mapeado en memoria
+(metricas-<pid>.bin, con la posición de cada serie en metricas-<pid>.json) y
+`exportar` suma los archivos de todos los procesos; así los trabajadores del
+lanzador pre-fork reportan juntos sin comunicarse entre sí. Sin directorio, el
+arreglo vive en la memoria del proceso.
+
+Cada servidor debe usar su propio directorio: los archivos de procesos anteriores
+se eliminan al iniciar el lanzador (`limpiar`) y los de trabajadores que terminan
+se suman a los del padre (`absorber`).
+"""
+
+import glob
+import json
+import math
+import mmap
+import os
+import threading
+import time
+from bisect import bisect_left
+
+import numpy as np
+
+# Límites de los histogramas de duración, en segundos
+LIMITES_SEGUNDOS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Límites de los histogramas de cultivos candidatos por perfil
+LIMITES_CANDIDATOS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000)
+
+# Valores float64 que puede guardar cada proceso
+CAPACIDAD_VALORES = 16384
+
+
+def _formatear_numero(valor):
+    valor = float(valor)
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    return repr(int(valor)) if valor == int(valor) and abs(valor) < 2 ** 53 else repr(valor)
+
+
+def _formatear_etiquetas(etiquetas):
+    if not etiquetas:
+        return ''
+    pares = []
+    for nombre, valor in etiquetas:
+        valor = str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pares.append(f'{nombre}="{valor}"')
+    return '{' + ','.join(pares) + '}'
+
+
+class Contador:
+    """
+    Serie de un contador (solo aumenta).
+    """
+
+    __slots__ = ('_registro', '_posicion')
+
+    def __init__(self, registro, posicion):
+        self._registro = registro
+        self._posicion = posicion
+
+    def inc(self, valor=1):
+        registro = self._registro
+        lock = registro._lock
+        lock.acquire()
+        registro._valores[self._posicion] += valor
+        lock.release()
+
+
+class Histograma:
+    """
+    Serie de un histograma con límites fijos.
+
+    Ocupa un valor por intervalo (el último para los valores mayores que todos los
+    límites) y uno para la suma de las observaciones.
+    """
+
+    __slots__ = ('_registro', '_posicion', '_limites', '_limites_arreglo')
+
+    def __init__(self, registro, posicion, limites):
+        self._registro = registro
+        self._posicion = posicion
+        self._limites = limites
+        self._limites_arreglo = np.array(limites, dtype=np.float64)
+
+    def observar(self, valor):
+        posicion = self._posicion
+        intervalo = posicion + bisect_left(self._limites, valor)
+        suma = posicion + len(self._limites) + 1
+        registro = self._registro
+        lock = registro._lock
+        lock.acquire()
+        valores = registro._valores
+        valores[intervalo] += 1
+        valores[suma] += valor
+        lock.release()
+
+    def observar_desde(self, inicio):
+        """
+        Observa el tiempo transcurrido desde `inicio` (time.perf_counter).
+
+        Returns:
+            float: Instante actual, para medir la etapa siguiente
+        """
+        ahora = time.perf_counter()
+        self.observar(ahora - inicio)
+        return ahora
+
+    def observar_varios(self, valores):
+        """Observa todos los valores de un arreglo."""
+        valores = np.ravel(valores)
+        if len(valores) == 1:
+            self.observar(valores[0].item())
+            return
+        cuentas = np.bincount(np.searchsorted(self._limites_arreglo, valores, side='left'),
+                              minlength=len(self._limites) + 1)
+        total = float(valores.sum())
+        suma = self._posicion + len(self._limites) + 1
+        registro = self._registro
+        with registro._lock:
+            arreglo = registro._valores
+            for intervalo in np.flatnonzero(cuentas).tolist():
+                arreglo[self._posicion + intervalo] += int(cuentas[intervalo])
+            arreglo[suma] += total
+
+
+class RegistroMetricas:
+    """
+    Contadores e histogramas de un proceso, con exportación en formato Prometheus.
+    """
+
+    def __init__(self, directorio=None, capacidad=CAPACIDAD_VALORES):
+        """
+        Args:
+            directorio (str, opcional): Directorio compartido por los procesos del
+                servidor; sin directorio las métricas son solo de este proceso
+            capacidad (int): Valores que puede guardar el proceso
+        """
+        self.directorio = directorio
+        self.capacidad = capacidad
+        self._lock = threading.Lock()
+        # nombre -> (tipo, ayuda, límites); (nombre, etiquetas) -> posición
+        self._familias = {}
+        self._series = {}
+        self._instrumentos = {}
+        self._usados = 0
+
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+            # Cada proceso hijo escribe en su propio archivo, empezando en cero
+            os.register_at_fork(after_in_child=self._abrir)
+        self._abrir()
+
+    def _ruta(self, pid, extension):
+        return os.path.join(self.directorio, f"metricas-{pid}.{extension}")
+
+    def _abrir(self):
+        """Crea el arreglo de valores de este proceso (vacío)."""
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        tamano = self.capacidad * 8
+
+        if self.directorio:
+            with open(self._ruta(self._pid, 'bin'), 'w+b') as archivo:
+                archivo.truncate(tamano)
+                memoria = mmap.mmap(archivo.fileno(), tamano)
+            self._valores = memoryview(memoria).cast('d')
+            self._guardar_series()
+        else:
+            self._valores = memoryview(bytearray(tamano)).cast('d')
+
+    def _guardar_series(self):
+        """Escribe la posición de cada serie para que otros procesos lean el arreglo."""
+        if not self.directorio:
+            return
+        contenido = {
+            'familias': {nombre: list(familia) for nombre, familia in self._familias.items()},
+            'series': [[nombre, [list(par) for par in etiquetas], posicion]
+                       for (nombre, etiquetas), posicion in self._series.items()]
+        }
+        ruta = self._ruta(self._pid, 'json')
+        temporal = f"{ruta}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(contenido, archivo, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    def _serie(self, tipo, nombre, ayuda, limites, etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        instrumento = self._instrumentos.get(clave)
+        if instrumento is not None:
+            return instrumento
+
+        with self._lock:
+            familia = self._familias.setdefault(nombre, (tipo, ayuda, limites))
+            if familia[0] != tipo or familia[2] != limites:
+                raise ValueError(f"La métrica {nombre} ya está registrada como {familia[0]}")
+
+            posicion = self._series.get(clave)
+            if posicion is None:
+                tamano = len(limites) + 2 if tipo == 'histogram' else 1
+                if self._usados + tamano > self.capacidad:
+                    raise ValueError(f"No hay espacio para más series de métricas (capacidad {self.capacidad})")
+                posicion = self._usados
+                self._usados += tamano
+                self._series[clave] = posicion
+                self._guardar_series()
+
+            instrumento = (Histograma(self, posicion, limites) if tipo == 'histogram'
+                           else Contador(self, posicion))
+            self._instrumentos[clave] = instrumento
+            return instrumento
+
+    def contador(self, nombre, ayuda, **etiquetas):
+        """
+        Serie de un contador, creándola si no existe.
+
+        Args:
+            nombre (str): Nombre de la métrica (terminado en _total)
+            ayuda (str): Descripción de la métrica
+            **etiquetas: Etiquetas de la serie
+
+        Returns:
+            Contador: Serie con el método inc(valor=1)
+        """
+        return self._serie('counter', nombre, ayuda, None, etiquetas)
+
+    def histograma(self, nombre, ayuda, limites=LIMITES_SEGUNDOS, **etiquetas):
+        """
+        Serie de un histograma, creándola si no existe.
+
+        Args:
+            nombre (str): Nombre de la métrica
+            ayuda (str): Descripción de la métrica
+            limites (tuple): Límites superiores de los intervalos, en orden creciente
+            **etiquetas: Etiquetas de la serie
+
+        Returns:
+            Histograma: Serie con los métodos observar, observar_desde y observar_varios
+        """
+        return self._serie('histogram', nombre, ayuda, tuple(limites), etiquetas)
+
+    def _leer_procesos(self):
+        """Series y valores de cada proceso: lista de (familias, series, valores)."""
+        if not self.directorio:
+            with self._lock:
+                valores = np.array(self._valores[:self._usados], dtype=np.float64)
+            return [(dict(self._familias), dict(self._series), valores)]
+
+        procesos = []
+        for ruta in glob.glob(os.path.join(self.directorio, 'metricas-*.json')):
+            contenido = self._leer_archivos(ruta)
+            if contenido is not None:
+                procesos.append(contenido)
+        return procesos
+
+    @staticmethod
+    def _leer_archivos(ruta_series):
+        try:
+            with open(ruta_series, encoding='utf-8') as archivo:
+                contenido = json.load(archivo)
+            valores = np.fromfile(ruta_series[:-len('json')] + 'bin', dtype=np.float64)
+        except (OSError, ValueError):
+            # El proceso terminó y sus archivos se eliminaron mientras se leían
+            return None
+        familias = {nombre: (tipo, ayuda, tuple(limites) if limites is not None else None)
+                    for nombre, (tipo, ayuda, limites) in contenido['familias'].items()}
+        series = {(nombre, tuple(tuple(par) for par in etiquetas)): posicion
+                  for nombre, etiquetas, posicion in contenido['series']}
+        return familias, series, valores
+
+    def _sumar(self, procesos):
+        """Suma las series de varios procesos: (familias, {(nombre, etiquetas): valores})."""
+        familias = {}
+        totales = {}
+        for familias_proceso, series, valores in procesos:
+            for nombre, familia in familias_proceso.items():
+                familias.setdefault(nombre, familia)
+            for clave, posicion in series.items():
+                tipo, _, limites = familias_proceso[clave[0]]
+                tamano = len(limites) + 2 if tipo == 'histogram' else 1
+                if posicion + tamano > len(valores):
+                    continue
+                parcial = valores[posicion:posicion + tamano]
+                if clave in totales:
+                    totales[clave] = totales[clave] + parcial
+                else:
+                    totales[clave] = parcial.copy()
+        return familias, totales
+
+    def exportar(self):
+        """
+        Métricas de todos los procesos en el formato de texto de Prometheus (0.0.4).
+
+        Returns:
+            str: Texto para la respuesta de /metrics
+        """
+        familias, totales = self._sumar(self._leer_procesos())
+
+        lineas = []
+        for nombre in sorted(familias):
+            tipo, ayuda, limites = familias[nombre]
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for (serie, etiquetas), valores in sorted(totales.items()):
+                if serie != nombre:
+                    continue
+                if tipo == 'counter':
+                    lineas.append(f"{nombre}{_formatear_etiquetas(etiquetas)} {_formatear_numero(valores[0])}")
+                    continue
+                acumulados = np.cumsum(valores[:-1])
+                for limite, cuenta in zip(limites + (math.inf,), acumulados):
+                    lineas.append(f"{nombre}_bucket"
+                                  f"{_formatear_etiquetas(etiquetas + (('le', _formatear_numero(float(limite))),))} "
+                                  f"{_formatear_numero(cuenta)}")
+                lineas.append(f"{nombre}_sum{_formatear_etiquetas(etiquetas)} {_formatear_numero(valores[-1])}")
+                lineas.append(f"{nombre}_count{_formatear_etiquetas(etiquetas)} {_formatear_numero(acumulados[-1])}")
+
+        return '\n'.join(lineas) + '\n'
+
+    def absorber(self, pid):
+        """
+        Suma a este proceso las métricas de un proceso que terminó y elimina sus archivos.
+
+        Args:
+            pid (int): Proceso que terminó
+        """
+        if not self.directorio or pid == self._pid:
+            return
+        contenido = self._leer_archivos(self._ruta(pid, 'json'))
+        if contenido is not None:
+            familias, series, valores = contenido
+            for (nombre, etiquetas), posicion in series.items():
+                tipo, ayuda, limites = familias[nombre]
+                tamano = len(limites) + 2 if tipo == 'histogram' else 1
+                if posicion + tamano > len(valores):
+                    continue
+                propia = self._serie(tipo, nombre, ayuda, limites, dict(etiquetas))._posicion
+                with self._lock:
+                    for i, valor in enumerate(valores[posicion:posicion + tamano].tolist()):
+                        self._valores[propia + i] += valor
+        for extension in ('json', 'bin'):
+            try:
+                os.remove(self._ruta(pid, extension))
+            except FileNotFoundError:
+                pass
+
+    def limpiar(self):
+        """Elimina los archivos de métricas de otros procesos (de ejecuciones anteriores)."""
+        if not self.directorio:
+            return
+        for ruta in glob.glob(os.path.join(self.directorio, 'metricas-*.*')):
+            if not os.path.basename(ruta).startswith(f"metricas-{self._pid}."):
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+
+
+# Registro del proceso; DIRECTORIO_METRICAS lo comparte entre los procesos del servidor
+REGISTRO = RegistroMetricas(os.environ.get('DIRECTORIO_METRICAS'))
+
+
+def duracion_etapa(etapa):
+    """Histograma de la duración de una etapa de la recomendación."""
+    return REGISTRO.histograma('cultivos_etapa_segundos',
+                               'Duración de cada etapa de la recomendación, por bloque de perfiles', etapa=etapa)
+
+
+def consultas_cache(cache, resultado):
+    """Contador de consultas a una caché ('acierto' o 'fallo')."""
+    return REGISTRO.contador('cultivos_cache_consultas_total', 'Consultas a cada caché por resultado',
+                             cache=cache, resultado=resultado)
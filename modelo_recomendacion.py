@@ -1,8 +1,201 @@
+import hashlib
+import itertools
+import os
+import re
 import sqlite3
+import threading
+import time
+import unicodedata
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import cosine_similarity
+from indice_intervalos import IndiceIntervalos
+from indice_proveedores import IndiceProveedores
+from indice_similitud import IndiceSimilitud, K_VECINOS
+from portafolio_cultivos import optimizar_asignacion, redondear_asignacion
+from pool_conexiones import PoolConexiones
+from instantanea_datos import InstantaneaDatos
+from cache_recomendaciones import canonizar
+from serializacion_json import FragmentosResultados, ResultadosRecomendacion, codificador
+import metricas
+
+# Dificultad de manejo de los cultivos (simplificado)
+DIFICULTAD_CULTIVOS = {
+    'Maíz': 'Baja', 'Fríjol': 'Baja', 'Yuca': 'Baja', 'Plátano': 'Baja',
+    'Arroz': 'Media', 'Papa': 'Media', 'Tomate de árbol': 'Media',
+    'Café': 'Alta', 'Cacao': 'Alta', 'Gulupa': 'Alta', 'Arándano': 'Alta'
+}
+
+NIVELES_DIFICULTAD = ('Baja', 'Media', 'Alta')
+
+# Ajuste de puntuación según la experiencia del usuario, indexado por dificultad
+# del cultivo en el orden de NIVELES_DIFICULTAD
+AJUSTE_EXPERIENCIA = {
+    'baja': np.array([10, 0, -10]),   # Experiencia baja: favorece cultivos fáciles
+    'media': np.array([5, 10, 0]),    # Experiencia media: favorece cultivos de dificultad media
+    'alta': np.array([0, 5, 10])      # Experiencia alta: favorece cultivos difíciles
+}
+
+PARAMETROS_OBLIGATORIOS = ('temperatura', 'precipitacion', 'altitud')
+PARAMETROS_NUMERICOS = ('ph_suelo', 'presupuesto', 'tiempo_disponible', 'id_zona')
+
+# Tamaño de los bloques de perfiles evaluados en una sola pasada por
+# recomendar_cultivos_lote (perfiles x filas de la matriz)
+ELEMENTOS_POR_BLOQUE = 1_000_000
+MAX_PERFILES_POR_BLOQUE = 4096
+
+# Tablas necesarias para filtrar y puntuar
+TABLAS_PRINCIPALES = ('cultivos', 'condiciones', 'costos', 'zonas', 'cultivo_zona')
+
+# Consultas de los datos complementarios, usados solo en los resultados detallados,
+# los costos y los proveedores
+CONSULTAS_COMPLEMENTARIAS = {
+    'plagas_df': """
+        SELECT pe.*, cp.id_cultivo, cp.severidad, cp.frecuencia 
+        FROM plagas_enfermedades pe
+        JOIN cultivo_plaga cp ON pe.id_plaga = cp.id_plaga
+    """,
+    'insumos_cultivo_df': """
+        SELECT i.*, ic.id_cultivo, ic.cantidad_por_ha, ic.etapa_aplicacion, ic.frecuencia
+        FROM insumos i
+        JOIN insumo_cultivo ic ON i.id_insumo = ic.id_insumo
+    """,
+    'tecnicas_cultivo_df': """
+        SELECT t.*, tc.id_cultivo, tc.importancia, tc.etapa_aplicacion
+        FROM tecnicas t
+        JOIN tecnica_cultivo tc ON t.id_tecnica = tc.id_tecnica
+    """,
+    'certificaciones_cultivo_df': """
+        SELECT c.*, cc.id_cultivo, cc.mercado_objetivo, cc.premium_precio
+        FROM certificaciones c
+        JOIN cultivo_certificacion cc ON c.id_certificacion = cc.id_certificacion
+    """,
+    'ofertas_proveedores_df': """
+        SELECT p.*, pi.id_insumo, pi.precio, pi.disponibilidad, i.nombre as nombre_insumo, 
+               i.categoria as categoria_insumo, i.unidad_medida
+        FROM proveedores p
+        JOIN proveedor_insumo pi ON p.id_proveedor = pi.id_proveedor
+        JOIN insumos i ON pi.id_insumo = i.id_insumo
+    """
+}
+
+# Tablas de origen de cada consulta complementaria
+TABLAS_COMPLEMENTARIAS = {
+    'plagas_df': ('plagas_enfermedades', 'cultivo_plaga'),
+    'insumos_cultivo_df': ('insumos', 'insumo_cultivo'),
+    'tecnicas_cultivo_df': ('tecnicas', 'tecnica_cultivo'),
+    'certificaciones_cultivo_df': ('certificaciones', 'cultivo_certificacion'),
+    'ofertas_proveedores_df': ('proveedores', 'proveedor_insumo', 'insumos')
+}
+
+# Parámetros por defecto del optimizador de portafolio: fracción máxima del área
+# asignada a un mismo cultivo y resolución de las asignaciones en hectáreas
+MAX_FRACCION_CULTIVO_PORTAFOLIO = 0.5
+RESOLUCION_PORTAFOLIO_HA = 0.1
+
+# Número máximo de áreas por barrido de costos
+MAX_AREAS_BARRIDO_COSTOS = 1000
+
+# Márgenes de tolerancia aplicados cuando ningún cultivo cumple una condición básica
+MARGEN_TEMPERATURA = 2.0  # °C
+MARGEN_PRECIPITACION = 200  # mm
+MARGEN_ALTITUD = 200  # msnm
+
+# Número de filas de condiciones a partir del cual el filtrado por condiciones
+# básicas usa el índice de intervalos en lugar de máscaras completas
+# (ver benchmark_indice_intervalos.py)
+UMBRAL_INDICE_INTERVALOS = 75_000
+
+# Número máximo de palabras clave de suelo distintas cuyas coincidencias se memorizan
+MAX_COINCIDENCIAS_SUELO = 1024
+
+# Modos de búsqueda por tipo de suelo: alguna o todas las palabras clave
+MODOS_SUELO = ('cualquiera', 'todas')
+
+# Etapas de una recomendación con métricas de duración (la serialización la mide server.py)
+# y filtros tras los que se registra el número de cultivos candidatos de cada perfil
+ETAPAS_RECOMENDACION = ('condiciones_basicas', 'tipo_suelo', 'ph', 'presupuesto', 'tiempo', 'departamento', 'zona',
+                        'mercado', 'puntuacion', 'seleccion', 'resultados')
+ETAPAS_FILTRO = ETAPAS_RECOMENDACION[:8]
+
+_DURACION_ETAPAS = {etapa: metricas.duracion_etapa(etapa) for etapa in ETAPAS_RECOMENDACION}
+_CANDIDATOS = {
+    etapa: metricas.REGISTRO.histograma('cultivos_candidatos', 'Cultivos candidatos de cada perfil después de cada filtro',
+                                        metricas.LIMITES_CANDIDATOS, etapa=etapa)
+    for etapa in ETAPAS_FILTRO
+}
+_RELAJACIONES = {
+    condicion: metricas.REGISTRO.contador('cultivos_relajaciones_total',
+                                          'Perfiles en que un filtro se relajó por no dejar cultivos',
+                                          condicion=condicion)
+    for condicion in ('temperatura', 'precipitacion', 'altitud', 'mercado')
+}
+_CONSULTAS_CACHE = {
+    (cache, acierto): metricas.consultas_cache(cache, 'acierto' if acierto else 'fallo')
+    for cache in ('recomendaciones', 'tabla_climatica') for acierto in (True, False)
+}
+
+def normalizar_texto(texto):
+    """Convierte un texto a minúsculas y sin tildes (p. ej. 'Volcánico' -> 'volcanico')."""
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+def normalizar_departamento(departamento):
+    """Clave de búsqueda de un departamento: sin tildes, en minúsculas y con espacios simples."""
+    return ' '.join(normalizar_texto(str(departamento)).split())
+
+_PALABRA = re.compile(r'[a-z0-9]+')
+
+def tokenizar(texto):
+    """Palabras normalizadas de un texto, separadas por cualquier signo no alfanumérico."""
+    return _PALABRA.findall(normalizar_texto(texto))
+
+def _medir_etapa(etapa, inicio, mascara=None):
+    """
+    Registra la duración de una etapa y, con `mascara`, los candidatos de cada perfil.
+    
+    Returns:
+        float: Instante desde el que se mide la etapa siguiente (sin contar el registro)
+    """
+    _DURACION_ETAPAS[etapa].observar_desde(inicio)
+    if mascara is not None:
+        # Con un solo perfil se evita el conteo por filas, mucho más lento
+        if len(mascara) == 1:
+            _CANDIDATOS[etapa].observar(int(np.count_nonzero(mascara)))
+        else:
+            _CANDIDATOS[etapa].observar_varios(np.count_nonzero(mascara, axis=-1))
+    return time.perf_counter()
+
+class DatosModelo:
+    """
+    Instantánea de los datos del modelo: tablas, matriz de cultivos, índices y
+    fragmentos de detalle obtenidos de una misma lectura de la base de datos.
+    
+    Una instantánea publicada no se modifica (salvo la carga diferida de sus datos
+    complementarios y la memoria de coincidencias de suelo); cada recarga construye
+    una nueva y la reemplaza de forma atómica, de modo que las solicitudes en curso
+    terminan con la instantánea con que empezaron.
+    """
+    
+    def __init__(self, version, tablas, firmas):
+        """
+        Args:
+            version (int): Versión de los datos (aumenta con cada recarga)
+            tablas (dict): DataFrame de cada tabla de TABLAS_PRINCIPALES
+            firmas (dict): Suma de verificación de cada tabla leída
+        """
+        self.version = version
+        self.tablas = tablas
+        self.firmas = firmas
+        self.filas_df = None
+        self.matriz = None
+        self.indice_suelo = None
+        self.coincidencias_suelo = {}
+        self.indices_condiciones = None
+        self.indice_zonas = None
+        self.complementarios = None
+        self.lock_complementarios = threading.Lock()
+        # Instantánea binaria de la que se cargaron los datos (solo la versión inicial)
+        self.instantanea = None
 
 class ModeloRecomendacionCultivos:
     """
@@ -10,70 +203,464 @@ class ModeloRecomendacionCultivos:
     basado en condiciones específicas del usuario y datos históricos.
     """
     
-    def __init__(self, db_path):
+    def __init__(self, db_path, umbral_indice=UMBRAL_INDICE_INTERVALOS, cache=None, carga_diferida=False,
+                 pool=None, tabla_climatica=None, instantanea=None, agrupador=None, codificar_json=None):
         """
         Inicializa el modelo con la conexión a la base de datos.
         
         Args:
             db_path (str): Ruta al archivo de base de datos SQLite
+            umbral_indice (int, opcional): Número de filas de condiciones a partir del
+                cual se construye el índice de intervalos (None para no usarlo)
+            cache (CacheRecomendaciones, opcional): Caché de resultados de
+                `recomendar_cultivos`; si cuantiza los parámetros, los resultados se
+                calculan con los valores redondeados
+            carga_diferida (bool): Si es True, al iniciar solo se cargan las tablas
+                necesarias para puntuar; plagas, insumos, técnicas y certificaciones se
+                cargan en su primer uso (o al llamar a `precargar`)
+            pool (PoolConexiones, opcional): Pool de conexiones de solo lectura; si no
+                se indica, el modelo crea uno propio
+            tabla_climatica (TablaClimatica, opcional): Tabla precalculada con que se
+                responden los perfiles que solo indican clima, experiencia y mercado
+            instantanea (str, opcional): Archivo creado con instantanea_datos.py; los
+                datos iniciales se toman de él (con memoria mapeada) en lugar de
+                consultar la base de datos, que solo se lee en las recargas
+            agrupador (AgrupadorSolicitudes, opcional): Agrupa las llamadas concurrentes
+                de `recomendar_cultivos` con los mismos parámetros canónicos en un solo
+                cálculo
+            codificar_json (callable, opcional): Codificador de serializacion_json con
+                que se preparan los fragmentos JSON de los resultados detallados; por
+                defecto, `serializacion_json.codificador()`
         """
         self.db_path = db_path
-        self.conn = None
-        self.cultivos_df = None
-        self.condiciones_df = None
-        self.costos_df = None
-        self.zonas_df = None
-        self.plagas_df = None
+        self.umbral_indice = umbral_indice
+        self.cache = cache
+        self.carga_diferida = carga_diferida
+        self.pool = pool if pool is not None else PoolConexiones(db_path)
+        self.tabla_climatica = tabla_climatica
+        self.instantanea = instantanea
+        self.agrupador = agrupador
+        self.codificar_json = codificar_json if codificar_json is not None else codificador()
         self.insumos_df = None
         self.tecnicas_df = None
         self.certificaciones_df = None
         
+        # Instantánea vigente de los datos y estado de las recargas
+        self._datos = None
+        self._firma_archivo_datos = None
+        self._lock_recarga = threading.Lock()
+        self._detener_recarga = threading.Event()
+        self._hilo_recarga = None
+        self.recargas = 0
+        self.errores_recarga = 0
+        self.ultimo_error_recarga = None
+        self.ultima_recarga = None
+        self.duracion_ultima_recarga = None
+        self.tablas_recargadas = []
+        
         # Cargar datos
         self._cargar_datos()
     
     def _cargar_datos(self):
         """Carga los datos necesarios desde la base de datos."""
         try:
-            self.conn = sqlite3.connect(self.db_path)
-            
-            # Cargar tablas principales
-            self.cultivos_df = pd.read_sql("SELECT * FROM cultivos", self.conn)
-            self.condiciones_df = pd.read_sql("SELECT * FROM condiciones", self.conn)
-            self.costos_df = pd.read_sql("SELECT * FROM costos", self.conn)
-            self.zonas_df = pd.read_sql("SELECT * FROM zonas", self.conn)
-            
-            # Cargar relaciones
-            self.cultivo_zona_df = pd.read_sql("SELECT * FROM cultivo_zona", self.conn)
-            
-            # Cargar datos complementarios
-            self.plagas_df = pd.read_sql("""
-                SELECT pe.*, cp.id_cultivo, cp.severidad, cp.frecuencia 
-                FROM plagas_enfermedades pe
-                JOIN cultivo_plaga cp ON pe.id_plaga = cp.id_plaga
-            """, self.conn)
-            
-            self.insumos_cultivo_df = pd.read_sql("""
-                SELECT i.*, ic.id_cultivo, ic.cantidad_por_ha, ic.etapa_aplicacion, ic.frecuencia
-                FROM insumos i
-                JOIN insumo_cultivo ic ON i.id_insumo = ic.id_insumo
-            """, self.conn)
-            
-            self.tecnicas_cultivo_df = pd.read_sql("""
-                SELECT t.*, tc.id_cultivo, tc.importancia, tc.etapa_aplicacion
-                FROM tecnicas t
-                JOIN tecnica_cultivo tc ON t.id_tecnica = tc.id_tecnica
-            """, self.conn)
-            
-            self.certificaciones_cultivo_df = pd.read_sql("""
-                SELECT c.*, cc.id_cultivo, cc.mercado_objetivo, cc.premium_precio
-                FROM certificaciones c
-                JOIN cultivo_certificacion cc ON c.id_certificacion = cc.id_certificacion
-            """, self.conn)
+            # Cargar tablas principales, construir la matriz de cultivos y, salvo con
+            # carga diferida, los datos complementarios
+            if self.instantanea:
+                self._cargar_instantanea()
+            else:
+                self._actualizar_datos(forzar=True)
             
             print(f"Datos cargados correctamente. {len(self.cultivos_df)} cultivos disponibles.")
         except Exception as e:
             print(f"Error al cargar datos: {e}")
     
+    def recargar(self, forzar=False):
+        """
+        Vuelve a leer la base de datos si cambió desde la última carga.
+        
+        Cada tabla principal se lee una vez y se compara su suma de verificación; las
+        tablas sin cambios y los datos derivados de ellas se reutilizan. La nueva instantánea se
+        publica al terminar; mientras tanto las solicitudes usan la anterior, que
+        también se conserva si la recarga falla.
+        
+        Args:
+            forzar (bool): Comparar las tablas aunque el archivo no haya cambiado
+            
+        Returns:
+            bool: True si se publicó una nueva versión de los datos
+        """
+        try:
+            return self._actualizar_datos(forzar)
+        except Exception as e:
+            self.errores_recarga += 1
+            self.ultimo_error_recarga = str(e)
+            print(f"Error al recargar datos: {e}")
+            return False
+    
+    def iniciar_recarga_automatica(self, intervalo_segundos=30):
+        """
+        Revisa periódicamente la base de datos en un hilo de fondo y recarga los
+        datos cuando cambian.
+        
+        Args:
+            intervalo_segundos (float): Tiempo entre revisiones
+        """
+        if self._hilo_recarga is not None and self._hilo_recarga.is_alive():
+            return
+        
+        self._detener_recarga.clear()
+        
+        def vigilar():
+            while not self._detener_recarga.wait(intervalo_segundos):
+                self.recargar()
+        
+        self._hilo_recarga = threading.Thread(target=vigilar, name='recarga-datos', daemon=True)
+        self._hilo_recarga.start()
+    
+    def detener_recarga_automatica(self):
+        """Detiene el hilo de recarga automática, si está activo."""
+        self._detener_recarga.set()
+        if self._hilo_recarga is not None:
+            self._hilo_recarga.join()
+            self._hilo_recarga = None
+    
+    def estado_datos(self):
+        """
+        Estado de los datos cargados, para monitoreo.
+        
+        Returns:
+            dict: Versión vigente, fecha y duración de la última carga, tablas leídas
+                en ella y contadores de recargas y errores
+        """
+        return {
+            'version': self.version_datos,
+            'ultima_recarga': self.ultima_recarga,
+            'duracion_ultima_recarga_ms': (
+                round(self.duracion_ultima_recarga * 1000, 2) if self.duracion_ultima_recarga is not None else None
+            ),
+            'tablas_recargadas': list(self.tablas_recargadas),
+            'recargas': self.recargas,
+            'errores_recarga': self.errores_recarga,
+            'ultimo_error_recarga': self.ultimo_error_recarga,
+            'recarga_automatica': self._hilo_recarga is not None and self._hilo_recarga.is_alive(),
+            'instantanea': self.instantanea
+        }
+    
+    def _actualizar_datos(self, forzar=False):
+        """
+        Lee la base de datos y publica una nueva instantánea si alguna tabla cambió.
+        
+        Returns:
+            bool: True si se publicó una nueva versión de los datos
+        """
+        with self._lock_recarga:
+            anterior = self._datos
+            firma_archivo = self._firma_archivo()
+            
+            # Revisión rápida: si el archivo no cambió, tampoco sus tablas
+            if not forzar and anterior is not None and firma_archivo == self._firma_archivo_datos:
+                return False
+            
+            inicio = time.perf_counter()
+            with self.pool.conexion() as conn:
+                # Una sola transacción de lectura para que todas las tablas sean coherentes
+                conn.execute("BEGIN")
+                
+                # Cada tabla se lee una sola vez; su firma se calcula sobre el DataFrame leído
+                leidas = {tabla: pd.read_sql(f"SELECT * FROM {tabla}", conn) for tabla in TABLAS_PRINCIPALES}
+                firmas = {tabla: self._firma_df(df) for tabla, df in leidas.items()}
+                recargadas = [
+                    tabla for tabla in TABLAS_PRINCIPALES
+                    if anterior is None or anterior.firmas[tabla] != firmas[tabla]
+                ]
+                # Las tablas sin cambios conservan el DataFrame anterior, del que dependen
+                # la matriz y los índices que se reutilizan
+                tablas = {
+                    tabla: leidas[tabla] if tabla in recargadas else anterior.tablas[tabla]
+                    for tabla in TABLAS_PRINCIPALES
+                }
+                
+                # Los datos complementarios solo se revisan si la instantánea anterior ya los tenía
+                complementarios = None
+                if anterior is not None and anterior.complementarios is not None:
+                    complementarios, complementarias_recargadas = self._leer_complementarios(
+                        conn, anterior.complementarios
+                    )
+                    recargadas += complementarias_recargadas
+            
+            self._firma_archivo_datos = firma_archivo
+            if anterior is not None and not recargadas:
+                return False
+            
+            datos = DatosModelo(anterior.version + 1 if anterior is not None else 1, tablas, firmas)
+            
+            principales = any(tabla in TABLAS_PRINCIPALES for tabla in recargadas)
+            if principales:
+                # Construir la matriz de cultivos para filtrado y puntuación
+                self._construir_matriz(datos)
+            else:
+                # La matriz y sus índices no dependen de las tablas que cambiaron
+                datos.filas_df = anterior.filas_df
+                datos.matriz = anterior.matriz
+                datos.indice_suelo = anterior.indice_suelo
+                datos.coincidencias_suelo = anterior.coincidencias_suelo
+                datos.indices_condiciones = anterior.indices_condiciones
+                datos.indice_zonas = anterior.indice_zonas
+            
+            if complementarios is not None:
+                self._indexar_complementarios(datos, complementarios, anterior)
+                datos.complementarios = complementarios
+            elif not self.carga_diferida:
+                self._cargar_complementarios(datos)
+            
+            # Publicar la nueva instantánea; cada versión invalida los resultados en caché
+            self._datos = datos
+            
+            self.duracion_ultima_recarga = time.perf_counter() - inicio
+            self.ultima_recarga = time.strftime('%Y-%m-%dT%H:%M:%S')
+            self.tablas_recargadas = recargadas
+            if anterior is not None:
+                self.recargas += 1
+            
+            return True
+    
+    def _cargar_instantanea(self):
+        """
+        Publica la primera versión de los datos a partir de la instantánea binaria.
+        
+        Las firmas de la instantánea permiten que la primera recarga lea de la base de
+        datos solo las tablas que cambiaron desde que se exportó.
+        """
+        with self._lock_recarga:
+            inicio = time.perf_counter()
+            instantanea = InstantaneaDatos(self.instantanea)
+            
+            datos = DatosModelo(1, instantanea.tablas_principales(), dict(instantanea.firmas))
+            datos.instantanea = instantanea
+            self._construir_matriz(datos)
+            if not self.carga_diferida:
+                self._cargar_complementarios(datos)
+            
+            self._datos = datos
+            self.duracion_ultima_recarga = time.perf_counter() - inicio
+            self.ultima_recarga = time.strftime('%Y-%m-%dT%H:%M:%S')
+            self.tablas_recargadas = list(TABLAS_PRINCIPALES)
+    
+    def _firma_archivo(self):
+        """Fecha de modificación y tamaño del archivo de la base de datos y de su WAL."""
+        firma = []
+        for ruta in (self.db_path, self.db_path + '-wal'):
+            try:
+                estado = os.stat(ruta)
+                firma.append((estado.st_mtime_ns, estado.st_size))
+            except OSError:
+                firma.append(None)
+        return tuple(firma)
+    
+    @staticmethod
+    def _firma_df(df):
+        """Suma de verificación de una tabla ya leída (nombres de columna y filas, en orden)."""
+        firma = hashlib.blake2b(digest_size=16)
+        firma.update(repr(list(df.columns)).encode())
+        firma.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        return firma.hexdigest()
+    
+    @staticmethod
+    def _firma_tabla(conn, tabla):
+        """Suma de verificación del contenido de una tabla."""
+        return ModeloRecomendacionCultivos._firma_df(pd.read_sql(f"SELECT * FROM {tabla}", conn))
+    
+    def _leer_complementarios(self, conn, anteriores=None):
+        """
+        Lee los datos complementarios, reutilizando los de `anteriores` cuyas tablas
+        no cambiaron.
+        
+        Returns:
+            tuple: (diccionario de DataFrames y firmas, tablas leídas de nuevo)
+        """
+        firmas = {}
+        complementarios = {'firmas': firmas}
+        recargadas = []
+        
+        for nombre, consulta in CONSULTAS_COMPLEMENTARIAS.items():
+            tablas = TABLAS_COMPLEMENTARIAS[nombre]
+            for tabla in tablas:
+                if tabla not in firmas:
+                    firmas[tabla] = self._firma_tabla(conn, tabla)
+            
+            cambiadas = [
+                tabla for tabla in tablas
+                if anteriores is None or anteriores['firmas'][tabla] != firmas[tabla]
+            ]
+            if cambiadas:
+                complementarios[nombre] = pd.read_sql(consulta, conn)
+                recargadas += [tabla for tabla in cambiadas if tabla not in recargadas]
+            else:
+                complementarios[nombre] = anteriores[nombre]
+        
+        return complementarios, recargadas
+    
+    def precargar(self):
+        """
+        Carga de inmediato los datos complementarios y el índice de similitud (útil
+        con `carga_diferida` en despliegues que prefieren pagar todo el costo al iniciar).
+        """
+        if self._datos is not None:
+            self._indice_similitud(self._datos)
+    
+    # Alias para despliegues que esperan el nombre en inglés
+    warmup = precargar
+    
+    def congelar(self):
+        """
+        Prepara el modelo para compartirlo entre procesos bifurcados (copy-on-write).
+        
+        Carga de una vez todos los datos, para que ningún proceso hijo construya su
+        propia copia, detiene la recarga automática (los hilos no sobreviven al fork)
+        y cierra las conexiones libres del pool. Al responder solicitudes solo se leen
+        la matriz y los índices, de solo lectura, y los fragmentos de detalle ya
+        preparados; las recargas publican instantáneas nuevas sin modificar la vigente.
+        """
+        self.detener_recarga_automatica()
+        self.precargar()
+        self.pool.vaciar()
+    
+    def _cargar_complementarios(self, datos):
+        """
+        Carga las tablas complementarias de una instantánea y prepara los fragmentos
+        de detalle.
+        
+        Es segura entre hilos y se ejecuta una sola vez por instantánea.
+        """
+        complementarios = datos.complementarios
+        if complementarios is not None:
+            return complementarios
+        
+        with datos.lock_complementarios:
+            if datos.complementarios is None:
+                if datos.instantanea is not None:
+                    complementarios = datos.instantanea.complementarios()
+                else:
+                    with self.pool.conexion() as conn:
+                        conn.execute("BEGIN")
+                        complementarios, _ = self._leer_complementarios(conn)
+                
+                self._indexar_complementarios(datos, complementarios)
+                datos.complementarios = complementarios
+            
+            return datos.complementarios
+    
+    def _indexar_complementarios(self, datos, complementarios, anterior=None):
+        """
+        Prepara los fragmentos de detalle (y su JSON), el índice de proveedores y la
+        tabla de costos.
+        
+        El índice de similitud (y scikit-learn) se construye con la primera consulta de
+        cultivos similares. Si la instantánea `anterior` ya lo tenía, se reutiliza si sus
+        datos no cambiaron o se actualiza solo para los cultivos modificados.
+        """
+        complementarios['detalles'] = self._construir_detalles(datos.filas_df, complementarios)
+        complementarios['fragmentos'] = FragmentosResultados(*complementarios['detalles'], self.codificar_json)
+        complementarios['costos'] = self._construir_tabla_costos(datos.tablas, complementarios['insumos_cultivo_df'])
+        complementarios['proveedores'] = IndiceProveedores(
+            complementarios['ofertas_proveedores_df'], complementarios['insumos_cultivo_df']
+        )
+        
+        plagas_df = complementarios['plagas_df']
+        similitud = anterior.complementarios.get('similitud') if anterior is not None else None
+        if similitud is not None and (
+            datos.filas_df is not anterior.filas_df or plagas_df is not anterior.complementarios['plagas_df']
+        ):
+            similitud = similitud.actualizado(datos.filas_df, plagas_df)
+        complementarios['similitud'] = similitud
+    
+    def _indice_similitud(self, datos):
+        """Índice de similitud de una instantánea, construyéndolo en el primer uso."""
+        complementarios = self._cargar_complementarios(datos)
+        indice = complementarios['similitud']
+        if indice is None:
+            with datos.lock_complementarios:
+                indice = complementarios['similitud']
+                if indice is None:
+                    indice = IndiceSimilitud(datos.filas_df, complementarios['plagas_df'])
+                    complementarios['similitud'] = indice
+        return indice
+    
+    def _datos_vigentes(self):
+        """Instantánea vigente de los datos (error si no se pudieron cargar)."""
+        datos = self._datos
+        if datos is None:
+            raise RuntimeError("Los datos del modelo no están cargados")
+        return datos
+    
+    @property
+    def version_datos(self):
+        """Versión de los datos cargados (0 si aún no se cargaron)."""
+        datos = self._datos
+        return datos.version if datos is not None else 0
+    
+    @property
+    def matriz(self):
+        """Matriz de cultivos de la instantánea vigente."""
+        datos = self._datos
+        return datos.matriz if datos is not None else None
+    
+    def _tabla(self, tabla):
+        """DataFrame de una tabla principal de la instantánea vigente."""
+        datos = self._datos
+        return datos.tablas[tabla] if datos is not None else None
+    
+    @property
+    def cultivos_df(self):
+        """Cultivos."""
+        return self._tabla('cultivos')
+    
+    @property
+    def condiciones_df(self):
+        """Condiciones agroclimáticas de los cultivos."""
+        return self._tabla('condiciones')
+    
+    @property
+    def costos_df(self):
+        """Costos y precios de los cultivos."""
+        return self._tabla('costos')
+    
+    @property
+    def zonas_df(self):
+        """Zonas de producción."""
+        return self._tabla('zonas')
+    
+    @property
+    def cultivo_zona_df(self):
+        """Relación entre cultivos y zonas."""
+        return self._tabla('cultivo_zona')
+    
+    def _complementario(self, nombre):
+        """DataFrame complementario de la instantánea vigente (lo carga si hace falta)."""
+        datos = self._datos
+        return self._cargar_complementarios(datos)[nombre] if datos is not None else None
+    
+    @property
+    def plagas_df(self):
+        """Plagas y enfermedades de cada cultivo."""
+        return self._complementario('plagas_df')
+    
+    @property
+    def insumos_cultivo_df(self):
+        """Insumos requeridos por cada cultivo."""
+        return self._complementario('insumos_cultivo_df')
+    
+    @property
+    def tecnicas_cultivo_df(self):
+        """Técnicas recomendadas para cada cultivo."""
+        return self._complementario('tecnicas_cultivo_df')
+    
+    @property
+    def certificaciones_cultivo_df(self):
+        """Certificaciones aplicables a cada cultivo."""
+        return self._complementario('certificaciones_cultivo_df')
+    
     def recomendar_cultivos(self, parametros_usuario):
         """
         Recomienda cultivos basados en los parámetros proporcionados por el usuario.
@@ -84,367 +671,806 @@ class ModeloRecomendacionCultivos:
                 - precipitacion (float): Precipitación anual en mm
                 - altitud (int): Altitud en msnm
                 - tipo_suelo (str, opcional): Tipo de suelo
+                - modo_suelo (str, opcional): 'cualquiera' (por defecto) para aceptar cultivos
+                  con alguna de las palabras de tipo_suelo, o 'todas' para exigirlas todas
                 - ph_suelo (float, opcional): pH del suelo
                 - area_disponible (float, opcional): Área disponible en hectáreas
                 - presupuesto (float, opcional): Presupuesto disponible en COP
                 - experiencia (str, opcional): Nivel de experiencia ('Baja', 'Media', 'Alta')
                 - departamento (str, opcional): Departamento de Colombia
+                - id_zona (int, opcional): Zona de producción (tabla zonas)
                 - preferencia_mercado (str, opcional): Preferencia de mercado ('Local', 'Exportación')
                 - tiempo_disponible (int, opcional): Tiempo disponible en días
         
         Returns:
-            list: Lista de diccionarios con las recomendaciones de cultivos
+            list: Lista de diccionarios con las recomendaciones de cultivos. Con caché,
+                el resultado puede compartirse entre solicitudes y no debe modificarse.
+        """
+        self._validar_parametros(parametros_usuario)
+        
+        # La solicitud completa usa la instantánea vigente al empezar
+        datos = self._datos_vigentes()
+        
+        # Perfiles cubiertos por la tabla precalculada: se responden sin puntuar
+        if self.tabla_climatica is not None:
+            encontrado = self.tabla_climatica.buscar(parametros_usuario, datos)
+            _CONSULTAS_CACHE['tabla_climatica', encontrado is not None].inc()
+            if encontrado is not None:
+                return self._preparar_resultados_detallados(datos, *encontrado)
+        
+        if self.cache is None:
+            if self.agrupador is None:
+                return self._recomendar(datos, parametros_usuario)
+            # Sin caché solo se agrupan perfiles con los mismos valores, sin cuantizar
+            clave, parametros_canonicos = canonizar(parametros_usuario)
+            return self.agrupador.ejecutar((clave, datos.version),
+                                           lambda: self._recomendar(datos, parametros_canonicos))
+        
+        # Con caché, el resultado se calcula sobre los parámetros canónicos (cuantizados
+        # solo si la caché lo indica) para que todos los perfiles con la misma clave
+        # reciban la misma respuesta
+        clave, parametros_canonicos = self.cache.canonizar(parametros_usuario)
+        version = datos.version
+        
+        resultados = self.cache.obtener(clave, version)
+        _CONSULTAS_CACHE['recomendaciones', resultados is not None].inc()
+        if resultados is None:
+            if self.agrupador is None:
+                resultados = self._recomendar_y_guardar(datos, clave, parametros_canonicos)
+            else:
+                # Las solicitudes que llegan mientras se calcula esperan ese resultado
+                resultados = self.agrupador.ejecutar(
+                    (clave, version), lambda: self._recomendar_y_guardar(datos, clave, parametros_canonicos)
+                )
+        
+        return resultados
+    
+    def _recomendar_y_guardar(self, datos, clave, parametros_canonicos):
+        """Calcula las recomendaciones de un perfil canónico y las guarda en la caché."""
+        resultados = self._recomendar(datos, parametros_canonicos)
+        self.cache.guardar(clave, resultados, datos.version)
+        return resultados
+    
+    def _recomendar(self, datos, parametros_usuario):
+        """Calcula las recomendaciones detalladas de un perfil ya validado."""
+        # Un solo perfil se evalúa como un bloque de tamaño 1
+        mejores, con_costos = self._puntuar_bloque(datos, [parametros_usuario])
+        filas, puntuaciones = mejores[0]
+        
+        # Preparar resultados detallados
+        return self._preparar_resultados_detallados(
+            datos, filas, puntuaciones.tolist(), con_costos[0], self._zona_de_perfil(datos, parametros_usuario)
+        )
+    
+    def recomendar_cultivos_lote(self, lista_parametros, tamano_bloque=None, detallado=True):
+        """
+        Recomienda cultivos para muchos perfiles de finca en pasadas vectorizadas.
+        
+        Los perfiles se consumen por bloques desde cualquier iterable, de modo que
+        la entrada y la salida nunca necesitan estar completas en memoria.
+        
+        Args:
+            lista_parametros (iterable): Diccionarios con el mismo formato que
+                `recomendar_cultivos`
+            tamano_bloque (int, opcional): Perfiles evaluados por pasada; por defecto
+                se ajusta al tamaño de la matriz de cultivos
+            detallado (bool): Si es False, cada recomendación solo incluye
+                id_cultivo, nombre y puntuación
+            
+        Yields:
+            dict: {'indice': i, 'recomendaciones': [...]} o {'indice': i, 'error': mensaje}
         """
-        # Extraer parámetros obligatorios
-        temperatura = parametros_usuario.get('temperatura')
-        precipitacion = parametros_usuario.get('precipitacion')
-        altitud = parametros_usuario.get('altitud')
+        # Todo el lote se evalúa con la instantánea vigente al empezar
+        datos = self._datos_vigentes()
+        matriz = datos.matriz
+        
+        if tamano_bloque is None:
+            tamano_bloque = max(1, min(MAX_PERFILES_POR_BLOQUE, ELEMENTOS_POR_BLOQUE // len(matriz['id_cultivo'])))
+        
+        iterador = iter(lista_parametros)
+        indice = 0
+        
+        while True:
+            bloque = list(itertools.islice(iterador, tamano_bloque))
+            if not bloque:
+                return
+            
+            # Separar perfiles inválidos para no interrumpir el bloque completo
+            errores = {}
+            validos = []
+            for posicion, parametros in enumerate(bloque):
+                try:
+                    self._validar_parametros(parametros)
+                    validos.append(parametros)
+                except ValueError as e:
+                    errores[posicion] = str(e)
+            
+            if validos:
+                mejores, con_costos = self._puntuar_bloque(datos, validos)
+            
+            j = 0
+            for posicion in range(len(bloque)):
+                if posicion in errores:
+                    yield {'indice': indice, 'error': errores[posicion]}
+                else:
+                    filas, puntuaciones = mejores[j]
+                    if detallado:
+                        recomendaciones = self._preparar_resultados_detallados(
+                            datos, filas, puntuaciones.tolist(), con_costos[j],
+                            self._zona_de_perfil(datos, validos[j])
+                        )
+                    else:
+                        recomendaciones = [
+                            {
+                                'id_cultivo': int(matriz['id_cultivo'][fila]),
+                                'nombre': matriz['nombre'][fila],
+                                'puntuacion': round(float(puntuacion), 2)
+                            }
+                            for fila, puntuacion in zip(filas, puntuaciones)
+                        ]
+                    yield {'indice': indice, 'recomendaciones': recomendaciones}
+                    j += 1
+                indice += 1
+    
+    @staticmethod
+    def _validar_parametros(parametros_usuario):
+        """Verifica que un perfil tenga los parámetros obligatorios y valores numéricos válidos."""
+        if not isinstance(parametros_usuario, dict):
+            raise ValueError("Los parámetros deben ser un diccionario")
         
-        if temperatura is None or precipitacion is None or altitud is None:
+        if any(parametros_usuario.get(clave) is None for clave in PARAMETROS_OBLIGATORIOS):
             raise ValueError("Los parámetros temperatura, precipitación y altitud son obligatorios")
         
-        # Filtrar cultivos por condiciones básicas
-        cultivos_filtrados = self._filtrar_por_condiciones_basicas(temperatura, precipitacion, altitud)
+        for clave in PARAMETROS_OBLIGATORIOS + PARAMETROS_NUMERICOS:
+            valor = parametros_usuario.get(clave)
+            if valor is not None:
+                try:
+                    float(valor)
+                except (TypeError, ValueError):
+                    raise ValueError(f"El parámetro {clave} debe ser numérico")
+        
+        modo_suelo = parametros_usuario.get('modo_suelo')
+        if modo_suelo and str(modo_suelo).lower() not in MODOS_SUELO:
+            raise ValueError(f"El parámetro modo_suelo debe ser uno de: {', '.join(MODOS_SUELO)}")
+    
+    def _puntuar_bloque(self, datos, lista_parametros):
+        """
+        Filtra y puntúa un bloque de N perfiles y selecciona los 10 mejores de cada uno.
         
-        # Si hay parámetros adicionales, refinar la búsqueda
-        if 'tipo_suelo' in parametros_usuario and parametros_usuario['tipo_suelo']:
-            cultivos_filtrados = self._filtrar_por_tipo_suelo(cultivos_filtrados, parametros_usuario['tipo_suelo'])
+        Returns:
+            tuple: (lista de pares (filas, puntuaciones) con los 10 mejores de cada
+                perfil, arreglo booleano que indica si cada resultado incluye costos)
+        """
+        puntuacion, con_costos = self._evaluar_bloque(datos, lista_parametros)
+        
+        # Ordenar por puntuación y seleccionar los mejores (orden estable ante empates)
+        inicio = time.perf_counter()
+        orden = np.argsort(-puntuacion, axis=1, kind='stable')[:, :10]
+        puntuaciones_orden = np.take_along_axis(puntuacion, orden, axis=1)
+        
+        mejores = []
+        for filas, puntuaciones in zip(orden, puntuaciones_orden):
+            seleccionadas = puntuaciones > -np.inf
+            mejores.append((filas[seleccionadas], puntuaciones[seleccionadas]))
+        _medir_etapa('seleccion', inicio)
+        
+        return mejores, con_costos[:, 0]
+    
+    def _evaluar_bloque(self, datos, lista_parametros):
+        """
+        Filtra y puntúa un bloque de N perfiles contra las M filas de la matriz.
         
-        if 'ph_suelo' in parametros_usuario and parametros_usuario['ph_suelo']:
-            cultivos_filtrados = self._filtrar_por_ph(cultivos_filtrados, parametros_usuario['ph_suelo'])
+        Cada filtro opcional se aplica como máscara solo a los perfiles que lo
+        especifican, conservando las reglas de relajación de cada filtro por perfil.
         
-        if 'presupuesto' in parametros_usuario and parametros_usuario['presupuesto']:
-            cultivos_filtrados = self._filtrar_por_presupuesto(cultivos_filtrados, parametros_usuario['presupuesto'])
+        Returns:
+            tuple: (puntuaciones N x M, con -inf en las filas descartadas; columna
+                N x 1 que indica si cada resultado incluye costos)
+        """
+        temperatura = self._parametro_numerico(lista_parametros, 'temperatura', opcional=False)
+        precipitacion = self._parametro_numerico(lista_parametros, 'precipitacion', opcional=False)
+        altitud = self._parametro_numerico(lista_parametros, 'altitud', opcional=False)
         
-        if 'tiempo_disponible' in parametros_usuario and parametros_usuario['tiempo_disponible']:
-            cultivos_filtrados = self._filtrar_por_tiempo(cultivos_filtrados, parametros_usuario['tiempo_disponible'])
+        # Filtrar cultivos por condiciones básicas (cada etapa registra su duración y candidatos)
+        inicio = time.perf_counter()
+        mascara = self._filtrar_por_condiciones_basicas(datos, temperatura, precipitacion, altitud)
+        inicio = _medir_etapa('condiciones_basicas', inicio, mascara)
         
-        if 'departamento' in parametros_usuario and parametros_usuario['departamento']:
-            cultivos_filtrados = self._ajustar_por_zona(cultivos_filtrados, parametros_usuario['departamento'])
+        # Indica, por perfil, si los datos de costos forman parte del resultado
+        con_costos = np.zeros((len(lista_parametros), 1), dtype=bool)
         
-        if 'preferencia_mercado' in parametros_usuario and parametros_usuario['preferencia_mercado']:
-            cultivos_filtrados = self._ajustar_por_mercado(cultivos_filtrados, parametros_usuario['preferencia_mercado'])
+        # Si hay parámetros adicionales, refinar la búsqueda
+        tipos_suelo = self._parametro_texto(lista_parametros, 'tipo_suelo')
+        if any(tipos_suelo):
+            modos_suelo = self._parametro_texto(lista_parametros, 'modo_suelo')
+            mascara = self._filtrar_por_tipo_suelo(datos, mascara, tipos_suelo, modos_suelo)
+            inicio = _medir_etapa('tipo_suelo', inicio, mascara)
+        
+        ph_suelo = self._parametro_numerico(lista_parametros, 'ph_suelo')
+        if not np.isnan(ph_suelo).all():
+            mascara = self._filtrar_por_ph(datos, mascara, ph_suelo)
+            inicio = _medir_etapa('ph', inicio, mascara)
+        
+        presupuesto = self._parametro_numerico(lista_parametros, 'presupuesto')
+        if not np.isnan(presupuesto).all():
+            mascara = self._filtrar_por_presupuesto(datos, mascara, presupuesto)
+            con_costos |= ~np.isnan(presupuesto)
+            inicio = _medir_etapa('presupuesto', inicio, mascara)
+        
+        tiempo_disponible = self._parametro_numerico(lista_parametros, 'tiempo_disponible')
+        if not np.isnan(tiempo_disponible).all():
+            mascara = self._filtrar_por_tiempo(datos, mascara, tiempo_disponible)
+            inicio = _medir_etapa('tiempo', inicio, mascara)
+        
+        departamentos = self._parametro_texto(lista_parametros, 'departamento')
+        if any(departamentos):
+            claves = [normalizar_departamento(d) if d else None for d in departamentos]
+            mascara = self._ajustar_por_zona(mascara, claves, datos.indice_zonas['departamentos'])
+            inicio = _medir_etapa('departamento', inicio, mascara)
+        
+        ids_zona = self._parametro_numerico(lista_parametros, 'id_zona')
+        if not np.isnan(ids_zona).all():
+            claves = [None if np.isnan(z) else int(z) for z in ids_zona[:, 0]]
+            mascara = self._ajustar_por_zona(mascara, claves, datos.indice_zonas['zonas'])
+            inicio = _medir_etapa('zona', inicio, mascara)
+        
+        mercados = self._parametro_texto(lista_parametros, 'preferencia_mercado')
+        if any(mercados):
+            mascara, con_costos = self._ajustar_por_mercado(datos, mascara, mercados, con_costos)
+            inicio = _medir_etapa('mercado', inicio, mascara)
         
         # Calcular puntuación de compatibilidad
-        cultivos_puntuados = self._calcular_puntuacion(cultivos_filtrados, parametros_usuario)
+        puntuacion = self._calcular_puntuacion(datos, mascara, lista_parametros, con_costos)
+        _medir_etapa('puntuacion', inicio)
         
-        # Ordenar por puntuación y seleccionar los mejores
-        cultivos_recomendados = cultivos_puntuados.sort_values('puntuacion', ascending=False).head(10)
+        return puntuacion, con_costos
+    
+    @staticmethod
+    def _parametro_numerico(lista_parametros, clave, opcional=True):
+        """
+        Extrae un parámetro numérico de cada perfil como columna N x 1.
         
-        # Preparar resultados detallados
-        resultados = self._preparar_resultados_detallados(cultivos_recomendados)
+        Los parámetros opcionales ausentes (o vacíos) se representan con NaN.
+        """
+        if opcional:
+            valores = [parametros.get(clave) or np.nan for parametros in lista_parametros]
+        else:
+            valores = [parametros[clave] for parametros in lista_parametros]
+        return np.array(valores, dtype=np.float64).reshape(-1, 1)
+    
+    @staticmethod
+    def _parametro_texto(lista_parametros, clave):
+        """Extrae un parámetro de texto de cada perfil (None si no se especifica)."""
+        return [parametros.get(clave) or None for parametros in lista_parametros]
+    
+    def _construir_matriz(self, datos):
+        """
+        Construye la matriz de cultivos usada para filtrar y puntuar.
         
-        return resultados
+        Cada fila corresponde a una fila de `condiciones` unida con su cultivo y sus
+        costos; cada columna es un arreglo NumPy contiguo, de modo que los filtros y
+        la puntuación se resuelven como operaciones vectorizadas sin merges por solicitud.
+        """
+        tablas = datos.tablas
+        filas = pd.merge(tablas['cultivos'], tablas['condiciones'], on='id_cultivo')
+        costos = tablas['costos'].drop_duplicates('id_cultivo')
+        filas_df = pd.merge(filas, costos, on='id_cultivo', how='left').reset_index(drop=True)
+        
+        def columna(nombre):
+            return np.ascontiguousarray(pd.to_numeric(filas_df[nombre], errors='coerce'), dtype=np.float64)
+        
+        matriz = {'id_cultivo': np.ascontiguousarray(filas_df['id_cultivo'], dtype=np.int64)}
+        for nombre in ('temp_min', 'temp_max', 'precipitacion_min', 'precipitacion_max',
+                       'altitud_min', 'altitud_max', 'ph_min', 'ph_max', 'ciclo_dias',
+                       'inversion_min', 'rentabilidad'):
+            matriz[nombre] = columna(nombre)
+        
+        # Puntos óptimos (promedio de mínimo y máximo) de temperatura, precipitación
+        # y altitud, apilados en un bloque 3 x filas para puntuar en una sola operación
+        matriz['optimos'] = np.ascontiguousarray([
+            (matriz['temp_min'] + matriz['temp_max']) / 2,
+            (matriz['precipitacion_min'] + matriz['precipitacion_max']) / 2,
+            (matriz['altitud_min'] + matriz['altitud_max']) / 2
+        ])
+        
+        # Indicadores de disponibilidad de costos y precios
+        matriz['tiene_costos'] = filas_df['id_costo'].notna().to_numpy()
+        # Fila 0: precio interno (mercado local); fila 1: precio de exportación
+        matriz['tiene_precio'] = np.ascontiguousarray([
+            filas_df['precio_interno'].notna().to_numpy(),
+            filas_df['precio_export'].notna().to_numpy()
+        ])
+        
+        # Dificultad de manejo codificada como índice de NIVELES_DIFICULTAD
+        matriz['dificultad'] = np.array(
+            [NIVELES_DIFICULTAD.index(DIFICULTAD_CULTIVOS.get(nombre, 'Media')) for nombre in filas_df['nombre']],
+            dtype=np.int8
+        )
+        
+        matriz['nombre'] = filas_df['nombre'].to_numpy(dtype=object)
+        
+        # La matriz se comparte entre solicitudes (y entre versiones si sus tablas
+        # no cambian), así que sus arreglos son de solo lectura
+        for arreglo in matriz.values():
+            arreglo.flags.writeable = False
+        
+        datos.filas_df = filas_df
+        datos.matriz = matriz
+        
+        # Índice invertido palabra normalizada -> filas cuyo tipo de suelo la contiene
+        filas_por_palabra = {}
+        for fila, tipo_suelo in enumerate(filas_df['tipo_suelo']):
+            if isinstance(tipo_suelo, str):
+                for palabra in set(tokenizar(tipo_suelo)):
+                    filas_por_palabra.setdefault(palabra, []).append(fila)
+        datos.indice_suelo = {palabra: np.array(filas, dtype=np.intp) for palabra, filas in filas_por_palabra.items()}
+        datos.coincidencias_suelo = {}
+        
+        # Índice de zonas: departamento o id_zona -> filas de cultivos presentes y estadísticas
+        datos.indice_zonas = self._construir_indice_zonas(tablas['zonas'], tablas['cultivo_zona'], matriz['id_cultivo'])
+        
+        # Índices de intervalos para catálogos grandes (temperatura, precipitación, altitud)
+        if self.umbral_indice is not None and len(matriz['id_cultivo']) >= self.umbral_indice:
+            datos.indices_condiciones = tuple(
+                IndiceIntervalos(matriz[minimo], matriz[maximo])
+                for minimo, maximo in (('temp_min', 'temp_max'),
+                                       ('precipitacion_min', 'precipitacion_max'),
+                                       ('altitud_min', 'altitud_max'))
+            )
+        else:
+            datos.indices_condiciones = None
     
-    def _filtrar_por_condiciones_basicas(self, temperatura, precipitacion, altitud):
+    def _filtrar_por_condiciones_basicas(self, datos, temperatura, precipitacion, altitud):
         """
         Filtra cultivos que se adaptan a las condiciones básicas proporcionadas.
+        
+        Args:
+            temperatura, precipitacion, altitud: Valores escalares o columnas N x 1
+            
+        Returns:
+            numpy.ndarray: Máscara booleana (N x M) sobre las filas de la matriz de cultivos
         """
-        # Unir tablas de cultivos y condiciones
-        df = pd.merge(self.cultivos_df, self.condiciones_df, on='id_cultivo')
+        if datos.indices_condiciones is not None:
+            return self._filtrar_con_indice(datos, temperatura, precipitacion, altitud)
         
-        # Filtrar por temperatura
-        df_temp = df[(df['temp_min'] <= temperatura) & (df['temp_max'] >= temperatura)]
+        m = datos.matriz
         
-        # Si no hay resultados, relajar un poco el filtro de temperatura
-        if len(df_temp) == 0:
-            margen = 2.0  # Margen de tolerancia en °C
-            df_temp = df[(df['temp_min'] - margen <= temperatura) & (df['temp_max'] + margen >= temperatura)]
+        # Filtrar por temperatura; si no hay resultados, relajar con el margen de tolerancia
+        mascara = self._mascara_rango(m['temp_min'], m['temp_max'], temperatura, MARGEN_TEMPERATURA,
+                                      condicion='temperatura')
         
-        # Filtrar por precipitación
-        df_precip = df_temp[(df_temp['precipitacion_min'] <= precipitacion) & 
-                            (df_temp['precipitacion_max'] >= precipitacion)]
+        # Filtrar por precipitación; si no hay resultados, relajar con el margen de tolerancia
+        mascara = self._mascara_rango(m['precipitacion_min'], m['precipitacion_max'], precipitacion,
+                                      MARGEN_PRECIPITACION, mascara, condicion='precipitacion')
         
-        # Si no hay resultados, relajar un poco el filtro de precipitación
-        if len(df_precip) == 0:
-            margen = 200  # Margen de tolerancia en mm
-            df_precip = df_temp[(df_temp['precipitacion_min'] - margen <= precipitacion) & 
-                               (df_temp['precipitacion_max'] + margen >= precipitacion)]
+        # Filtrar por altitud; si no hay resultados, relajar con el margen de tolerancia
+        mascara = self._mascara_rango(m['altitud_min'], m['altitud_max'], altitud, MARGEN_ALTITUD, mascara,
+                                      condicion='altitud')
         
-        # Filtrar por altitud
-        df_alt = df_precip[(df_precip['altitud_min'] <= altitud) & 
-                          (df_precip['altitud_max'] >= altitud)]
+        return mascara
+    
+    def _filtrar_con_indice(self, datos, temperatura, precipitacion, altitud):
+        """
+        Variante de `_filtrar_por_condiciones_basicas` que resuelve cada perfil con
+        consultas al índice de intervalos e intersecciones de bitsets.
+        """
+        indice_temp, indice_precip, indice_alt = datos.indices_condiciones
         
-        # Si no hay resultados, relajar un poco el filtro de altitud
-        if len(df_alt) == 0:
-            margen = 200  # Margen de tolerancia en msnm
-            df_alt = df_precip[(df_precip['altitud_min'] - margen <= altitud) & 
-                             (df_precip['altitud_max'] + margen >= altitud)]
+        mascaras = []
+        for t, p, a in zip(np.ravel(temperatura), np.ravel(precipitacion), np.ravel(altitud)):
+            bits = self._consultar_rango(indice_temp, t, MARGEN_TEMPERATURA, condicion='temperatura')
+            bits = self._consultar_rango(indice_precip, p, MARGEN_PRECIPITACION, bits, condicion='precipitacion')
+            bits = self._consultar_rango(indice_alt, a, MARGEN_ALTITUD, bits, condicion='altitud')
+            mascaras.append(indice_temp.a_mascara(bits))
         
-        return df_alt
+        return np.array(mascaras)
     
-    def _filtrar_por_tipo_suelo(self, df, tipo_suelo):
-        """Filtra cultivos por tipo de suelo."""
-        # Búsqueda flexible por palabras clave en el tipo de suelo
-        palabras_clave = tipo_suelo.lower().split()
+    @staticmethod
+    def _consultar_rango(indice, valor, margen, base=None, condicion=None):
+        """Equivalente de `_mascara_rango` sobre bitsets del índice de intervalos."""
+        bits = indice.consultar(valor)
+        if base is not None:
+            bits &= base
+        
+        if not bits.any():
+            if condicion is not None:
+                _RELAJACIONES[condicion].inc()
+            bits = indice.consultar(valor, margen)
+            if base is not None:
+                bits &= base
+        
+        return bits
+    
+    @staticmethod
+    def _mascara_rango(minimos, maximos, valor, margen, base=None, condicion=None):
+        """
+        Selecciona las filas cuyo rango [minimo, maximo] contiene el valor dado.
         
-        # Crear una máscara para cada palabra clave
-        mascara = df['tipo_suelo'].str.lower().apply(
-            lambda x: any(palabra in x for palabra in palabras_clave) if isinstance(x, str) else False
-        )
+        Para cada perfil en el que ninguna fila de `base` contiene el valor, repite
+        la búsqueda con el rango ampliado por `margen` a cada lado y, si se indica
+        `condicion`, lo cuenta en la métrica de relajaciones.
+        """
+        mascara = (minimos <= valor) & (maximos >= valor)
+        if base is not None:
+            mascara &= base
+        
+        vacias = ~mascara.any(axis=-1, keepdims=True)
+        if vacias.any():
+            if condicion is not None:
+                _RELAJACIONES[condicion].inc(int(np.count_nonzero(vacias)))
+            relajada = (minimos - margen <= valor) & (maximos + margen >= valor)
+            if base is not None:
+                relajada &= base
+            mascara = np.where(vacias, relajada, mascara)
+        
+        return mascara
+    
+    def _filtrar_por_tipo_suelo(self, datos, mascara, tipos_suelo, modos_suelo=None):
+        """
+        Filtra cultivos por tipo de suelo.
+        
+        Args:
+            mascara (numpy.ndarray): Selección actual (N x M)
+            tipos_suelo (list): Tipo de suelo de cada perfil (None si no se especifica)
+            modos_suelo (list, opcional): Modo de cada perfil, 'cualquiera' (por defecto)
+                o 'todas' las palabras clave
+        """
+        if modos_suelo is None:
+            modos_suelo = [None] * len(tipos_suelo)
+        
+        coincide = np.ones_like(mascara)
+        coincidencias = {}
+        
+        for i, (tipo_suelo, modo) in enumerate(zip(tipos_suelo, modos_suelo)):
+            if tipo_suelo:
+                clave = (tipo_suelo, modo)
+                if clave not in coincidencias:
+                    coincidencias[clave] = self._coincidencias_suelo(datos, tipo_suelo, modo)
+                coincide[i] = coincidencias[clave]
+        
+        # Si no hay resultados para un perfil, mantener su selección original
+        filtrado = mascara & coincide
+        return np.where(filtrado.any(axis=1, keepdims=True), filtrado, mascara)
+    
+    def _coincidencias_suelo(self, datos, tipo_suelo, modo=None):
+        """Filas cuyo tipo de suelo contiene alguna (o todas) las palabras clave."""
+        # Búsqueda flexible: las palabras clave se separan solo por espacios y cada una
+        # puede ser parte del tipo de suelo (p. ej. 'franco-arenoso' es una sola clave)
+        mascaras = [self._filas_con_palabra(datos, palabra) for palabra in normalizar_texto(tipo_suelo).split()]
         
-        df_filtrado = df[mascara]
+        if not mascaras:
+            return np.zeros(len(datos.matriz['id_cultivo']), dtype=bool)
         
-        # Si no hay resultados, devolver el dataframe original
-        if len(df_filtrado) == 0:
-            return df
+        if modo is not None and modo.lower() == 'todas':
+            return np.logical_and.reduce(mascaras)
         
-        return df_filtrado
+        return np.logical_or.reduce(mascaras)
     
-    def _filtrar_por_ph(self, df, ph_suelo):
+    def _filas_con_palabra(self, datos, palabra):
+        """Máscara de filas cuyo tipo de suelo contiene `palabra`."""
+        coincide = datos.coincidencias_suelo.get(palabra)
+        
+        if coincide is None:
+            if _PALABRA.fullmatch(palabra):
+                # Sin signos, la clave solo puede estar dentro de una palabra del suelo
+                coincide = np.zeros(len(datos.matriz['id_cultivo']), dtype=bool)
+                for palabra_suelo, filas in datos.indice_suelo.items():
+                    if palabra in palabra_suelo:
+                        coincide[filas] = True
+            else:
+                # Con signos (p. ej. 'franco-arenoso') se busca en el texto completo
+                coincide = np.array([
+                    isinstance(tipo_suelo, str) and palabra in normalizar_texto(tipo_suelo)
+                    for tipo_suelo in datos.filas_df['tipo_suelo']
+                ], dtype=bool)
+            if len(datos.coincidencias_suelo) < MAX_COINCIDENCIAS_SUELO:
+                datos.coincidencias_suelo[palabra] = coincide
+        
+        return coincide
+    
+    def _filtrar_por_ph(self, datos, mascara, ph_suelo):
         """Filtra cultivos por pH del suelo."""
-        return df[(df['ph_min'] <= ph_suelo) & (df['ph_max'] >= ph_suelo)]
+        m = datos.matriz
+        filtrado = mascara & (m['ph_min'] <= ph_suelo) & (m['ph_max'] >= ph_suelo)
+        return np.where(np.isnan(ph_suelo), mascara, filtrado)
     
-    def _filtrar_por_presupuesto(self, df, presupuesto):
-        """Filtra cultivos por presupuesto disponible."""
-        # Unir con tabla de costos
-        df_con_costos = pd.merge(df, self.costos_df, on='id_cultivo')
-        
-        # Filtrar por inversión mínima
-        df_filtrado = df_con_costos[df_con_costos['inversion_min'] <= presupuesto]
-        
-        return df_filtrado
+    def _filtrar_por_presupuesto(self, datos, mascara, presupuesto):
+        """Filtra cultivos por presupuesto disponible (inversión mínima)."""
+        m = datos.matriz
+        filtrado = mascara & m['tiene_costos'] & (m['inversion_min'] <= presupuesto)
+        return np.where(np.isnan(presupuesto), mascara, filtrado)
     
-    def _filtrar_por_tiempo(self, df, tiempo_disponible):
+    def _filtrar_por_tiempo(self, datos, mascara, tiempo_disponible):
         """Filtra cultivos por tiempo disponible."""
         # Convertir tiempo a días si es necesario
         tiempo_dias = tiempo_disponible
         
         # Filtrar por ciclo de cultivo
-        df_filtrado = df[df['ciclo_dias'] <= tiempo_dias]
-        
-        return df_filtrado
+        filtrado = mascara & (datos.matriz['ciclo_dias'] <= tiempo_dias)
+        return np.where(np.isnan(tiempo_dias), mascara, filtrado)
     
-    def _ajustar_por_zona(self, df, departamento):
-        """Ajusta recomendaciones según la zona geográfica."""
-        # Buscar zonas que coincidan con el departamento
-        zonas_dept = self.zonas_df[self.zonas_df['departamento'].str.lower() == departamento.lower()]
-        
-        if len(zonas_dept) == 0:
-            return df  # Si no hay zonas específicas, mantener recomendaciones originales
+    def _ajustar_por_zona(self, mascara, claves, indice):
+        """
+        Ajusta recomendaciones según la zona geográfica.
         
-        # Obtener cultivos populares en esas zonas
-        ids_zonas = zonas_dept['id_zona'].tolist()
-        cultivos_zona = self.cultivo_zona_df[self.cultivo_zona_df['id_zona'].isin(ids_zonas)]
+        Args:
+            mascara (numpy.ndarray): Selección actual (N x M)
+            claves (list): Departamento normalizado o id_zona de cada perfil (None si
+                no se especifica)
+            indice (dict): Entradas del índice de zonas para ese tipo de clave
+        """
+        coincide = np.ones_like(mascara)
         
-        # Unir con el dataframe filtrado y ajustar puntuación
-        df_con_zona = pd.merge(df, cultivos_zona, on='id_cultivo', how='left')
+        for i, clave in enumerate(claves):
+            # Si no hay zonas específicas, mantener recomendaciones originales
+            entrada = indice.get(clave) if clave is not None else None
+            if entrada is not None:
+                coincide[i] = entrada[0]
         
-        # Si un cultivo está en la zona, se mantiene; si no, se filtra
-        df_filtrado = df_con_zona[~df_con_zona['id_zona'].isna()]
+        # Si un cultivo está en la zona, se mantiene; si no quedan cultivos, devolver el original
+        filtrado = mascara & coincide
+        return np.where(filtrado.any(axis=1, keepdims=True), filtrado, mascara)
+    
+    def _zona_de_perfil(self, datos, parametros_usuario):
+        """Entrada del índice de zonas de un perfil (la zona tiene prioridad sobre el departamento)."""
+        id_zona = parametros_usuario.get('id_zona')
+        if id_zona:
+            entrada = datos.indice_zonas['zonas'].get(int(float(id_zona)))
+            if entrada is not None:
+                return entrada
+        
+        departamento = parametros_usuario.get('departamento')
+        if departamento:
+            return datos.indice_zonas['departamentos'].get(normalizar_departamento(departamento))
+        
+        return None
+    
+    @staticmethod
+    def _construir_indice_zonas(zonas_df, cultivo_zona_df, ids_filas):
+        """
+        Construye el índice de zonas: departamento normalizado o id_zona -> (máscara
+        de filas de la matriz con cultivos presentes, popularidad máxima y rendimiento
+        promedio de cada fila en esas zonas).
         
-        # Si no quedan cultivos, devolver el original
-        if len(df_filtrado) == 0:
-            return df
+        Los departamentos con zonas pero sin cultivos registrados tienen una máscara
+        vacía; los que no tienen zonas no aparecen en el índice.
+        """
+        zonas = zonas_df[['id_zona', 'departamento']].copy()
+        zonas['clave'] = [normalizar_departamento(d) if isinstance(d, str) else None for d in zonas['departamento']]
         
-        return df_filtrado
-    
-    def _ajustar_por_mercado(self, df, preferencia_mercado):
-        """Ajusta recomendaciones según preferencia de mercado."""
-        # Unir con tabla de costos para obtener información de precios
-        df_con_costos = pd.merge(df, self.costos_df, on='id_cultivo')
+        relaciones = cultivo_zona_df[['id_cultivo', 'id_zona', 'rendimiento', 'popularidad']].merge(
+            zonas[['id_zona', 'clave']], on='id_zona'
+        )
+        relaciones['rendimiento'] = pd.to_numeric(relaciones['rendimiento'], errors='coerce')
+        relaciones['popularidad'] = pd.to_numeric(relaciones['popularidad'], errors='coerce')
         
-        if preferencia_mercado.lower() == 'exportación':
-            # Priorizar cultivos con precio de exportación
-            df_filtrado = df_con_costos[~df_con_costos['precio_export'].isna()]
-            
-            # Si no hay cultivos de exportación, mantener los originales
-            if len(df_filtrado) == 0:
-                return df
-            
-            return df_filtrado
-        else:  # Mercado local
-            # Priorizar cultivos con precio interno
-            df_filtrado = df_con_costos[~df_con_costos['precio_interno'].isna()]
-            
-            # Si no hay cultivos para mercado local, mantener los originales
-            if len(df_filtrado) == 0:
-                return df
-            
-            return df_filtrado
+        def entradas(grupos, claves):
+            indice = {}
+            estadisticas = relaciones.groupby([grupos, 'id_cultivo']).agg(
+                popularidad=('popularidad', 'max'), rendimiento=('rendimiento', 'mean')
+            )
+            for clave in claves:
+                if clave is None or clave in indice:
+                    continue
+                if clave in estadisticas.index.get_level_values(0):
+                    por_cultivo = estadisticas.loc[clave]
+                else:
+                    por_cultivo = estadisticas.iloc[:0].droplevel(0)
+                mascara = np.isin(ids_filas, por_cultivo.index.to_numpy())
+                popularidad = por_cultivo['popularidad'].reindex(ids_filas).to_numpy(dtype=np.float64)
+                rendimiento = por_cultivo['rendimiento'].reindex(ids_filas).to_numpy(dtype=np.float64)
+                for arreglo in (mascara, popularidad, rendimiento):
+                    arreglo.flags.writeable = False
+                indice[clave] = (mascara, popularidad, rendimiento)
+            return indice
+        
+        return {
+            'departamentos': entradas('clave', zonas['clave'].tolist()),
+            'zonas': entradas('id_zona', zonas['id_zona'].tolist())
+        }
     
-    def _calcular_puntuacion(self, df, parametros_usuario):
+    def _ajustar_por_mercado(self, datos, mascara, preferencias_mercado, con_costos):
         """
-        Calcula una puntuación de compatibilidad para cada cultivo.
+        Ajusta recomendaciones según preferencia de mercado.
+        
+        Returns:
+            tuple: (máscara ajustada, indicador por perfil de si el resultado incluye costos)
         """
-        if len(df) == 0:
-            return pd.DataFrame()
+        m = datos.matriz
         
-        # Crear copia para no modificar el original
-        df_puntuado = df.copy()
+        # Priorizar cultivos con precio de exportación o con precio interno (mercado local)
+        activos = np.array([[bool(preferencia)] for preferencia in preferencias_mercado])
+        exportacion = [bool(preferencia) and preferencia.lower() == 'exportación' for preferencia in preferencias_mercado]
+        filtrado = mascara & m['tiene_costos'] & m['tiene_precio'][np.array(exportacion, dtype=np.intp)]
         
-        # Inicializar puntuación base
-        df_puntuado['puntuacion'] = 100.0
+        # Si no hay cultivos para el mercado, mantener los originales
+        aplicar = activos & filtrado.any(axis=1, keepdims=True)
+        relajados = int(np.count_nonzero(activos & ~aplicar))
+        if relajados:
+            _RELAJACIONES['mercado'].inc(relajados)
         
-        # Ajustar por cercanía a condiciones óptimas
-        temperatura = parametros_usuario.get('temperatura')
-        precipitacion = parametros_usuario.get('precipitacion')
-        altitud = parametros_usuario.get('altitud')
+        return np.where(aplicar, filtrado, mascara), con_costos | aplicar
+    
+    def _calcular_puntuacion(self, datos, mascara, lista_parametros, con_costos):
+        """
+        Calcula una puntuación de compatibilidad para cada cultivo de cada perfil.
         
-        # Temperatura óptima es el promedio de min y max
-        df_puntuado['temp_optima'] = (df_puntuado['temp_min'] + df_puntuado['temp_max']) / 2
-        df_puntuado['distancia_temp'] = abs(df_puntuado['temp_optima'] - temperatura)
-        # Normalizar y ajustar puntuación (máx 20 puntos)
-        max_dist_temp = df_puntuado['distancia_temp'].max() if df_puntuado['distancia_temp'].max() > 0 else 1
-        df_puntuado['ajuste_temp'] = 20 * (1 - df_puntuado['distancia_temp'] / max_dist_temp)
+        Returns:
+            numpy.ndarray: Puntuaciones N x M; las filas descartadas valen -inf
+        """
+        m = datos.matriz
+        
+        # Puntuación base de 100 con tres ajustes de hasta 20 puntos por cercanía
+        # a las condiciones óptimas de temperatura, precipitación y altitud,
+        # normalizados por la mayor distancia entre los cultivos seleccionados
+        valores = np.array(
+            [[[p['temperatura']], [p['precipitacion']], [p['altitud']]] for p in lista_parametros],
+            dtype=np.float64
+        )
+        distancias = np.abs(m['optimos'] - valores)
+        max_dist = np.fmax.reduce(np.where(mascara[:, None, :], distancias, np.nan), axis=2, keepdims=True)
+        max_dist[~(max_dist > 0)] = 1
+        puntuacion = 100.0 - 20 * (distancias / max_dist).sum(axis=1)
+        
+        # Ajustar por rentabilidad si hay datos de costos (máx 20 puntos)
+        if con_costos.any():
+            rentabilidad = m['rentabilidad']
+            max_rent = np.fmax.reduce(np.where(mascara, rentabilidad, np.nan), axis=1, keepdims=True)
+            max_rent[~(max_rent > 0)] = 1
+            puntuacion += np.where(con_costos, 20 * (rentabilidad / max_rent), 0)
         
-        # Precipitación óptima es el promedio de min y max
-        df_puntuado['precip_optima'] = (df_puntuado['precipitacion_min'] + df_puntuado['precipitacion_max']) / 2
-        df_puntuado['distancia_precip'] = abs(df_puntuado['precip_optima'] - precipitacion)
-        # Normalizar y ajustar puntuación (máx 20 puntos)
-        max_dist_precip = df_puntuado['distancia_precip'].max() if df_puntuado['distancia_precip'].max() > 0 else 1
-        df_puntuado['ajuste_precip'] = 20 * (1 - df_puntuado['distancia_precip'] / max_dist_precip)
+        # Ajustar por experiencia del usuario si está disponible
+        experiencias = self._parametro_texto(lista_parametros, 'experiencia')
+        if any(experiencias):
+            ajustes = np.zeros((len(lista_parametros), len(NIVELES_DIFICULTAD)))
+            for i, experiencia in enumerate(experiencias):
+                if experiencia and experiencia.lower() in AJUSTE_EXPERIENCIA:
+                    ajustes[i] = AJUSTE_EXPERIENCIA[experiencia.lower()]
+            puntuacion += ajustes[:, m['dificultad']]
         
-        # Altitud óptima es el promedio de min y max
-        df_puntuado['altitud_optima'] = (df_puntuado['altitud_min'] + df_puntuado['altitud_max']) / 2
-        df_puntuado['distancia_altitud'] = abs(df_puntuado['altitud_optima'] - altitud)
-        # Normalizar y ajustar puntuación (máx 20 puntos)
-        max_dist_altitud = df_puntuado['distancia_altitud'].max() if df_puntuado['distancia_altitud'].max() > 0 else 1
-        df_puntuado['ajuste_altitud'] = 20 * (1 - df_puntuado['distancia_altitud'] / max_dist_altitud)
+        # Asegurar que la puntuación esté en un rango razonable
+        np.clip(puntuacion, 0, 100, out=puntuacion)
+        puntuacion[~mascara] = -np.inf
         
-        # Ajustar puntuación base con los ajustes calculados
-        df_puntuado['puntuacion'] = df_puntuado['puntuacion'] - 20 + df_puntuado['ajuste_temp']
-        df_puntuado['puntuacion'] = df_puntuado['puntuacion'] - 20 + df_puntuado['ajuste_precip']
-        df_puntuado['puntuacion'] = df_puntuado['puntuacion'] - 20 + df_puntuado['ajuste_altitud']
+        return puntuacion
+    
+    def _construir_detalles(self, filas_df, complementarios):
+        """
+        Prepara una sola vez los fragmentos de los resultados detallados.
         
-        # Ajustar por rentabilidad si hay datos de costos
-        if 'rentabilidad' in df_puntuado.columns:
-            # Normalizar rentabilidad (máx 20 puntos)
-            max_rent = df_puntuado['rentabilidad'].max() if df_puntuado['rentabilidad'].max() > 0 else 1
-            df_puntuado['ajuste_rentabilidad'] = 20 * (df_puntuado['rentabilidad'] / max_rent)
-            df_puntuado['puntuacion'] = df_puntuado['puntuacion'] + df_puntuado['ajuste_rentabilidad']
+        Los datos de cada fila de la matriz (información básica, condiciones óptimas y
+        costos) y los de cada cultivo (plagas, insumos, técnicas y certificaciones)
+        quedan formateados, de modo que armar una respuesta solo requiere búsquedas
+        en diccionarios y la puntuación de la solicitud. Los fragmentos se comparten
+        entre respuestas y no deben modificarse.
         
-        # Ajustar por experiencia del usuario si está disponible
-        if 'experiencia' in parametros_usuario and parametros_usuario['experiencia']:
-            experiencia = parametros_usuario['experiencia'].lower()
-            
-            # Definir dificultad de cultivos (simplificado)
-            dificultad_cultivos = {
-                'Maíz': 'Baja', 'Fríjol': 'Baja', 'Yuca': 'Baja', 'Plátano': 'Baja',
-                'Arroz': 'Media', 'Papa': 'Media', 'Tomate de árbol': 'Media',
-                'Café': 'Alta', 'Cacao': 'Alta', 'Gulupa': 'Alta', 'Arándano': 'Alta'
+        Returns:
+            tuple: (fragmentos por fila de la matriz, secciones por id_cultivo)
+        """
+        detalles_filas = []
+        
+        for cultivo in filas_df.to_dict('records'):
+            # Información básica del cultivo
+            basico = {
+                'id_cultivo': cultivo['id_cultivo'],
+                'nombre': cultivo['nombre'],
+                'tipo': cultivo['tipo'],
+                'descripcion': cultivo['descripcion'],
+                'ciclo_dias': cultivo['ciclo_dias'],
+                'densidad_siembra': cultivo['densidad_siembra']
             }
             
-            # Mapear nombres de cultivos a dificultad
-            df_puntuado['dificultad'] = df_puntuado['nombre'].map(
-                lambda x: dificultad_cultivos.get(x, 'Media')
-            )
-            
-            # Ajustar puntuación según coincidencia de experiencia y dificultad
-            ajuste_exp = {
-                ('baja', 'Baja'): 10,    # Experiencia baja, cultivo fácil: buena coincidencia
-                ('baja', 'Media'): 0,    # Experiencia baja, cultivo medio: neutral
-                ('baja', 'Alta'): -10,   # Experiencia baja, cultivo difícil: mala coincidencia
-                ('media', 'Baja'): 5,    # Experiencia media, cultivo fácil: coincidencia moderada
-                ('media', 'Media'): 10,  # Experiencia media, cultivo medio: buena coincidencia
-                ('media', 'Alta'): 0,    # Experiencia media, cultivo difícil: neutral
-                ('alta', 'Baja'): 0,     # Experiencia alta, cultivo fácil: neutral
-                ('alta', 'Media'): 5,    # Experiencia alta, cultivo medio: coincidencia moderada
-                ('alta', 'Alta'): 10     # Experiencia alta, cultivo difícil: buena coincidencia
+            condiciones_optimas = {
+                'temperatura': f"{cultivo['temp_min']} - {cultivo['temp_max']} °C",
+                'precipitacion': f"{cultivo['precipitacion_min']} - {cultivo['precipitacion_max']} mm/año",
+                'altitud': f"{cultivo['altitud_min']} - {cultivo['altitud_max']} msnm",
+                'tipo_suelo': cultivo['tipo_suelo'],
+                'ph_suelo': f"{cultivo['ph_min']} - {cultivo['ph_max']}"
             }
             
-            # Aplicar ajuste
-            df_puntuado['ajuste_experiencia'] = df_puntuado['dificultad'].apply(
-                lambda x: ajuste_exp.get((experiencia, x), 0)
-            )
+            # Información de costos
+            costos = {
+                'inversion_inicial': f"{cultivo['inversion_min']:,.0f} - {cultivo['inversion_max']:,.0f} COP/ha",
+                'costo_operativo': f"{cultivo['costo_operativo']:,.0f} COP/ha",
+                'precio_interno': f"{cultivo['precio_interno']:,.0f} COP/kg" if pd.notna(cultivo['precio_interno']) else "No disponible",
+                'precio_exportacion': f"{cultivo['precio_export']:,.2f} USD/kg" if pd.notna(cultivo['precio_export']) else "No disponible",
+                'rentabilidad_estimada': f"{cultivo['rentabilidad']:.2f}%"
+            }
             
-            df_puntuado['puntuacion'] = df_puntuado['puntuacion'] + df_puntuado['ajuste_experiencia']
-        
-        # Asegurar que la puntuación esté en un rango razonable
-        df_puntuado['puntuacion'] = df_puntuado['puntuacion'].clip(0, 100)
-        
-        return df_puntuado
+            detalles_filas.append((basico, condiciones_optimas, costos))
+        
+        # Secciones complementarias agrupadas por cultivo, en el orden de las tablas
+        detalles_cultivos = {}
+        
+        def agregar(seccion, df, formatear):
+            for fila in df.to_dict('records'):
+                detalles = detalles_cultivos.setdefault(fila['id_cultivo'], {})
+                detalles.setdefault(seccion, []).append(formatear(fila))
+        
+        # Plagas y enfermedades
+        agregar('plagas_enfermedades', complementarios['plagas_df'], lambda plaga: {
+            'nombre': plaga['nombre'],
+            'tipo': plaga['tipo'],
+            'severidad': plaga['severidad'],
+            'control': plaga['control']
+        })
+        
+        # Insumos recomendados
+        agregar('insumos_recomendados', complementarios['insumos_cultivo_df'], lambda insumo: {
+            'nombre': insumo['nombre'],
+            'categoria': insumo['categoria'],
+            'cantidad_por_ha': f"{insumo['cantidad_por_ha']} {insumo['unidad_medida']}",
+            'etapa_aplicacion': insumo['etapa_aplicacion'],
+            'precio_promedio': f"{insumo['precio_promedio']:,.0f} COP/{insumo['unidad_medida']}"
+        })
+        
+        # Técnicas de cultivo
+        agregar('tecnicas_recomendadas', complementarios['tecnicas_cultivo_df'], lambda tecnica: {
+            'nombre': tecnica['nombre'],
+            'categoria': tecnica['categoria'],
+            'importancia': tecnica['importancia'],
+            'descripcion': tecnica['descripcion'],
+            'beneficios': tecnica['beneficios']
+        })
+        
+        # Certificaciones aplicables
+        agregar('certificaciones_aplicables', complementarios['certificaciones_cultivo_df'], lambda cert: {
+            'nombre': cert['nombre'],
+            'entidad': cert['entidad'],
+            'mercado_objetivo': cert['mercado_objetivo'],
+            'premium_precio': f"{cert['premium_precio']}%"
+        })
+        
+        # Mantener el orden de las secciones de la respuesta
+        orden = ('plagas_enfermedades', 'insumos_recomendados', 'tecnicas_recomendadas', 'certificaciones_aplicables')
+        for id_cultivo, detalles in detalles_cultivos.items():
+            detalles_cultivos[id_cultivo] = {seccion: detalles[seccion] for seccion in orden if seccion in detalles}
+        
+        return detalles_filas, detalles_cultivos
     
-    def _preparar_resultados_detallados(self, df_recomendados):
+    def _preparar_resultados_detallados(self, datos, filas, puntuaciones, con_costos, zona=None):
         """
         Prepara resultados detallados para cada cultivo recomendado.
+        
+        Args:
+            datos (DatosModelo): Instantánea con que se calcularon las recomendaciones
+            filas (array): Filas de la matriz de cultivos, en orden de recomendación
+            puntuaciones (list): Puntuación de cada fila
+            con_costos (bool): Si se incluye la sección de costos
+            zona (tuple, opcional): Entrada del índice de zonas del perfil; agrega la
+                sección 'zona' a los cultivos presentes en ella
+        
+        Returns:
+            ResultadosRecomendacion: Lista de resultados que se serializa con `json()`
+                uniendo los fragmentos JSON precalculados de cada fila
         """
+        inicio = time.perf_counter()
+        complementarios = self._cargar_complementarios(datos)
+        detalles_filas, detalles_cultivos = complementarios['detalles']
         resultados = []
         
-        for _, cultivo in df_recomendados.iterrows():
-            id_cultivo = cultivo['id_cultivo']
+        for fila, puntuacion in zip(filas, puntuaciones):
+            basico, condiciones_optimas, costos = detalles_filas[fila]
             
-            # Información básica del cultivo
-            info_cultivo = {
-                'id_cultivo': id_cultivo,
-                'nombre': cultivo['nombre'],
-                'tipo': cultivo['tipo'],
-                'descripcion': cultivo['descripcion'],
-                'ciclo_dias': cultivo['ciclo_dias'],
-                'densidad_siembra': cultivo['densidad_siembra'],
-                'puntuacion': round(cultivo['puntuacion'], 2),
-                'condiciones_optimas': {
-                    'temperatura': f"{cultivo['temp_min']} - {cultivo['temp_max']} °C",
-                    'precipitacion': f"{cultivo['precipitacion_min']} - {cultivo['precipitacion_max']} mm/año",
-                    'altitud': f"{cultivo['altitud_min']} - {cultivo['altitud_max']} msnm",
-                    'tipo_suelo': cultivo['tipo_suelo'],
-                    'ph_suelo': f"{cultivo['ph_min']} - {cultivo['ph_max']}"
-                }
-            }
+            info_cultivo = {**basico, 'puntuacion': round(puntuacion, 2), 'condiciones_optimas': condiciones_optimas}
+            
+            if con_costos:
+                info_cultivo['costos'] = costos
             
-            # Información de costos si está disponible
-            if 'inversion_min' in cultivo:
-                info_cultivo['costos'] = {
-                    'inversion_inicial': f"{cultivo['inversion_min']:,.0f} - {cultivo['inversion_max']:,.0f} COP/ha",
-                    'costo_operativo': f"{cultivo['costo_operativo']:,.0f} COP/ha",
-                    'precio_interno': f"{cultivo['precio_interno']:,.0f} COP/kg" if pd.notna(cultivo['precio_interno']) else "No disponible",
-                    'precio_exportacion': f"{cultivo['precio_export']:,.2f} USD/kg" if pd.notna(cultivo['precio_export']) else "No disponible",
-                    'rentabilidad_estimada': f"{cultivo['rentabilidad']:.2f}%"
+            # Popularidad y rendimiento del cultivo en la zona del usuario
+            if zona is not None and zona[0][fila]:
+                info_cultivo['zona'] = {
+                    'popularidad_max': int(zona[1][fila]),
+                    'rendimiento_promedio': round(float(zona[2][fila]), 2)
                 }
             
-            # Plagas y enfermedades
-            plagas = self.plagas_df[self.plagas_df['id_cultivo'] == id_cultivo]
-            if not plagas.empty:
-                info_cultivo['plagas_enfermedades'] = []
-                for _, plaga in plagas.iterrows():
-                    info_cultivo['plagas_enfermedades'].append({
-                        'nombre': plaga['nombre'],
-                        'tipo': plaga['tipo'],
-                        'severidad': plaga['severidad'],
-                        'control': plaga['control']
-                    })
-            
-            # Insumos recomendados
-            insumos = self.insumos_cultivo_df[self.insumos_cultivo_df['id_cultivo'] == id_cultivo]
-            if not insumos.empty:
-                info_cultivo['insumos_recomendados'] = []
-                for _, insumo in insumos.iterrows():
-                    info_cultivo['insumos_recomendados'].append({
-                        'nombre': insumo['nombre'],
-                        'categoria': insumo['categoria'],
-                        'cantidad_por_ha': f"{insumo['cantidad_por_ha']} {insumo['unidad_medida']}",
-                        'etapa_aplicacion': insumo['etapa_aplicacion'],
-                        'precio_promedio': f"{insumo['precio_promedio']:,.0f} COP/{insumo['unidad_medida']}"
-                    })
-            
-            # Técnicas de cultivo
-            tecnicas = self.tecnicas_cultivo_df[self.tecnicas_cultivo_df['id_cultivo'] == id_cultivo]
-            if not tecnicas.empty:
-                info_cultivo['tecnicas_recomendadas'] = []
-                for _, tecnica in tecnicas.iterrows():
-                    info_cultivo['tecnicas_recomendadas'].append({
-                        'nombre': tecnica['nombre'],
-                        'categoria': tecnica['categoria'],
-                        'importancia': tecnica['importancia'],
-                        'descripcion': tecnica['descripcion'],
-                        'beneficios': tecnica['beneficios']
-                    })
-            
-            # Certificaciones aplicables
-            certificaciones = self.certificaciones_cultivo_df[self.certificaciones_cultivo_df['id_cultivo'] == id_cultivo]
-            if not certificaciones.empty:
-                info_cultivo['certificaciones_aplicables'] = []
-                for _, cert in certificaciones.iterrows():
-                    info_cultivo['certificaciones_aplicables'].append({
-                        'nombre': cert['nombre'],
-                        'entidad': cert['entidad'],
-                        'mercado_objetivo': cert['mercado_objetivo'],
-                        'premium_precio': f"{cert['premium_precio']}%"
-                    })
+            # Plagas, insumos, técnicas y certificaciones
+            info_cultivo.update(detalles_cultivos.get(basico['id_cultivo'], {}))
             
             resultados.append(info_cultivo)
         
-        return resultados
+        _medir_etapa('resultados', inicio)
+        return ResultadosRecomendacion(resultados, complementarios['fragmentos'], filas, con_costos)
     
     def obtener_detalles_cultivo(self, id_cultivo):
         """
@@ -456,28 +1482,106 @@ class ModeloRecomendacionCultivos:
         Returns:
             dict: Diccionario con todos los detalles del cultivo
         """
-        # Obtener información básica del cultivo
-        cultivo_info = self.cultivos_df[self.cultivos_df['id_cultivo'] == id_cultivo]
+        datos = self._datos_vigentes()
         
-        if cultivo_info.empty:
+        # Obtener información básica del cultivo
+        if not (datos.tablas['cultivos']['id_cultivo'] == id_cultivo).any():
             return {"error": "Cultivo no encontrado"}
         
-        # Crear dataframe con toda la información del cultivo
-        cultivo_completo = pd.merge(cultivo_info, self.condiciones_df, on='id_cultivo')
-        cultivo_completo = pd.merge(cultivo_completo, self.costos_df, on='id_cultivo', how='left')
+        # Filas de la matriz con las condiciones del cultivo
+        filas = np.flatnonzero(datos.matriz['id_cultivo'] == id_cultivo)
         
-        # Convertir a formato de resultado detallado
-        df_recomendados = cultivo_completo.copy()
-        df_recomendados['puntuacion'] = 100  # Puntuación máxima para detalles completos
-        
-        # Usar la misma función que para recomendaciones
-        resultados = self._preparar_resultados_detallados(df_recomendados)
+        # Usar la misma función que para recomendaciones, con puntuación máxima
+        resultados = self._preparar_resultados_detallados(datos, filas, [100] * len(filas), True)
         
         if resultados:
             return resultados[0]
         else:
             return {"error": "No se pudieron obtener detalles completos"}
     
+    def optimizar_portafolio(self, parametros_usuario, max_fraccion_por_cultivo=MAX_FRACCION_CULTIVO_PORTAFOLIO,
+                             resolucion_ha=RESOLUCION_PORTAFOLIO_HA):
+        """
+        Reparte el área de una finca entre los cultivos aptos para maximizar la
+        ganancia esperada.
+        
+        Los cultivos aptos son los que superan los mismos filtros que
+        `recomendar_cultivos` (clima, suelo, pH, presupuesto por hectárea, tiempo,
+        zona y mercado) y tienen información de costos. La ganancia esperada por
+        hectárea es la inversión mínima por la rentabilidad estimada.
+        
+        Args:
+            parametros_usuario (dict): Parámetros de `recomendar_cultivos`; además
+                requiere area_disponible (ha). El presupuesto, si se indica, limita
+                la inversión total del portafolio.
+            max_fraccion_por_cultivo (float): Fracción máxima del área para un mismo cultivo
+            resolucion_ha (float): Las hectáreas asignadas son múltiplos de este valor
+            
+        Returns:
+            dict: Asignaciones (hectáreas, inversión y ganancia esperada por cultivo)
+                y totales del portafolio
+        """
+        self._validar_parametros(parametros_usuario)
+        
+        try:
+            area_disponible = float(parametros_usuario.get('area_disponible') or 0)
+        except (TypeError, ValueError):
+            raise ValueError("El parámetro area_disponible debe ser numérico")
+        if area_disponible <= 0:
+            raise ValueError("El parámetro area_disponible es obligatorio y debe ser mayor que cero")
+        if not 0 < max_fraccion_por_cultivo <= 1:
+            raise ValueError("max_fraccion_por_cultivo debe estar entre 0 y 1")
+        
+        presupuesto = parametros_usuario.get('presupuesto')
+        presupuesto = float(presupuesto) if presupuesto else None
+        
+        datos = self._datos_vigentes()
+        m = datos.matriz
+        puntuacion = self._evaluar_bloque(datos, [parametros_usuario])[0][0]
+        
+        # Filas aptas con costos; de cada cultivo se conserva su fila mejor puntuada
+        aptas = np.flatnonzero(
+            (puntuacion > -np.inf) & m['tiene_costos'] & ~np.isnan(m['inversion_min']) & ~np.isnan(m['rentabilidad'])
+        )
+        aptas = aptas[np.argsort(-puntuacion[aptas], kind='stable')]
+        _, primeras = np.unique(m['id_cultivo'][aptas], return_index=True)
+        filas = aptas[np.sort(primeras)]
+        
+        inversion_por_ha = m['inversion_min'][filas]
+        ganancia_por_ha = inversion_por_ha * m['rentabilidad'][filas] / 100
+        
+        hectareas = optimizar_asignacion(
+            ganancia_por_ha, inversion_por_ha, area_disponible, presupuesto,
+            max_hectareas_por_cultivo=area_disponible * max_fraccion_por_cultivo
+        )
+        hectareas = redondear_asignacion(hectareas, resolucion_ha)
+        
+        asignaciones = []
+        for k in np.argsort(-hectareas, kind='stable'):
+            if hectareas[k] <= 0:
+                break
+            fila = filas[k]
+            asignaciones.append({
+                'id_cultivo': int(m['id_cultivo'][fila]),
+                'nombre': m['nombre'][fila],
+                'hectareas': float(hectareas[k]),
+                'inversion': round(float(hectareas[k] * inversion_por_ha[k]), 2),
+                'ganancia_esperada': round(float(hectareas[k] * ganancia_por_ha[k]), 2),
+                'rentabilidad_estimada': float(m['rentabilidad'][fila]),
+                'ciclo_dias': float(m['ciclo_dias'][fila]),
+                'puntuacion': round(float(puntuacion[fila]), 2)
+            })
+        
+        return {
+            'area_disponible': area_disponible,
+            'presupuesto': presupuesto,
+            'cultivos_aptos': len(filas),
+            'area_asignada': round(sum(a['hectareas'] for a in asignaciones), 6),
+            'inversion_total': round(sum(a['inversion'] for a in asignaciones), 2),
+            'ganancia_esperada_total': round(sum(a['ganancia_esperada'] for a in asignaciones), 2),
+            'asignaciones': asignaciones
+        }
+    
     def calcular_costos_implementacion(self, id_cultivo, area_hectareas=1):
         """
         Calcula los costos detallados de implementación para un cultivo específico.
@@ -489,46 +1593,141 @@ class ModeloRecomendacionCultivos:
         Returns:
             dict: Desglose detallado de costos
         """
-        # Obtener información de costos
-        costos_info = self.costos_df[self.costos_df['id_cultivo'] == id_cultivo]
+        barrido = self.calcular_costos_barrido([id_cultivo], [area_hectareas], formateado=True)
         
-        if costos_info.empty:
+        if not barrido['cultivos']:
             return {"error": "Información de costos no disponible"}
         
-        # Obtener insumos para este cultivo
-        insumos = self.insumos_cultivo_df[self.insumos_cultivo_df['id_cultivo'] == id_cultivo]
+        return barrido['cultivos'][0]['formateado'][0]
+    
+    def calcular_costos_barrido(self, ids_cultivos=None, areas=(1,), formateado=False):
+        """
+        Calcula los costos de implementación de varios cultivos para varias áreas
+        en una sola pasada vectorizada.
         
-        # Calcular costos
-        inversion_min = costos_info['inversion_min'].values[0] * area_hectareas
-        inversion_max = costos_info['inversion_max'].values[0] * area_hectareas
-        costo_operativo = costos_info['costo_operativo'].values[0] * area_hectareas
+        Args:
+            ids_cultivos (list, opcional): IDs de los cultivos; por defecto, todos los
+                cultivos con información de costos
+            areas (list): Áreas en hectáreas
+            formateado (bool): Si es True, cada cultivo incluye además el desglose
+                con el formato de `calcular_costos_implementacion` para cada área
+            
+        Returns:
+            dict: 'areas', 'cultivos' (por cultivo, listas con un valor numérico por
+                área de la inversión mínima, máxima y promedio, el costo operativo y su
+                desglose en insumos, mano de obra y otros, más el detalle de cada
+                insumo) y 'sin_costos' (IDs pedidos sin información de costos)
+        """
+        areas = list(areas)
+        if not areas or len(areas) > MAX_AREAS_BARRIDO_COSTOS:
+            raise ValueError(f"Se esperaban entre 1 y {MAX_AREAS_BARRIDO_COSTOS} áreas")
+        try:
+            valores_area = np.array(areas, dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ValueError("Las áreas deben ser numéricas")
+        
+        tabla = self._cargar_complementarios(self._datos_vigentes())['costos']
+        
+        if ids_cultivos is None:
+            ids_cultivos = tabla['id_cultivo'].tolist()
+        sin_costos = [id_cultivo for id_cultivo in ids_cultivos if id_cultivo not in tabla['posiciones']]
+        ids_cultivos = [id_cultivo for id_cultivo in ids_cultivos if id_cultivo in tabla['posiciones']]
+        posiciones = np.array([tabla['posiciones'][id_cultivo] for id_cultivo in ids_cultivos], dtype=np.intp)
+        
+        # Costos por cultivo (filas) y área (columnas)
+        inversion_min = tabla['inversion_min'][posiciones, None] * valores_area
+        inversion_max = tabla['inversion_max'][posiciones, None] * valores_area
+        costo_operativo = tabla['costo_operativo'][posiciones, None] * valores_area
+        
+        # Subtotales de insumos por fila de insumo_cultivo y área, sumados por cultivo
+        filas_insumos = np.concatenate([tabla['filas_insumos'][posicion] for posicion in posiciones] or [[]]).astype(np.intp)
+        cantidades = tabla['cantidad_por_ha'][filas_insumos, None] * valores_area
+        subtotales = cantidades * tabla['precio_promedio'][filas_insumos, None]
+        
+        num_areas = len(valores_area)
+        cultivo_fila = np.repeat(np.arange(len(posiciones)), [len(tabla['filas_insumos'][p]) for p in posiciones])
+        total_insumos = np.bincount(
+            (cultivo_fila[:, None] * num_areas + np.arange(num_areas)).ravel(),
+            weights=subtotales.ravel(), minlength=len(posiciones) * num_areas
+        ).reshape(len(posiciones), num_areas)
+        
+        # Estimaciones de mano de obra (40%) y otros costos (10%) del costo operativo
+        mano_obra = costo_operativo * 0.4
+        otros = costo_operativo * 0.1
+        
+        def opcional(valor):
+            return None if np.isnan(valor) else float(valor)
+        
+        cultivos = []
+        inicio = 0
+        for i, (id_cultivo, posicion) in enumerate(zip(ids_cultivos, posiciones)):
+            filas = tabla['filas_insumos'][posicion]
+            fin = inicio + len(filas)
+            
+            insumos = [
+                {
+                    **tabla['insumos'][fila],
+                    'cantidad': cantidades[j].tolist(),
+                    'subtotal': subtotales[j].tolist()
+                }
+                for j, fila in zip(range(inicio, fin), filas)
+            ]
+            
+            cultivo = {
+                'id_cultivo': id_cultivo,
+                'nombre': tabla['nombre'][posicion],
+                'inversion_min': inversion_min[i].tolist(),
+                'inversion_max': inversion_max[i].tolist(),
+                'inversion_promedio': ((inversion_min[i] + inversion_max[i]) / 2).tolist(),
+                'costo_operativo': costo_operativo[i].tolist(),
+                'insumos_total': total_insumos[i].tolist(),
+                'mano_obra': mano_obra[i].tolist(),
+                'otros': otros[i].tolist(),
+                'insumos': insumos,
+                'precio_interno': opcional(tabla['precio_interno'][posicion]),
+                'precio_exportacion': opcional(tabla['precio_export'][posicion]),
+                'rentabilidad': float(tabla['rentabilidad'][posicion])
+            }
+            
+            if formateado:
+                cultivo['formateado'] = [
+                    self._formatear_costos(tabla, posicion, filas, area, inversion_min[i, k], inversion_max[i, k],
+                                           costo_operativo[i, k], subtotales[inicio:fin, k], total_insumos[i, k])
+                    for k, area in enumerate(areas)
+                ]
+            
+            cultivos.append(cultivo)
+            inicio = fin
         
+        return {'areas': valores_area.tolist(), 'cultivos': cultivos, 'sin_costos': sin_costos}
+    
+    @staticmethod
+    def _formatear_costos(tabla, posicion, filas, area_hectareas, inversion_min, inversion_max, costo_operativo,
+                          subtotales, total_insumos):
+        """Desglose de costos de un cultivo y un área con el formato de la respuesta de la API."""
         # Desglose de costos de insumos
         desglose_insumos = []
-        total_insumos = 0
         
-        for _, insumo in insumos.iterrows():
-            cantidad = insumo['cantidad_por_ha'] * area_hectareas
-            precio = insumo['precio_promedio']
-            subtotal = cantidad * precio
-            total_insumos += subtotal
+        for fila, subtotal in zip(filas, subtotales):
+            insumo = tabla['insumos'][fila]
+            cantidad = tabla['cantidades_originales'][fila] * area_hectareas
             
             desglose_insumos.append({
                 'nombre': insumo['nombre'],
                 'categoria': insumo['categoria'],
                 'cantidad': f"{cantidad} {insumo['unidad_medida']}",
-                'precio_unitario': f"{precio:,.0f} COP/{insumo['unidad_medida']}",
+                'precio_unitario': f"{insumo['precio_unitario']:,.0f} COP/{insumo['unidad_medida']}",
                 'subtotal': f"{subtotal:,.0f} COP"
             })
         
-        # Estimar costos de mano de obra (simplificado)
-        costo_mano_obra = costo_operativo * 0.4  # Estimación: 40% del costo operativo
+        # Estimar costos de mano de obra y otros costos (simplificado)
+        costo_mano_obra = costo_operativo * 0.4
+        otros_costos = costo_operativo * 0.1
         
-        # Estimar otros costos
-        otros_costos = costo_operativo * 0.1  # Estimación: 10% del costo operativo
+        precio_interno = tabla['precio_interno'][posicion]
+        precio_export = tabla['precio_export'][posicion]
         
-        # Resultados
-        resultado = {
+        return {
             'area_hectareas': area_hectareas,
             'inversion_inicial': {
                 'rango': f"{inversion_min:,.0f} - {inversion_max:,.0f} COP",
@@ -546,78 +1745,103 @@ class ModeloRecomendacionCultivos:
                 }
             },
             'estimacion_ingresos': {
-                'precio_interno': f"{costos_info['precio_interno'].values[0]:,.0f} COP/kg" if pd.notna(costos_info['precio_interno'].values[0]) else "No disponible",
-                'precio_exportacion': f"{costos_info['precio_export'].values[0]:,.2f} USD/kg" if pd.notna(costos_info['precio_export'].values[0]) else "No disponible",
-                'rentabilidad_estimada': f"{costos_info['rentabilidad'].values[0]:.2f}%"
+                'precio_interno': f"{precio_interno:,.0f} COP/kg" if pd.notna(precio_interno) else "No disponible",
+                'precio_exportacion': f"{precio_export:,.2f} USD/kg" if pd.notna(precio_export) else "No disponible",
+                'rentabilidad_estimada': f"{tabla['rentabilidad'][posicion]:.2f}%"
             }
         }
+    
+    def _construir_tabla_costos(self, tablas, insumos_cultivo_df):
+        """
+        Prepara los arreglos usados por `calcular_costos_barrido`: los costos por
+        hectárea de cada cultivo y la cantidad y el precio de cada uno de sus insumos.
+        """
+        # Como en la consulta original, se usa el primer registro de costos de cada cultivo
+        costos = tablas['costos'].drop_duplicates('id_cultivo')
+        nombres = dict(zip(tablas['cultivos']['id_cultivo'], tablas['cultivos']['nombre']))
+        
+        tabla = {
+            'id_cultivo': costos['id_cultivo'].to_numpy(),
+            'posiciones': {id_cultivo: i for i, id_cultivo in enumerate(costos['id_cultivo'].tolist())},
+            'nombre': [nombres.get(id_cultivo) for id_cultivo in costos['id_cultivo'].tolist()]
+        }
+        for columna in ('inversion_min', 'inversion_max', 'costo_operativo', 'precio_interno', 'precio_export',
+                        'rentabilidad'):
+            tabla[columna] = pd.to_numeric(costos[columna], errors='coerce').to_numpy(dtype=np.float64)
+        
+        # Insumos de los cultivos con costos, en el orden de la tabla insumo_cultivo
+        insumos = insumos_cultivo_df[insumos_cultivo_df['id_cultivo'].isin(tabla['posiciones'])]
+        tabla['cantidad_por_ha'] = pd.to_numeric(insumos['cantidad_por_ha'], errors='coerce').to_numpy(dtype=np.float64)
+        tabla['precio_promedio'] = pd.to_numeric(insumos['precio_promedio'], errors='coerce').to_numpy(dtype=np.float64)
+        tabla['cantidades_originales'] = insumos['cantidad_por_ha'].tolist()
+        tabla['insumos'] = [
+            {
+                'id_insumo': insumo['id_insumo'],
+                'nombre': insumo['nombre'],
+                'categoria': insumo['categoria'],
+                'unidad_medida': insumo['unidad_medida'],
+                'precio_unitario': insumo['precio_promedio']
+            }
+            for insumo in insumos.to_dict('records')
+        ]
+        
+        tabla['filas_insumos'] = [[] for _ in range(len(costos))]
+        for fila, id_cultivo in enumerate(insumos['id_cultivo'].tolist()):
+            tabla['filas_insumos'][tabla['posiciones'][id_cultivo]].append(fila)
         
-        return resultado
+        return tabla
     
-    def obtener_proveedores_insumos(self, id_cultivo):
+    def obtener_cultivos_similares(self, id_cultivo, k=K_VECINOS):
+        """
+        Obtiene los cultivos más parecidos a uno dado en condiciones, economía y plagas.
+        
+        Args:
+            id_cultivo (int): ID del cultivo
+            k (int): Número de cultivos (como máximo K_VECINOS)
+            
+        Returns:
+            list: Cultivos parecidos con su similitud coseno, del más al menos parecido
+        """
+        indice = self._indice_similitud(self._datos_vigentes())
+        
+        similares = indice.similares(id_cultivo, k)
+        if similares is None:
+            return {"error": "Cultivo no encontrado"}
+        
+        return [
+            {'id_cultivo': int(indice.ids[posicion]), 'nombre': indice.nombres[posicion], 'similitud': round(similitud, 4)}
+            for posicion, similitud in similares
+        ]
+    
+    def obtener_proveedores_insumos(self, id_cultivo, max_ofertas_por_insumo=None, disponibilidad=None):
         """
         Obtiene información sobre proveedores de insumos para un cultivo específico.
         
         Args:
             id_cultivo (int): ID del cultivo
+            max_ofertas_por_insumo (int, opcional): Incluir solo las N ofertas más
+                baratas de cada insumo
+            disponibilidad (str o list, opcional): Incluir solo las ofertas con esta
+                disponibilidad (p. ej. 'Alta')
             
         Returns:
             list: Lista de proveedores con sus insumos
+        
+        Raises:
+            ValueError: Si max_ofertas_por_insumo es menor que 1
         """
-        # Obtener insumos para este cultivo
-        insumos_cultivo = self.insumos_cultivo_df[self.insumos_cultivo_df['id_cultivo'] == id_cultivo]
+        indice = self._cargar_complementarios(self._datos_vigentes())['proveedores']
         
-        if insumos_cultivo.empty:
+        if not indice.tiene_insumos(id_cultivo):
             return {"error": "Información de insumos no disponible"}
         
-        # Obtener IDs de insumos
-        ids_insumos = insumos_cultivo['id_insumo'].unique()
-        
-        # Consultar proveedores para estos insumos
-        query = f"""
-            SELECT p.*, pi.id_insumo, pi.precio, pi.disponibilidad, i.nombre as nombre_insumo, 
-                   i.categoria as categoria_insumo, i.unidad_medida
-            FROM proveedores p
-            JOIN proveedor_insumo pi ON p.id_proveedor = pi.id_proveedor
-            JOIN insumos i ON pi.id_insumo = i.id_insumo
-            WHERE pi.id_insumo IN ({','.join(['?'] * len(ids_insumos))})
-        """
-        
-        proveedores_df = pd.read_sql_query(query, self.conn, params=ids_insumos.tolist())
-        
-        # Organizar resultados por proveedor
-        proveedores = {}
-        
-        for _, row in proveedores_df.iterrows():
-            id_proveedor = row['id_proveedor']
-            
-            if id_proveedor not in proveedores:
-                proveedores[id_proveedor] = {
-                    'id_proveedor': id_proveedor,
-                    'nombre': row['nombre'],
-                    'tipo': row['tipo'],
-                    'contacto': row['contacto'],
-                    'ubicacion': row['ubicacion'],
-                    'sitio_web': row['sitio_web'],
-                    'telefono': row['telefono'],
-                    'insumos': []
-                }
-            
-            proveedores[id_proveedor]['insumos'].append({
-                'id_insumo': row['id_insumo'],
-                'nombre': row['nombre_insumo'],
-                'categoria': row['categoria_insumo'],
-                'precio': f"{row['precio']:,.0f} COP/{row['unidad_medida']}",
-                'disponibilidad': row['disponibilidad']
-            })
-        
-        return list(proveedores.values())
+        return indice.proveedores_de_cultivo(id_cultivo, max_ofertas_por_insumo, disponibilidad)
     
     def cerrar_conexion(self):
-        """Cierra la conexión a la base de datos."""
-        if self.conn:
-            self.conn.close()
-            print("Conexión a la base de datos cerrada.")
+        """Cierra las conexiones a la base de datos."""
+        self.detener_recarga_automatica()
+        self.pool.cerrar()
+        print("Conexión a la base de datos cerrada.")
 
 
 # Ejemplo de uso
@@ -0,0 +1,183 @@
+"""
+Perfilado de solicitudes con cProfile, bajo demanda y por muestreo.
+
+Bajo demanda: una solicitud con el encabezado X-Perfilar (o el parámetro
+?perfilar=) igual al token de administración se ejecuta con el perfilador; el
+resultado se guarda en el directorio de perfiles (.prof para pstats o snakeviz
+y .txt con el reporte por función) y la respuesta indica el nombre en el
+encabezado X-Perfil. Con ?reporte=1 la respuesta es el reporte en texto.
+Sin token configurado, el perfilado bajo demanda está desactivado.
+
+Por muestreo: con `muestreo=N`, una de cada N solicitudes de las rutas
+perfilables se perfila sin que el cliente lo note; las estadísticas se acumulan
+por proceso y se vuelcan en muestreo-<pid>.prof y .txt cada cierto número de
+muestras.
+"""
+
+import atexit
+import cProfile
+import hmac
+import io
+import itertools
+import os
+import pstats
+import tempfile
+import threading
+import time
+
+from flask import Response, make_response, request
+
+import metricas
+
+ENCABEZADO_PERFILADO = 'X-Perfilar'
+PARAMETRO_PERFILADO = 'perfilar'
+
+# Muestras acumuladas entre volcados del perfil agregado
+MUESTRAS_POR_VOLCADO = 20
+
+# Funciones del reporte ordenadas por tiempo acumulado
+FUNCIONES_EN_REPORTE = 40
+
+_PERFILES = {
+    modo: metricas.REGISTRO.contador('cultivos_perfiles_total', 'Solicitudes perfiladas por modo', modo=modo)
+    for modo in ('solicitado', 'muestreo')
+}
+
+
+def reporte_texto(estadisticas, titulo=None, limite=FUNCIONES_EN_REPORTE):
+    """
+    Reporte por función de un perfil.
+
+    Args:
+        estadisticas (cProfile.Profile o pstats.Stats): Perfil a reportar
+        titulo (str, opcional): Primera línea del reporte
+        limite (int): Funciones listadas por tiempo acumulado
+
+    Returns:
+        str: Las funciones con mayor tiempo acumulado y todas las del modelo de
+            recomendación
+    """
+    salida = io.StringIO()
+    if titulo:
+        salida.write(f"{titulo}\n")
+    stats = pstats.Stats(stream=salida)
+    stats.add(estadisticas)
+    stats.sort_stats('cumulative').print_stats(limite)
+    salida.write("Funciones del modelo de recomendación:\n")
+    stats.print_stats(r'modelo_recomendacion\.py')
+    return salida.getvalue()
+
+
+class Perfilador:
+    """
+    Decorador de vistas Flask que las perfila bajo demanda o por muestreo.
+    """
+
+    def __init__(self, directorio=None, token=None, muestreo=0, muestras_por_volcado=MUESTRAS_POR_VOLCADO):
+        """
+        Args:
+            directorio (str, opcional): Directorio de los perfiles guardados (por
+                defecto, perfiles-cultivos en el directorio temporal)
+            token (str, opcional): Token de administración que habilita el perfilado
+                bajo demanda
+            muestreo (int): Perfilar una de cada N solicitudes (0 para no muestrear)
+            muestras_por_volcado (int): Muestras entre escrituras del perfil agregado
+        """
+        self.directorio = directorio or os.path.join(tempfile.gettempdir(), 'perfiles-cultivos')
+        self.token = token
+        self.muestreo = muestreo
+        self.muestras_por_volcado = muestras_por_volcado
+
+        self._solicitudes = itertools.count(1)
+        self._nombres = itertools.count(1)
+        self._lock = threading.Lock()
+        self._agregado = None
+        self._muestras = 0
+
+        if muestreo > 0:
+            atexit.register(self.volcar)
+
+    def _solicitado(self):
+        """Indica si la solicitud en curso pide perfilarse con el token de administración."""
+        if not self.token:
+            return False
+        valor = request.headers.get(ENCABEZADO_PERFILADO) or request.args.get(PARAMETRO_PERFILADO)
+        return bool(valor) and hmac.compare_digest(valor.encode(), self.token.encode())
+
+    def ejecutar(self, vista, *args, **kwargs):
+        """
+        Ejecuta una vista, con el perfilador si la solicitud lo pide o sale en el muestreo.
+
+        Las rutas lo usan a través del decorador `perfilable` de server.py, que busca
+        el perfilador de la aplicación en cada solicitud.
+        """
+        solicitado = self._solicitado()
+        muestreado = not solicitado and self.muestreo > 0 and next(self._solicitudes) % self.muestreo == 0
+        if not (solicitado or muestreado):
+            return vista(*args, **kwargs)
+
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            # Otro perfilador está activo en este hilo
+            return vista(*args, **kwargs)
+        inicio = time.perf_counter()
+        try:
+            respuesta = vista(*args, **kwargs)
+        finally:
+            perfil.disable()
+        duracion = time.perf_counter() - inicio
+
+        if solicitado:
+            _PERFILES['solicitado'].inc()
+            return self._responder_perfil(perfil, make_response(respuesta), duracion)
+
+        _PERFILES['muestreo'].inc()
+        self._acumular(perfil)
+        return respuesta
+
+    def _responder_perfil(self, perfil, respuesta, duracion):
+        """Guarda el perfil de la solicitud y lo indica en la respuesta."""
+        nombre = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._nombres)}-{request.endpoint}"
+        titulo = f"{request.method} {request.full_path.rstrip('?')} ({duracion * 1000:.1f} ms, estado {respuesta.status_code})"
+        reporte = reporte_texto(perfil, titulo)
+
+        os.makedirs(self.directorio, exist_ok=True)
+        perfil.dump_stats(os.path.join(self.directorio, f"{nombre}.prof"))
+        with open(os.path.join(self.directorio, f"{nombre}.txt"), 'w', encoding='utf-8') as archivo:
+            archivo.write(reporte)
+
+        if request.args.get('reporte') == '1':
+            respuesta = Response(reporte, mimetype='text/plain')
+        respuesta.headers['X-Perfil'] = nombre
+        respuesta.headers['X-Perfil-Milisegundos'] = f"{duracion * 1000:.3f}"
+        return respuesta
+
+    def _acumular(self, perfil):
+        """Suma una muestra al perfil agregado del proceso."""
+        with self._lock:
+            if self._agregado is None:
+                self._agregado = pstats.Stats(perfil)
+            else:
+                self._agregado.add(perfil)
+            self._muestras += 1
+            if self._muestras % self.muestras_por_volcado == 0:
+                self._volcar()
+
+    def volcar(self):
+        """Escribe el perfil agregado por muestreo de este proceso."""
+        with self._lock:
+            self._volcar()
+
+    def _volcar(self):
+        if self._agregado is None:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = os.path.join(self.directorio, f"muestreo-{os.getpid()}")
+        self._agregado.dump_stats(f"{ruta}.prof.tmp")
+        os.replace(f"{ruta}.prof.tmp", f"{ruta}.prof")
+        with open(f"{ruta}.txt.tmp", 'w', encoding='utf-8') as archivo:
+            archivo.write(reporte_texto(self._agregado,
+                                        f"{self._muestras} solicitudes muestreadas (1 de cada {self.muestreo})"))
+        os.replace(f"{ruta}.txt.tmp", f"{ruta}.txt")
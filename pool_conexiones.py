@@ -0,0 +1,177 @@
+"""
+Pool de conexiones SQLite de solo lectura compartido por el modelo y el servidor.
+
+Cada conexión se abre una sola vez con una URI `mode=ro`, se configura con los
+pragmas indicados (por defecto mmap_size, cache_size y query_only) y conserva su
+caché de sentencias preparadas entre solicitudes. Una conexión solo la usa un hilo
+a la vez: se toma del pool con `conexion()` y se devuelve al salir del bloque.
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Pragmas aplicados a cada conexión nueva
+PRAGMAS_POR_DEFECTO = {
+    'mmap_size': 256 * 1024 * 1024,  # bytes mapeados en memoria
+    'cache_size': -16000,             # KiB de caché de páginas (valor negativo = KiB)
+    'query_only': 1                   # rechazar cualquier escritura
+}
+
+
+class PoolConexiones:
+    """
+    Pool seguro entre hilos de conexiones SQLite de solo lectura.
+    """
+
+    def __init__(self, db_path, tamano=8, timeout_segundos=10.0, pragmas=None, sentencias_en_cache=256):
+        """
+        Inicializa el pool; las conexiones se abren a medida que se necesitan.
+
+        Args:
+            db_path (str): Ruta al archivo de base de datos SQLite
+            tamano (int): Número máximo de conexiones abiertas
+            timeout_segundos (float): Espera máxima por una conexión libre
+            pragmas (dict, opcional): Pragmas de cada conexión; reemplaza las
+                entradas correspondientes de PRAGMAS_POR_DEFECTO
+            sentencias_en_cache (int): Sentencias preparadas que conserva cada conexión
+        """
+        self.db_path = db_path
+        self.uri = Path(db_path).resolve().as_uri() + '?mode=ro'
+        self.tamano = tamano
+        self.timeout_segundos = timeout_segundos
+        self.sentencias_en_cache = sentencias_en_cache
+        self.pragmas = dict(PRAGMAS_POR_DEFECTO)
+        if pragmas:
+            self.pragmas.update(pragmas)
+
+        self._libres = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._abiertas = 0
+        self._cerrado = False
+
+        self.prestamos = 0
+        self.esperas = 0
+        self.agotamientos = 0
+        self.tiempo_espera_total = 0.0
+        self.tiempo_espera_max = 0.0
+        self.tiempo_uso_total = 0.0
+
+    def _abrir(self):
+        """Abre y configura una conexión nueva."""
+        # La conexión puede pasar de un hilo a otro, pero nunca la usan dos a la vez
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False,
+                               cached_statements=self.sentencias_en_cache)
+        for pragma, valor in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {int(valor)}")
+        return conn
+
+    def _tomar(self):
+        """Obtiene una conexión libre, abriendo una nueva si el pool no está lleno."""
+        try:
+            return self._libres.get_nowait(), 0.0
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._cerrado:
+                raise RuntimeError("El pool de conexiones está cerrado")
+            abrir = self._abiertas < self.tamano
+            if abrir:
+                self._abiertas += 1
+
+        if abrir:
+            try:
+                return self._abrir(), 0.0
+            except Exception:
+                with self._lock:
+                    self._abiertas -= 1
+                raise
+
+        # Todas las conexiones están en uso: esperar a que se libere una
+        inicio = time.perf_counter()
+        try:
+            conn = self._libres.get(timeout=self.timeout_segundos)
+        except queue.Empty:
+            with self._lock:
+                self.agotamientos += 1
+            raise TimeoutError(f"No hubo conexiones libres en {self.timeout_segundos} s")
+        return conn, time.perf_counter() - inicio
+
+    @contextmanager
+    def conexion(self):
+        """
+        Presta una conexión durante el bloque `with`.
+
+        Yields:
+            sqlite3.Connection: Conexión de solo lectura de uso exclusivo en el bloque
+        """
+        conn, espera = self._tomar()
+        inicio = time.perf_counter()
+
+        with self._lock:
+            self.prestamos += 1
+            if espera:
+                self.esperas += 1
+                self.tiempo_espera_total += espera
+                self.tiempo_espera_max = max(self.tiempo_espera_max, espera)
+
+        try:
+            yield conn
+        finally:
+            # Cerrar cualquier transacción de lectura abierta por quien usó la conexión
+            if conn.in_transaction:
+                conn.rollback()
+
+            with self._lock:
+                self.tiempo_uso_total += time.perf_counter() - inicio
+                cerrado = self._cerrado
+                if cerrado:
+                    self._abiertas -= 1
+
+            if cerrado:
+                conn.close()
+            else:
+                self._libres.put(conn)
+
+    def cerrar(self):
+        """Cierra las conexiones libres; las prestadas se cierran al devolverse."""
+        with self._lock:
+            self._cerrado = True
+        self.vaciar()
+
+    def vaciar(self):
+        """
+        Cierra las conexiones libres sin cerrar el pool; se abrirán otras al necesitarlas.
+
+        Un proceso debe vaciar el pool antes de bifurcarse (os.fork), ya que una
+        conexión SQLite no puede usarse a ambos lados del fork.
+        """
+        while True:
+            try:
+                conn = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._abiertas -= 1
+
+    def estadisticas(self):
+        """Contadores de uso del pool."""
+        with self._lock:
+            return {
+                'tamano': self.tamano,
+                'abiertas': self._abiertas,
+                'libres': self._libres.qsize(),
+                'prestamos': self.prestamos,
+                'esperas': self.esperas,
+                'agotamientos': self.agotamientos,
+                'tiempo_espera_total_ms': round(self.tiempo_espera_total * 1000, 3),
+                'tiempo_espera_max_ms': round(self.tiempo_espera_max * 1000, 3),
+                'tiempo_uso_promedio_ms': (
+                    round(self.tiempo_uso_total / self.prestamos * 1000, 3) if self.prestamos else 0.0
+                )
+            }
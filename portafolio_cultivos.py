@@ -0,0 +1,70 @@
+"""
+Optimización del portafolio de cultivos de una finca.
+
+Reparte el área disponible entre cultivos aptos maximizando la ganancia esperada
+(inversión por hectárea x rentabilidad estimada) sin superar el área, el
+presupuesto ni el máximo de hectáreas por cultivo. Es un problema de mochila
+fraccionaria con dos restricciones, que se resuelve como programa lineal con
+HiGHS (scipy.optimize.linprog).
+"""
+
+import numpy as np
+
+
+def optimizar_asignacion(ganancia_por_ha, inversion_por_ha, area_disponible, presupuesto=None,
+                         max_hectareas_por_cultivo=None):
+    """
+    Calcula las hectáreas asignadas a cada cultivo.
+
+    Args:
+        ganancia_por_ha (array): Ganancia esperada por hectárea de cada cultivo
+        inversion_por_ha (array): Inversión requerida por hectárea de cada cultivo
+        area_disponible (float): Hectáreas disponibles
+        presupuesto (float, opcional): Inversión total máxima
+        max_hectareas_por_cultivo (float, opcional): Límite de hectáreas de un mismo cultivo
+
+    Returns:
+        numpy.ndarray: Hectáreas de cada cultivo
+    """
+    # scipy solo se necesita aquí; se importa al optimizar el primer portafolio
+    from scipy.optimize import linprog
+
+    ganancia_por_ha = np.asarray(ganancia_por_ha, dtype=np.float64)
+    inversion_por_ha = np.asarray(inversion_por_ha, dtype=np.float64)
+
+    if len(ganancia_por_ha) == 0:
+        return np.zeros(0)
+
+    # Restricciones: área total y, si se indica, presupuesto total
+    restricciones = [np.ones_like(ganancia_por_ha)]
+    limites = [area_disponible]
+    if presupuesto is not None:
+        restricciones.append(inversion_por_ha)
+        limites.append(presupuesto)
+
+    limite_cultivo = area_disponible if max_hectareas_por_cultivo is None else max_hectareas_por_cultivo
+
+    # linprog minimiza, así que se minimiza la ganancia con signo negativo
+    resultado = linprog(
+        -ganancia_por_ha,
+        A_ub=np.array(restricciones),
+        b_ub=np.array(limites, dtype=np.float64),
+        bounds=(0, limite_cultivo),
+        method='highs'
+    )
+
+    if not resultado.success:
+        raise RuntimeError(f"No se pudo optimizar el portafolio: {resultado.message}")
+
+    return np.clip(resultado.x, 0, None)
+
+
+def redondear_asignacion(hectareas, resolucion):
+    """
+    Redondea hacia abajo cada asignación a un múltiplo de `resolucion`, de modo que
+    el portafolio redondeado sigue cumpliendo todas las restricciones.
+    """
+    if not resolucion:
+        return hectareas
+    # El pequeño margen evita que 2.9999999 ha se conviertan en 2.9
+    return np.round(np.floor(hectareas / resolucion + 1e-9) * resolucion, 6)
@@ -0,0 +1,182 @@
+"""
+Respuestas JSON serializadas una sola vez y servidas desde memoria.
+
+Un `CuerpoJSON` guarda el cuerpo ya serializado, su versión comprimida con gzip y
+un ETag fuerte calculado a partir del contenido. `responder` elige la versión
+según Accept-Encoding y contesta 304 Not Modified cuando el cliente ya tiene el
+mismo contenido (If-None-Match). `CacheCuerpos` conserva un cuerpo por clave
+mientras no cambie la versión de los datos con que se construyó.
+
+`ProveedorJSON` reemplaza la serialización de jsonify por un codificador de
+serializacion_json.
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+
+import metricas
+from serializacion_json import codificador
+
+NIVEL_GZIP = 6
+
+# Cuerpos más pequeños no se comprimen: el encabezado gzip no compensa
+MIN_BYTES_GZIP = 512
+
+MAX_CUERPOS_EN_CACHE = 256
+
+_ACIERTOS = metricas.consultas_cache('cuerpos', 'acierto')
+_FALLOS = metricas.consultas_cache('cuerpos', 'fallo')
+
+
+class CuerpoJSON:
+    """
+    Cuerpo JSON inmutable con su versión gzip y su ETag.
+    """
+
+    def __init__(self, contenido, encabezados=None):
+        """
+        Args:
+            contenido (bytes): JSON serializado
+            encabezados (dict, opcional): Encabezados propios de este cuerpo (p. ej. el
+                cursor de la página siguiente)
+        """
+        self.contenido = contenido
+        self.encabezados = encabezados or {}
+        # mtime=0 para que la compresión (y su ETag) sea igual en todos los procesos
+        self.gzip = gzip.compress(contenido, NIVEL_GZIP, mtime=0) if len(contenido) >= MIN_BYTES_GZIP else None
+        self.huella = hashlib.blake2b(contenido, digest_size=16).hexdigest()
+        self.etag = f'"{self.huella}"'
+        self.etag_gzip = f'"{self.huella}-gz"'
+
+
+class ProveedorJSON(DefaultJSONProvider):
+    """
+    Proveedor JSON de Flask que serializa con un codificador de serializacion_json.
+
+    La salida es JSON compacto en UTF-8 con las claves en el orden de inserción (sin
+    ordenar), igual a la de los fragmentos de las recomendaciones; los tipos que el
+    codificador no admite se convierten como en el proveedor por defecto de Flask.
+    """
+
+    def __init__(self, app, nombre=None):
+        """
+        Args:
+            app (flask.Flask): Aplicación
+            nombre (str, opcional): Codificador de serializacion_json.CODIFICADORES
+        """
+        super().__init__(app)
+        self.codificar = codificador(nombre, default=self.default)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.codificar(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.codificar(obj), mimetype=self.mimetype)
+
+
+def _acepta_gzip(solicitud):
+    return 'gzip' in solicitud.headers.get('Accept-Encoding', '').lower()
+
+
+def _coincide(solicitud, cuerpo):
+    """Compara If-None-Match con el ETag del cuerpo (comparación débil, RFC 9110)."""
+    valor = solicitud.headers.get('If-None-Match')
+    if not valor:
+        return False
+    if valor.strip() == '*':
+        return True
+    for etiqueta in valor.split(','):
+        etiqueta = etiqueta.strip()
+        if etiqueta.startswith('W/'):
+            etiqueta = etiqueta[2:]
+        if etiqueta in (cuerpo.etag, cuerpo.etag_gzip):
+            return True
+    return False
+
+
+def responder(cuerpo, solicitud, cache_control='no-cache'):
+    """
+    Respuesta HTTP de un cuerpo en caché.
+
+    Args:
+        cuerpo (CuerpoJSON): Cuerpo a enviar
+        solicitud (flask.Request): Solicitud en curso
+        cache_control (str): Valor de Cache-Control; 'no-cache' obliga al navegador
+            a revalidar con el ETag en cada uso
+
+    Returns:
+        flask.Response: 200 con el cuerpo (comprimido si el cliente lo acepta) o 304
+    """
+    comprimido = cuerpo.gzip is not None and _acepta_gzip(solicitud)
+    etag = cuerpo.etag_gzip if comprimido else cuerpo.etag
+
+    if _coincide(solicitud, cuerpo):
+        respuesta = Response(status=304)
+    else:
+        respuesta = Response(cuerpo.gzip if comprimido else cuerpo.contenido, mimetype='application/json')
+        if comprimido:
+            respuesta.headers['Content-Encoding'] = 'gzip'
+
+    respuesta.headers.update(cuerpo.encabezados)
+    respuesta.headers['ETag'] = etag
+    respuesta.headers['Cache-Control'] = cache_control
+    respuesta.headers['Vary'] = 'Accept-Encoding'
+    return respuesta
+
+
+class CacheCuerpos:
+    """
+    Cuerpos JSON por clave, válidos mientras no cambie la versión de los datos.
+
+    Conserva los `max_cuerpos` usados más recientemente.
+    """
+
+    def __init__(self, max_cuerpos=MAX_CUERPOS_EN_CACHE):
+        self.max_cuerpos = max_cuerpos
+        self._cuerpos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.construcciones = 0
+
+    def obtener(self, clave, version, construir):
+        """
+        Cuerpo de `clave` para `version`, construyéndolo si no está en caché.
+
+        Args:
+            clave (hashable): Identificador de la respuesta
+            version (int): Versión de los datos
+            construir (callable): Función sin argumentos que retorna los bytes del JSON
+                o un CuerpoJSON
+
+        Returns:
+            CuerpoJSON: Cuerpo de la respuesta
+        """
+        with self._lock:
+            guardado = self._cuerpos.get(clave)
+            if guardado is not None and guardado[0] == version:
+                self._cuerpos.move_to_end(clave)
+                self.aciertos += 1
+                _ACIERTOS.inc()
+                return guardado[1]
+
+        _FALLOS.inc()
+        cuerpo = construir()
+        if not isinstance(cuerpo, CuerpoJSON):
+            cuerpo = CuerpoJSON(cuerpo)
+
+        with self._lock:
+            self.construcciones += 1
+            # Las entradas de versiones anteriores se reemplazan
+            self._cuerpos[clave] = (version, cuerpo)
+            self._cuerpos.move_to_end(clave)
+            while len(self._cuerpos) > self.max_cuerpos:
+                self._cuerpos.popitem(last=False)
+        return cuerpo
@@ -183,3 +183,13 @@ CREATE INDEX idx_plagas_tipo ON plagas_enfermedades(tipo);
 CREATE INDEX idx_insumos_categoria ON insumos(categoria);
 CREATE INDEX idx_proveedores_tipo ON proveedores(tipo);
 CREATE INDEX idx_tecnicas_categoria ON tecnicas(categoria);
+
+-- Índices de las tablas de relación: la clave primaria compuesta solo sirve para buscar por su
+-- primera columna; estos índices (con ambas claves, de modo que cubren las búsquedas de una
+-- clave a partir de la otra) permiten recorrer cada relación desde el otro lado
+CREATE INDEX idx_cultivo_zona_zona ON cultivo_zona(id_zona, id_cultivo);
+CREATE INDEX idx_cultivo_plaga_plaga ON cultivo_plaga(id_plaga, id_cultivo);
+CREATE INDEX idx_insumo_cultivo_cultivo ON insumo_cultivo(id_cultivo, id_insumo);
+CREATE INDEX idx_proveedor_insumo_insumo ON proveedor_insumo(id_insumo, id_proveedor);
+CREATE INDEX idx_tecnica_cultivo_cultivo ON tecnica_cultivo(id_cultivo, id_tecnica);
+CREATE INDEX idx_cultivo_certificacion_certificacion ON cultivo_certificacion(id_certificacion, id_cultivo);
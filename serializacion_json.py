@@ -0,0 +1,193 @@
+"""
+Serialización JSON de las respuestas.
+
+`codificador(nombre)` retorna una función que convierte un objeto en bytes de JSON
+compacto y UTF-8, con los escalares y arreglos de NumPy convertidos a tipos de
+Python. Codificadores disponibles:
+
+- 'orjson': usa la biblioteca orjson si está instalada (opcional, varias veces más
+  rápida)
+- 'json': usa el módulo json de la biblioteca estándar
+
+Sin nombre se usa 'orjson' si está instalada y 'json' si no. Otros codificadores
+se agregan con `registrar_codificador`.
+
+Las recomendaciones detalladas no se serializan completas en cada respuesta: el
+JSON de las partes fijas de cada fila de la matriz (información básica,
+condiciones óptimas, costos y secciones del cultivo) se calcula una sola vez por
+instantánea de datos (`FragmentosResultados`) y cada respuesta se arma uniendo
+esos fragmentos con la puntuación y la zona de la solicitud
+(`ResultadosRecomendacion.json`). El resultado es idéntico, byte a byte, a
+serializar la lista de diccionarios con el mismo codificador.
+"""
+
+import importlib.util
+import json
+
+import numpy as np
+
+
+def _convertir_numpy(valor, default=None):
+    """Convierte los valores de NumPy que el codificador no admite."""
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, np.ndarray):
+        return valor.tolist()
+    if default is not None:
+        return default(valor)
+    raise TypeError(f"Object of type {type(valor).__name__} is not JSON serializable")
+
+
+def _codificador_json(default=None):
+    codificador = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'),
+                                   default=lambda valor: _convertir_numpy(valor, default))
+
+    def codificar(valor):
+        return codificador.encode(valor).encode()
+
+    return codificar
+
+
+def _codificador_orjson(default=None):
+    import orjson
+
+    opciones = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    convertir = (lambda valor: _convertir_numpy(valor, default)) if default is not None else None
+
+    def codificar(valor):
+        return orjson.dumps(valor, default=convertir, option=opciones)
+
+    return codificar
+
+
+# Nombre → función que recibe `default` (conversión de tipos no admitidos) y retorna el codificador
+CODIFICADORES = {
+    'json': _codificador_json,
+    'orjson': _codificador_orjson
+}
+
+
+def registrar_codificador(nombre, fabrica):
+    """
+    Agrega un codificador.
+
+    Args:
+        nombre (str): Nombre con que se selecciona
+        fabrica (callable): Recibe la función `default` para los tipos no admitidos
+            (o None) y retorna una función objeto → bytes de JSON compacto
+    """
+    CODIFICADORES[nombre] = fabrica
+
+
+def codificador(nombre=None, default=None):
+    """
+    Función de serialización JSON.
+
+    Args:
+        nombre (str, opcional): Codificador de CODIFICADORES; por defecto 'orjson' si
+            está instalada y 'json' si no
+        default (callable, opcional): Conversión de los tipos que el codificador no
+            admite (después de los de NumPy)
+
+    Returns:
+        callable: Función que recibe un objeto y retorna los bytes de su JSON
+
+    Raises:
+        ValueError: Si el codificador no existe
+    """
+    if nombre is None:
+        nombre = 'orjson' if importlib.util.find_spec('orjson') is not None else 'json'
+    if nombre not in CODIFICADORES:
+        raise ValueError(f"Codificador JSON desconocido: {nombre}. Disponibles: {', '.join(CODIFICADORES)}")
+    return CODIFICADORES[nombre](default)
+
+
+class FragmentosResultados:
+    """
+    JSON precalculado de las partes fijas de los resultados detallados.
+    """
+
+    def __init__(self, detalles_filas, detalles_cultivos, codificar):
+        """
+        Args:
+            detalles_filas (list): (básico, condiciones óptimas, costos) de cada fila de
+                la matriz, como los prepara el modelo
+            detalles_cultivos (dict): Secciones complementarias por id_cultivo
+            codificar (callable): Codificador con que se serializan los fragmentos y
+                las partes de cada solicitud
+        """
+        self.codificar = codificar
+
+        # Secciones del cultivo sin las llaves, para agregarlas al final de cada resultado
+        secciones = {
+            id_cultivo: b',' + codificar(detalles)[1:-1] for id_cultivo, detalles in detalles_cultivos.items() if detalles
+        }
+
+        # Por fila: el objeto abierto hasta la puntuación, las condiciones, los costos y el cierre
+        self.filas = [
+            (
+                codificar(basico)[:-1] + b',"puntuacion":',
+                b',"condiciones_optimas":' + codificar(condiciones_optimas),
+                b',"costos":' + codificar(costos),
+                secciones.get(basico['id_cultivo'], b'') + b'}'
+            )
+            for basico, condiciones_optimas, costos in detalles_filas
+        ]
+
+    def unir(self, filas, resultados, con_costos):
+        """
+        JSON de una lista de resultados detallados.
+
+        Args:
+            filas (iterable): Fila de la matriz de cada resultado
+            resultados (list): Resultados detallados; de cada uno solo se leen la
+                puntuación y la zona
+            con_costos (bool): Si los resultados incluyen la sección de costos
+
+        Returns:
+            bytes: El mismo JSON que serializar `resultados` con el codificador
+        """
+        codificar = self.codificar
+        partes = []
+        for fila, resultado in zip(filas, resultados):
+            inicio, condiciones, costos, fin = self.filas[fila]
+            partes += (inicio, codificar(resultado['puntuacion']), condiciones)
+            if con_costos:
+                partes.append(costos)
+            zona = resultado.get('zona')
+            if zona is not None:
+                partes += (b',"zona":', codificar(zona))
+            partes += (fin, b',')
+        if partes:
+            partes.pop()
+        return b'[' + b''.join(partes) + b']'
+
+
+class ResultadosRecomendacion(list):
+    """
+    Lista de resultados detallados que sabe serializarse a partir de los fragmentos.
+
+    Se comporta como la lista de diccionarios; como los resultados en caché, no
+    debe modificarse, porque su JSON se calcula una sola vez.
+    """
+
+    def __init__(self, resultados, fragmentos, filas, con_costos):
+        """
+        Args:
+            resultados (list): Resultados detallados
+            fragmentos (FragmentosResultados): Fragmentos de la instantánea con que se
+                prepararon
+            filas (iterable): Fila de la matriz de cada resultado
+            con_costos (bool): Si los resultados incluyen la sección de costos
+        """
+        super().__init__(resultados)
+        self._fragmentos = fragmentos
+        self._filas = list(filas)
+        self._con_costos = con_costos
+        self._json = None
+
+    def json(self):
+        """JSON de los resultados (se calcula en el primer uso)."""
+        if self._json is None:
+            self._json = self._fragmentos.unir(self._filas, self, self._con_costos)
+        return self._json
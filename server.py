@@ -8,90 +8,229 @@ Conecta el frontend con el modelo de recomendación y la base de datos
 
 import os
 import json
+import functools
 import sqlite3
-from flask import Flask, request, jsonify, send_from_directory
+import time
+from types import SimpleNamespace
+from flask import (Blueprint, Flask, Response, current_app, g, request, jsonify, send_from_directory,
+                   stream_with_context)
 from flask_cors import CORS
+from werkzeug.local import LocalProxy
 import sys
 
 # Agregar directorio del proyecto al path para importar el modelo
 sys.path.append('/home/ubuntu/proyecto_cultivos/src')
 from modelo_recomendacion import ModeloRecomendacionCultivos
-
-# Inicializar la aplicación Flask
-app = Flask(__name__, static_folder='frontend')
-CORS(app)  # Habilitar CORS para todas las rutas
+from cache_recomendaciones import CacheRecomendaciones, CUANTIZACION_APROXIMADA
+from pool_conexiones import PoolConexiones
+from tabla_climatica import TablaClimatica
+from indice_similitud import K_VECINOS
+from respuestas_http import CacheCuerpos, CuerpoJSON, ProveedorJSON, responder
+from serializacion_json import ResultadosRecomendacion
+from catalogo_cultivos import ConsultaCatalogo
+from perfilado import Perfilador
+from agrupador_solicitudes import AgrupadorSolicitudes
+import metricas
 
 # Configuración
 DB_PATH = '/home/ubuntu/proyecto_cultivos/data/db/cultivos.db'
 ASSETS_PATH = '/home/ubuntu/proyecto_cultivos/src/frontend/assets'
 
-# Inicializar el modelo de recomendación
-modelo = ModeloRecomendacionCultivos(DB_PATH)
+# Opciones de `crear_app`, tomadas por defecto de las variables de entorno del mismo nombre:
+# - DB_PATH: base de datos de cultivos
+# - TABLA_CLIMATICA: directorio de una tabla construida con tabla_climatica.py; los perfiles
+#   que solo traen clima, experiencia y mercado se responden desde ella
+# - INSTANTANEA_DATOS: archivo creado con instantanea_datos.py del que se toman los datos al
+#   iniciar, sin consultar la base de datos
+# - PRECARGAR_DATOS=1: cargar al iniciar los datos complementarios (plagas, insumos, técnicas
+#   y certificaciones) y el índice de similitud, que si no se cargan en el primer uso
+# - INTERVALO_RECARGA_DATOS: segundos entre revisiones de cultivos.db para recargar los datos
+#   que cambien sin reiniciar el servidor (0 lo desactiva)
+# - CACHE_APROXIMADA=1: la caché de recomendaciones redondea los parámetros numéricos con
+#   CUANTIZACION_APROXIMADA (0.5 °C, 50 mm, 50 msnm...) para que perfiles parecidos compartan
+#   resultado; las respuestas se calculan entonces con los valores redondeados. Por defecto la
+#   caché usa los valores exactos
+# - AGRUPAR_SOLICITUDES=1: las recomendaciones concurrentes con los mismos parámetros
+#   canónicos esperan un único cálculo; ESPERA_AGRUPACION limita en segundos esa espera
+# - CODIFICADOR_JSON: codificador de las respuestas ('orjson' o 'json'; por defecto orjson si
+#   está instalada, ver serializacion_json.py)
+# - TOKEN_PERFILADO, MUESTREO_PERFILADO, DIRECTORIO_PERFILES: perfilado de solicitudes
+#   (ver perfilado.py)
+CONFIGURACION_POR_DEFECTO = {
+    'DB_PATH': DB_PATH,
+    'TABLA_CLIMATICA': None,
+    'INSTANTANEA_DATOS': None,
+    'PRECARGAR_DATOS': '0',
+    'INTERVALO_RECARGA_DATOS': 30,
+    'CACHE_APROXIMADA': '0',
+    'AGRUPAR_SOLICITUDES': '1',
+    'ESPERA_AGRUPACION': 30,
+    'CODIFICADOR_JSON': None,
+    'TOKEN_PERFILADO': None,
+    'MUESTREO_PERFILADO': 0,
+    'DIRECTORIO_PERFILES': None
+}
+
+rutas = Blueprint('cultivos', __name__)
+
+def crear_app(configuracion=None):
+    """
+    Crea la aplicación Flask con su modelo de recomendación.
+    
+    Importar este módulo no construye el modelo ni lee datos: cada proceso crea la
+    aplicación cuando la necesita (`server.app` la crea con las variables de entorno
+    en el primer acceso).
+    
+    Args:
+        configuracion (dict, opcional): Opciones de CONFIGURACION_POR_DEFECTO; las que
+            no se indiquen se toman de las variables de entorno o del valor por defecto
+    
+    Returns:
+        Flask: Aplicación lista para atender solicitudes; sus objetos (modelo, pool,
+            tabla climática, caché de cuerpos y perfilador) quedan en
+            app.extensions['cultivos']
+    """
+    opciones = {clave: os.environ.get(clave, valor) for clave, valor in CONFIGURACION_POR_DEFECTO.items()}
+    opciones.update(configuracion or {})
+    
+    app = Flask(__name__, static_folder='frontend')
+    CORS(app)  # Habilitar CORS para todas las rutas
+    app.config.update(opciones)
+    app.json = ProveedorJSON(app, opciones['CODIFICADOR_JSON'])
+    
+    # Modelo de recomendación con caché de resultados y carga diferida de los datos complementarios
+    pool = PoolConexiones(opciones['DB_PATH'])
+    tabla_climatica = TablaClimatica(opciones['TABLA_CLIMATICA']) if opciones['TABLA_CLIMATICA'] else None
+    agrupador = (AgrupadorSolicitudes(tiempo_espera=float(opciones['ESPERA_AGRUPACION']))
+                 if str(opciones['AGRUPAR_SOLICITUDES']) == '1' else None)
+    cache = CacheRecomendaciones(
+        cuantizacion=CUANTIZACION_APROXIMADA if str(opciones['CACHE_APROXIMADA']) == '1' else None
+    )
+    modelo = ModeloRecomendacionCultivos(opciones['DB_PATH'], cache=cache, carga_diferida=True,
+                                         pool=pool, tabla_climatica=tabla_climatica,
+                                         instantanea=opciones['INSTANTANEA_DATOS'], agrupador=agrupador,
+                                         codificar_json=app.json.codificar)
+    if str(opciones['PRECARGAR_DATOS']) == '1':
+        modelo.precargar()
+    
+    intervalo_recarga = float(opciones['INTERVALO_RECARGA_DATOS'])
+    if intervalo_recarga > 0:
+        modelo.iniciar_recarga_automatica(intervalo_recarga)
+    
+    app.extensions['cultivos'] = SimpleNamespace(
+        modelo=modelo,
+        pool=pool,
+        tabla_climatica=tabla_climatica,
+        # Respuestas serializadas en memoria (vistas del catálogo de cultivos)
+        cuerpos=CacheCuerpos(),
+        perfilador=Perfilador(opciones['DIRECTORIO_PERFILES'], opciones['TOKEN_PERFILADO'],
+                              int(opciones['MUESTREO_PERFILADO']))
+    )
+    app.register_blueprint(rutas)
+    return app
+
+def __getattr__(nombre):
+    # `server.app` se crea con la configuración del entorno la primera vez que se usa
+    if nombre == 'app':
+        global app
+        app = crear_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+def _servicios():
+    return current_app.extensions['cultivos']
+
+# Objetos de la aplicación que atiende la solicitud en curso
+modelo = LocalProxy(lambda: _servicios().modelo)
+pool = LocalProxy(lambda: _servicios().pool)
+cuerpos = LocalProxy(lambda: _servicios().cuerpos)
+
+# Perfilado de /api/recomendaciones y /api/cultivos/<id>: con TOKEN_PERFILADO, las solicitudes
+# con el encabezado X-Perfilar (o ?perfilar=) igual al token se ejecutan con cProfile y su
+# reporte se guarda en DIRECTORIO_PERFILES (?reporte=1 lo retorna en la respuesta).
+# MUESTREO_PERFILADO=N perfila una de cada N solicitudes y acumula sus estadísticas allí
+def perfilable(vista):
+    """Permite perfilar la vista con el perfilador de la aplicación (ver perfilado.py)."""
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        return _servicios().perfilador.ejecutar(vista, *args, **kwargs)
+    return envoltura
+
+# Duración y código de cada respuesta por ruta; GET /metrics las expone junto con las
+# etapas de la recomendación. Con varios procesos (servidor_prefork.py), DIRECTORIO_METRICAS
+# indica el directorio en que cada proceso publica sus métricas para sumarlas
+DURACION_SERIALIZACION = metricas.duracion_etapa('serializacion')
+medidas_rutas = {}
+
+@rutas.before_app_request
+def iniciar_medicion():
+    g.inicio_solicitud = time.perf_counter()
+
+@rutas.after_app_request
+def medir_solicitud(respuesta):
+    inicio = g.pop('inicio_solicitud', None)
+    if inicio is not None:
+        ruta = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+        clave = (ruta, request.method, respuesta.status_code)
+        medidas = medidas_rutas.get(clave)
+        if medidas is None:
+            medidas = medidas_rutas[clave] = (
+                metricas.REGISTRO.histograma('cultivos_solicitud_segundos',
+                                             'Duración de cada solicitud hasta el inicio de la respuesta',
+                                             ruta=ruta, metodo=request.method),
+                metricas.REGISTRO.contador('cultivos_respuestas_total', 'Respuestas por ruta y código de estado',
+                                           ruta=ruta, metodo=request.method, codigo=respuesta.status_code)
+            )
+        medidas[0].observar_desde(inicio)
+        medidas[1].inc()
+    return respuesta
+
+@rutas.route('/metrics', methods=['GET'])
+def get_metricas():
+    return Response(metricas.REGISTRO.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # Rutas para servir archivos estáticos
-@app.route('/')
+@rutas.route('/')
 def index():
-    return send_from_directory(app.static_folder, 'index.html')
+    return send_from_directory(current_app.static_folder, 'index.html')
 
-@app.route('/<path:path>')
+@rutas.route('/<path:path>')
 def static_files(path):
-    return send_from_directory(app.static_folder, path)
+    return send_from_directory(current_app.static_folder, path)
 
-@app.route('/assets/<path:filename>')
+@rutas.route('/assets/<path:filename>')
 def serve_assets(filename):
     return send_from_directory(ASSETS_PATH, filename)
 
-# API para obtener todos los cultivos
-@app.route('/api/cultivos', methods=['GET'])
+def serializar_catalogo(consulta):
+    """Lee una vista del catálogo en una sola consulta y la serializa como JSON."""
+    with pool.conexion() as conn:
+        cultivos, siguiente = consulta.leer(conn)
+    
+    encabezados = {'X-Siguiente-Cursor': siguiente} if siguiente else None
+    return CuerpoJSON(current_app.json.codificar(cultivos), encabezados)
+
+# API para obtener los cultivos: filtro (?tipo=), campos (?fields=), orden (?sort=) y
+# paginación (?limit=&cursor=; el cursor de la página siguiente va en X-Siguiente-Cursor).
+# Cada vista se serializa y comprime una vez por versión de los datos y se revalida
+# con ETag (If-None-Match -> 304)
+@rutas.route('/api/cultivos', methods=['GET'])
 def get_cultivos():
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Consulta para obtener información básica de cultivos
-        cursor.execute("""
-            SELECT c.id_cultivo, c.nombre, c.descripcion, c.tipo, c.ciclo_dias, c.densidad_siembra, c.imagen
-            FROM cultivos c
-        """)
-        cultivos_basicos = [dict(row) for row in cursor.fetchall()]
-        
-        # Para cada cultivo, obtener condiciones y costos
-        cultivos_completos = []
-        for cultivo in cultivos_basicos:
-            # Obtener condiciones
-            cursor.execute("""
-                SELECT temp_min, temp_max, precipitacion_min, precipitacion_max, 
-                       tipo_suelo, ph_min, ph_max, altitud_min, altitud_max
-                FROM condiciones
-                WHERE id_cultivo = ?
-            """, (cultivo['id_cultivo'],))
-            condiciones = dict(cursor.fetchone() or {})
-            
-            # Obtener costos
-            cursor.execute("""
-                SELECT inversion_min, inversion_max, costo_operativo, 
-                       precio_interno, precio_export, rentabilidad
-                FROM costos
-                WHERE id_cultivo = ?
-            """, (cultivo['id_cultivo'],))
-            costos = cursor.fetchone()
-            
-            # Agregar a cultivo completo
-            cultivo_completo = cultivo.copy()
-            cultivo_completo['condiciones'] = condiciones
-            cultivo_completo['costos'] = dict(costos) if costos else None
-            
-            cultivos_completos.append(cultivo_completo)
-        
-        conn.close()
-        return jsonify(cultivos_completos)
+        try:
+            consulta = ConsultaCatalogo.desde_argumentos(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        cuerpo = cuerpos.obtener(consulta.clave, modelo.version_datos, lambda: serializar_catalogo(consulta))
+        return responder(cuerpo, request)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # API para obtener un cultivo específico
-@app.route('/api/cultivos/<int:id_cultivo>', methods=['GET'])
+@rutas.route('/api/cultivos/<int:id_cultivo>', methods=['GET'])
+@perfilable
 def get_cultivo(id_cultivo):
     try:
         # Usar el modelo para obtener detalles completos
@@ -101,8 +240,23 @@ def get_cultivo(id_cultivo):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# API para obtener los cultivos más parecidos a uno dado
+@rutas.route('/api/cultivos/<int:id_cultivo>/similares', methods=['GET'])
+def get_cultivos_similares(id_cultivo):
+    try:
+        k = request.args.get('k', K_VECINOS, type=int)
+        if k <= 0:
+            return jsonify({"error": "El parámetro k debe ser un entero positivo"}), 400
+        
+        similares = modelo.obtener_cultivos_similares(id_cultivo, k)
+        return jsonify(similares)
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # API para obtener recomendaciones
-@app.route('/api/recomendaciones', methods=['POST'])
+@rutas.route('/api/recomendaciones', methods=['POST'])
+@perfilable
 def get_recomendaciones():
     try:
         # Obtener parámetros del usuario desde el cuerpo de la solicitud
@@ -115,13 +269,120 @@ def get_recomendaciones():
         # Obtener recomendaciones usando el modelo
         recomendaciones = modelo.recomendar_cultivos(parametros_usuario)
         
-        return jsonify(recomendaciones)
+        # Las recomendaciones se serializan uniendo los fragmentos JSON de cada cultivo
+        inicio = time.perf_counter()
+        respuesta = current_app.response_class(recomendaciones.json(), mimetype='application/json')
+        DURACION_SERIALIZACION.observar_desde(inicio)
+        return respuesta
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# API para repartir el área de una finca entre los cultivos más rentables
+@rutas.route('/api/portafolio', methods=['POST'])
+def get_portafolio():
+    try:
+        parametros_usuario = request.get_json(silent=True)
+        if not isinstance(parametros_usuario, dict):
+            return jsonify({"error": "Se esperaba un objeto JSON con los parámetros de la finca"}), 400
+        
+        opciones = {}
+        if 'max_fraccion_por_cultivo' in parametros_usuario:
+            try:
+                max_fraccion = float(parametros_usuario['max_fraccion_por_cultivo'])
+            except (TypeError, ValueError):
+                max_fraccion = None
+            if max_fraccion is None or not 0 < max_fraccion <= 1:
+                return jsonify({"error": "max_fraccion_por_cultivo debe ser un número mayor que 0 y menor o igual que 1"}), 400
+            opciones['max_fraccion_por_cultivo'] = max_fraccion
+        
+        try:
+            portafolio = modelo.optimizar_portafolio(parametros_usuario, **opciones)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        return jsonify(portafolio)
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# API para obtener recomendaciones de muchas fincas en una sola solicitud
+@rutas.route('/api/recomendaciones/lote', methods=['POST'])
+def get_recomendaciones_lote():
+    try:
+        # Aceptar una lista JSON o un flujo NDJSON (un perfil por línea)
+        if request.mimetype == 'application/x-ndjson':
+            lista_parametros = _leer_ndjson(request.stream)
+        else:
+            lista_parametros = request.json
+            if not isinstance(lista_parametros, list):
+                return jsonify({"error": "Se esperaba una lista de parámetros"}), 400
+        
+        detallado = request.args.get('detallado', default='1') != '0'
+        
+        # Transmitir un resultado por línea a medida que se calculan los bloques
+        codificar = current_app.json.codificar
+        
+        def generar():
+            for resultado in modelo.recomendar_cultivos_lote(lista_parametros, detallado=detallado):
+                recomendaciones = resultado.get('recomendaciones')
+                if isinstance(recomendaciones, ResultadosRecomendacion):
+                    yield b'{"indice":%d,"recomendaciones":%s}\n' % (resultado['indice'], recomendaciones.json())
+                else:
+                    yield codificar(resultado) + b'\n'
+        
+        return Response(stream_with_context(generar()), mimetype='application/x-ndjson')
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _leer_ndjson(flujo):
+    """Lee perfiles NDJSON bajo demanda; las líneas inválidas se entregan como None."""
+    for linea in flujo:
+        if not linea.strip():
+            continue
+        try:
+            yield json.loads(linea)
+        except ValueError:
+            yield None
+
+# API para consultar el uso del pool de conexiones
+@rutas.route('/api/datos/conexiones', methods=['GET'])
+def get_estado_conexiones():
+    return jsonify(pool.estadisticas())
+
+# API para consultar la versión de los datos cargados y la duración de la última recarga
+@rutas.route('/api/datos/estado', methods=['GET'])
+def get_estado_datos():
+    return jsonify(modelo.estado_datos())
+
+# API de uso de la agrupación de recomendaciones concurrentes idénticas
+@rutas.route('/api/datos/agrupacion', methods=['GET'])
+def get_estado_agrupacion():
+    if modelo.agrupador is None:
+        return jsonify({"error": "El servidor no agrupa solicitudes"}), 404
+    return jsonify(modelo.agrupador.estadisticas())
+
+# API de uso de la tabla climática precalculada
+@rutas.route('/api/datos/tabla-climatica', methods=['GET'])
+def get_estado_tabla_climatica():
+    tabla_climatica = _servicios().tabla_climatica
+    if tabla_climatica is None:
+        return jsonify({"error": "El servidor no usa una tabla climática"}), 404
+    return jsonify(tabla_climatica.estadisticas())
+
+# API para forzar la recarga de los datos que hayan cambiado
+@rutas.route('/api/datos/recargar', methods=['POST'])
+def recargar_datos():
+    try:
+        recargados = modelo.recargar(forzar=True)
+        return jsonify({"recargados": recargados, **modelo.estado_datos()})
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # API para calcular costos de implementación
-@app.route('/api/costos/<int:id_cultivo>', methods=['GET'])
+@rutas.route('/api/costos/<int:id_cultivo>', methods=['GET'])
 def calcular_costos(id_cultivo):
     try:
         # Obtener área de la consulta (opcional)
@@ -135,12 +396,49 @@ def calcular_costos(id_cultivo):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# API para calcular costos de varios cultivos en varias áreas en una sola solicitud
+@rutas.route('/api/costos/barrido', methods=['GET'])
+def calcular_costos_barrido():
+    try:
+        # Listas separadas por comas, p. ej. ?cultivos=1,2,3&areas=1,5,10
+        try:
+            cultivos = request.args.get('cultivos')
+            ids_cultivos = [int(valor) for valor in cultivos.split(',') if valor.strip()] if cultivos else None
+            areas = [float(valor) for valor in request.args.get('areas', '1').split(',') if valor.strip()]
+        except ValueError:
+            return jsonify({"error": "Los parámetros cultivos y areas deben ser listas de números"}), 400
+        
+        formateado = request.args.get('formateado', '0').lower() in ('1', 'true', 'si', 'sí')
+        
+        try:
+            barrido = modelo.calcular_costos_barrido(ids_cultivos, areas, formateado)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        return jsonify(barrido)
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # API para obtener proveedores de insumos
-@app.route('/api/proveedores/<int:id_cultivo>', methods=['GET'])
+@rutas.route('/api/proveedores/<int:id_cultivo>', methods=['GET'])
 def get_proveedores(id_cultivo):
     try:
+        # Opciones: solo las N ofertas más baratas por insumo y filtro por disponibilidad
+        try:
+            max_ofertas = request.args.get('max_ofertas')
+            max_ofertas = int(max_ofertas) if max_ofertas is not None else None
+            if max_ofertas is not None and max_ofertas < 1:
+                raise ValueError
+        except ValueError:
+            return jsonify({"error": "El parámetro max_ofertas debe ser un entero mayor o igual que 1"}), 400
+        disponibilidad = request.args.getlist('disponibilidad') or None
+        
         # Obtener proveedores usando el modelo
-        proveedores = modelo.obtener_proveedores_insumos(id_cultivo)
+        try:
+            proveedores = modelo.obtener_proveedores_insumos(id_cultivo, max_ofertas, disponibilidad)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         return jsonify(proveedores)
     
@@ -153,4 +451,4 @@ if __name__ == '__main__':
     os.makedirs(ASSETS_PATH, exist_ok=True)
     
     # Iniciar servidor
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    crear_app().run(host='0.0.0.0', port=5000, debug=True)
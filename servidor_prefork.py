@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Lanzador de producción con varios procesos (pre-fork).
+
+El proceso padre crea la aplicación de server.py (`crear_app`, que carga el
+modelo una sola vez), deja el modelo listo para compartirse (`congelar`), mueve
+sus objetos a la generación permanente del recolector (gc.freeze) y abre el
+socket de escucha. Después bifurca N trabajadores que heredan el modelo
+copy-on-write y atienden solicitudes en ese mismo socket, cada uno en su propio
+núcleo.
+
+El padre no atiende solicitudes: reemplaza a los trabajadores que terminan,
+revisa periódicamente la base de datos y, si cambió, recarga el modelo y hace un
+reinicio ordenado para que los nuevos trabajadores compartan los datos nuevos.
+
+Cada trabajador publica sus métricas en DIRECTORIO_METRICAS (por defecto, un
+directorio temporal que se elimina al terminar) y GET /metrics, lo atienda el
+trabajador que lo atienda, reporta la suma de todos; las de los trabajadores que
+terminan se suman a las del padre.
+
+Uso:
+    python servidor_prefork.py [--trabajadores 4] [--host 0.0.0.0] [--puerto 5000]
+
+Señales del proceso padre:
+    SIGHUP: reinicio ordenado (recarga los datos y reemplaza los trabajadores)
+    SIGTERM, SIGINT: apagado ordenado
+"""
+
+import argparse
+import gc
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+
+# Tiempo que se espera a que un trabajador termine sus solicitudes antes de forzar su salida
+TIEMPO_GRACIA_SEGUNDOS = 30
+
+
+class ServidorPrefork:
+    """
+    Proceso padre: bifurca, vigila y reinicia los trabajadores.
+    """
+
+    def __init__(self, app, modelo, host, puerto, trabajadores, intervalo_recarga=30,
+                 tiempo_gracia=TIEMPO_GRACIA_SEGUNDOS, registro_metricas=None):
+        """
+        Args:
+            app (Flask): Aplicación que atienden los trabajadores
+            modelo (ModeloRecomendacionCultivos): Modelo compartido por los trabajadores
+            host (str): Dirección de escucha
+            puerto (int): Puerto de escucha
+            trabajadores (int): Número de procesos trabajadores
+            intervalo_recarga (float): Segundos entre revisiones de la base de datos
+                (0 para no revisarla)
+            tiempo_gracia (float): Espera máxima de un trabajador al detenerse
+            registro_metricas (RegistroMetricas, opcional): Registro con directorio
+                compartido en que se acumulan las métricas de los trabajadores que terminan
+        """
+        self.app = app
+        self.modelo = modelo
+        self.trabajadores = trabajadores
+        self.intervalo_recarga = intervalo_recarga
+        self.tiempo_gracia = tiempo_gracia
+        self.registro_metricas = registro_metricas
+
+        self.socket = socket.create_server((host, puerto), backlog=1024)
+        self.socket.set_inheritable(True)
+
+        self._activos = set()
+        self._detenidos = {}
+        self._detener = False
+        self._reiniciar = False
+        self.reinicios = 0
+
+    def _bifurcar(self):
+        """Crea un trabajador."""
+        pid = os.fork()
+        if pid == 0:
+            codigo = 0
+            try:
+                self._trabajar()
+            except Exception:
+                logging.exception("Error en el trabajador %d", os.getpid())
+                codigo = 1
+            finally:
+                os._exit(codigo)
+        self._activos.add(pid)
+
+    def _trabajar(self):
+        """Ciclo de un trabajador: atiende solicitudes hasta recibir SIGTERM."""
+        from werkzeug.serving import make_server
+
+        servidor = make_server(*self.socket.getsockname()[:2], self.app, fd=self.socket.fileno())
+        padre = os.getppid()
+
+        def detener(*_):
+            # shutdown() espera a que serve_forever termine: se llama desde otro hilo
+            threading.Thread(target=servidor.shutdown, daemon=True).start()
+
+        def vigilar_padre():
+            while os.getppid() == padre:
+                time.sleep(1)
+            detener()
+
+        signal.signal(signal.SIGTERM, detener)
+        signal.signal(signal.SIGINT, detener)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        threading.Thread(target=vigilar_padre, daemon=True).start()
+
+        servidor.serve_forever()
+
+    def _preparar_modelo(self):
+        """Deja el modelo listo para bifurcar sin que los trabajadores copien sus páginas."""
+        self.modelo.congelar()
+        gc.collect()
+        gc.freeze()
+
+    def _recoger(self):
+        """Recoge los trabajadores que terminaron y reemplaza los que fallaron."""
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            if self.registro_metricas is not None:
+                self.registro_metricas.absorber(pid)
+
+            if pid in self._activos:
+                self._activos.discard(pid)
+                if not self._detener:
+                    logging.warning("El trabajador %d terminó inesperadamente; se reemplaza", pid)
+                    self._bifurcar()
+            self._detenidos.pop(pid, None)
+
+    def _detener_trabajadores(self, pids):
+        """Pide a los trabajadores que terminen sus solicitudes y salgan."""
+        limite = time.monotonic() + self.tiempo_gracia
+        for pid in pids:
+            self._activos.discard(pid)
+            self._detenidos[pid] = limite
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _forzar_vencidos(self):
+        """Termina los trabajadores que no salieron en el tiempo de gracia."""
+        ahora = time.monotonic()
+        for pid, limite in list(self._detenidos.items()):
+            if ahora > limite:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def reiniciar(self):
+        """
+        Reinicio ordenado con los datos vigentes: los trabajadores nuevos empiezan a
+        aceptar conexiones antes de que los anteriores terminen las suyas.
+        """
+        self.modelo.recargar()
+        self._preparar_modelo()
+        anteriores = list(self._activos)
+        for _ in range(self.trabajadores):
+            self._bifurcar()
+        self._detener_trabajadores(anteriores)
+        self.reinicios += 1
+
+    def ejecutar(self):
+        """Inicia los trabajadores y los vigila hasta recibir SIGTERM o SIGINT."""
+        def detener(*_):
+            self._detener = True
+
+        def reiniciar(*_):
+            self._reiniciar = True
+
+        signal.signal(signal.SIGTERM, detener)
+        signal.signal(signal.SIGINT, detener)
+        signal.signal(signal.SIGHUP, reiniciar)
+
+        # Las métricas de ejecuciones anteriores no se suman a las de esta
+        if self.registro_metricas is not None:
+            self.registro_metricas.limpiar()
+
+        self._preparar_modelo()
+        for _ in range(self.trabajadores):
+            self._bifurcar()
+
+        host, puerto = self.socket.getsockname()[:2]
+        print(f"Sirviendo en http://{host}:{puerto} con {self.trabajadores} trabajadores (pid {os.getpid()})",
+              flush=True)
+
+        proxima_revision = time.monotonic() + self.intervalo_recarga
+        while not self._detener:
+            time.sleep(0.2)
+            self._recoger()
+            self._forzar_vencidos()
+
+            if self.intervalo_recarga and time.monotonic() >= proxima_revision:
+                proxima_revision = time.monotonic() + self.intervalo_recarga
+                # Con datos nuevos, los trabajadores se reemplazan para compartirlos
+                if self.modelo.recargar():
+                    self._reiniciar = True
+
+            if self._reiniciar:
+                self._reiniciar = False
+                self.reiniciar()
+
+        # Apagado ordenado
+        self._detener_trabajadores(list(self._activos))
+        while self._detenidos:
+            time.sleep(0.1)
+            self._recoger()
+            self._forzar_vencidos()
+
+        self.socket.close()
+        self.modelo.cerrar_conexion()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trabajadores', type=int, default=int(os.environ.get('TRABAJADORES', os.cpu_count() or 1)))
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--puerto', type=int, default=5000)
+    parser.add_argument('--intervalo-recarga', type=float,
+                        default=float(os.environ.get('INTERVALO_RECARGA_DATOS', 30)))
+    parser.add_argument('--tiempo-gracia', type=float, default=TIEMPO_GRACIA_SEGUNDOS)
+    parser.add_argument('--registro-accesos', action='store_true', help='Registrar cada solicitud')
+    args = parser.parse_args()
+
+    # Las métricas de los trabajadores se suman a través de archivos en un directorio común
+    directorio_temporal = None
+    if not os.environ.get('DIRECTORIO_METRICAS'):
+        directorio_temporal = tempfile.mkdtemp(prefix='metricas-cultivos-')
+        os.environ['DIRECTORIO_METRICAS'] = directorio_temporal
+    import server
+    import metricas
+
+    # El padre revisa la base de datos; la aplicación no debe iniciar su propio hilo de recarga
+    app = server.crear_app({'INTERVALO_RECARGA_DATOS': 0})
+
+    if not args.registro_accesos:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    try:
+        ServidorPrefork(
+            app, app.extensions['cultivos'].modelo, args.host, args.puerto, max(args.trabajadores, 1),
+            intervalo_recarga=args.intervalo_recarga, tiempo_gracia=args.tiempo_gracia,
+            registro_metricas=metricas.REGISTRO
+        ).ejecutar()
+    finally:
+        if directorio_temporal is not None:
+            shutil.rmtree(directorio_temporal, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
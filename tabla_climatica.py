@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tabla precalculada de recomendaciones por clima.
+
+La tabla guarda, para cada punto de una grilla de temperatura x precipitación x
+altitud y para cada combinación de experiencia y preferencia de mercado, las 10
+mejores filas de la matriz de cultivos con su puntuación. Se escribe como
+arreglos .npy en un directorio y se abre con memoria mapeada, de modo que una
+consulta es un acceso directo por índice. Las solicitudes con otros filtros, fuera
+de la grilla o con datos distintos a los de la construcción se resuelven con el
+modelo en vivo.
+
+Uso:
+    python tabla_climatica.py construir DIRECTORIO [--resolucion 0.5,50,50] [--db cultivos.db]
+    python tabla_climatica.py reporte [--resoluciones 0.5,50,50;1,100,100;2,200,200] [--muestras 2000]
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from modelo_recomendacion import AJUSTE_EXPERIENCIA
+
+FORMATO_TABLA = 1
+
+# Dimensiones numéricas de la grilla
+DIMENSIONES = ('temperatura', 'precipitacion', 'altitud')
+
+# Rangos (mínimo, máximo) y resoluciones por defecto de la grilla
+RANGOS_POR_DEFECTO = ((0.0, 35.0), (0.0, 5000.0), (0.0, 4000.0))
+RESOLUCION_POR_DEFECTO = (0.5, 50.0, 50.0)
+
+# Valores categóricos tabulados (None = parámetro no especificado)
+EXPERIENCIAS_POR_DEFECTO = (None, 'baja', 'media', 'alta')
+MERCADOS_POR_DEFECTO = (None, 'local', 'exportación')
+
+# Parámetros que la tabla no cubre: su presencia obliga a usar el modelo en vivo
+PARAMETROS_NO_TABULADOS = (
+    'tipo_suelo', 'modo_suelo', 'ph_suelo', 'presupuesto', 'tiempo_disponible', 'departamento', 'id_zona'
+)
+
+NUM_RECOMENDACIONES = 10
+
+# Perfiles evaluados por pasada al construir la tabla
+PERFILES_POR_BLOQUE = 4096
+
+
+def _experiencia(valor):
+    """Nivel de experiencia tal como lo usa la puntuación (None si no la ajusta)."""
+    return valor.lower() if valor and valor.lower() in AJUSTE_EXPERIENCIA else None
+
+
+def _mercado(valor):
+    """Preferencia de mercado tal como la usa el filtro: None, 'local' o 'exportación'."""
+    if not valor:
+        return None
+    # Cualquier preferencia distinta de exportación se trata como mercado local
+    return 'exportación' if valor.lower() == 'exportación' else 'local'
+
+
+def _puntos_grilla(rango, resolucion):
+    """Índices enteros (valor / resolución) de los puntos de la grilla dentro del rango."""
+    inicio = int(np.ceil(rango[0] / resolucion - 1e-9))
+    fin = int(np.floor(rango[1] / resolucion + 1e-9))
+    return inicio, fin - inicio + 1
+
+
+def _valor_grilla(indice, resolucion):
+    """Valor de un punto de la grilla, redondeado como en CacheRecomendaciones."""
+    return round(indice * resolucion, 6)
+
+
+def _perfil(valores, experiencia, mercado):
+    """Perfil de usuario con los parámetros tabulados."""
+    perfil = dict(zip(DIMENSIONES, valores))
+    if experiencia:
+        perfil['experiencia'] = experiencia
+    if mercado:
+        perfil['preferencia_mercado'] = mercado
+    return perfil
+
+
+class TablaClimatica:
+    """
+    Consulta de una tabla de recomendaciones precalculada (abierta con memoria mapeada).
+    """
+
+    def __init__(self, directorio):
+        """
+        Abre una tabla construida con `construir_tabla_climatica`.
+
+        Args:
+            directorio (str): Directorio de la tabla
+        """
+        with open(os.path.join(directorio, 'tabla.json'), encoding='utf-8') as f:
+            self.metadatos = json.load(f)
+
+        if self.metadatos.get('formato') != FORMATO_TABLA:
+            raise ValueError(f"Formato de tabla no soportado: {self.metadatos.get('formato')}")
+
+        self.resoluciones = self.metadatos['resoluciones']
+        self.origenes = self.metadatos['origenes']
+        self.forma = self.metadatos['forma']
+        self.firmas = self.metadatos['firmas']
+        self._experiencias = {valor: i for i, valor in enumerate(self.metadatos['experiencias'])}
+        self._mercados = {valor: i for i, valor in enumerate(self.metadatos['mercados'])}
+
+        self.filas = np.load(os.path.join(directorio, 'filas.npy'), mmap_mode='r')
+        self.puntuaciones = np.load(os.path.join(directorio, 'puntuaciones.npy'), mmap_mode='r')
+        self.con_costos = np.load(os.path.join(directorio, 'con_costos.npy'), mmap_mode='r')
+
+        self._version_valida = None
+        self.aciertos = 0
+        self.fallos = 0
+
+    def buscar(self, parametros_usuario, datos):
+        """
+        Busca las recomendaciones precalculadas de un perfil.
+
+        Args:
+            parametros_usuario (dict): Parámetros ya validados
+            datos (DatosModelo): Instantánea vigente del modelo; la tabla solo se usa
+                si se construyó con las mismas tablas
+
+        Returns:
+            tuple: (filas, puntuaciones, con_costos) o None si el perfil debe
+                resolverse con el modelo en vivo
+        """
+        encontrado = self._buscar(parametros_usuario, datos)
+        if encontrado is None:
+            self.fallos += 1
+        else:
+            self.aciertos += 1
+        return encontrado
+
+    def _buscar(self, parametros_usuario, datos):
+        if self._version_valida != datos.version:
+            if datos.firmas != self.firmas:
+                return None
+            self._version_valida = datos.version
+
+        if any(parametros_usuario.get(clave) for clave in PARAMETROS_NO_TABULADOS):
+            return None
+
+        experiencia = self._experiencias.get(_experiencia(parametros_usuario.get('experiencia')), -1)
+        mercado = self._mercados.get(_mercado(parametros_usuario.get('preferencia_mercado')), -1)
+        if experiencia < 0 or mercado < 0:
+            return None
+
+        indice = [experiencia, mercado]
+        for dimension, resolucion, origen, tamano in zip(DIMENSIONES, self.resoluciones, self.origenes, self.forma[2:]):
+            k = round(float(parametros_usuario[dimension]) / resolucion) - origen
+            if not 0 <= k < tamano:
+                return None
+            indice.append(k)
+
+        indice = tuple(indice)
+        filas = self.filas[indice]
+        n = int(np.count_nonzero(filas >= 0))
+        puntuaciones = (self.puntuaciones[indice][:n] / 100).tolist()
+
+        return np.asarray(filas[:n], dtype=np.intp), puntuaciones, bool(self.con_costos[indice])
+
+    def estadisticas(self):
+        """Contadores de uso de la tabla."""
+        consultas = self.aciertos + self.fallos
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            'celdas': int(np.prod(self.forma)),
+            'resoluciones': self.resoluciones
+        }
+
+
+def construir_tabla_climatica(modelo, directorio, rangos=RANGOS_POR_DEFECTO, resoluciones=RESOLUCION_POR_DEFECTO,
+                              experiencias=EXPERIENCIAS_POR_DEFECTO, mercados=MERCADOS_POR_DEFECTO):
+    """
+    Evalúa el modelo sobre la grilla y escribe la tabla en `directorio`.
+
+    Args:
+        modelo (ModeloRecomendacionCultivos): Modelo con los datos cargados
+        directorio (str): Directorio de salida
+        rangos (tuple): (mínimo, máximo) de temperatura, precipitación y altitud
+        resoluciones (tuple): Paso de la grilla en cada dimensión
+        experiencias (tuple): Niveles de experiencia tabulados (None = sin especificar)
+        mercados (tuple): Preferencias de mercado tabuladas (None = sin especificar)
+
+    Returns:
+        dict: Metadatos de la tabla
+    """
+    datos = modelo._datos_vigentes()
+    experiencias = list(dict.fromkeys(_experiencia(valor) for valor in experiencias))
+    mercados = list(dict.fromkeys(_mercado(valor) for valor in mercados))
+
+    puntos = [_puntos_grilla(rango, resolucion) for rango, resolucion in zip(rangos, resoluciones)]
+    origenes = [origen for origen, _ in puntos]
+    forma = [len(experiencias), len(mercados)] + [tamano for _, tamano in puntos]
+
+    os.makedirs(directorio, exist_ok=True)
+    tipo_filas = np.int16 if len(datos.matriz['id_cultivo']) < np.iinfo(np.int16).max else np.int32
+    filas = np.lib.format.open_memmap(os.path.join(directorio, 'filas.npy'), mode='w+', dtype=tipo_filas,
+                                      shape=tuple(forma) + (NUM_RECOMENDACIONES,))
+    puntuaciones = np.lib.format.open_memmap(os.path.join(directorio, 'puntuaciones.npy'), mode='w+',
+                                             dtype=np.uint16, shape=tuple(forma) + (NUM_RECOMENDACIONES,))
+    con_costos = np.lib.format.open_memmap(os.path.join(directorio, 'con_costos.npy'), mode='w+',
+                                           dtype=bool, shape=tuple(forma))
+
+    # Valores de la grilla en el orden de las celdas (la altitud varía más rápido)
+    valores = np.stack(np.meshgrid(
+        *[[_valor_grilla(origen + k, resolucion) for k in range(tamano)]
+          for (origen, tamano), resolucion in zip(puntos, resoluciones)],
+        indexing='ij'
+    ), axis=-1).reshape(-1, len(DIMENSIONES)).tolist()
+
+    for i, experiencia in enumerate(experiencias):
+        for j, mercado in enumerate(mercados):
+            filas_combinacion = filas[i, j].reshape(-1, NUM_RECOMENDACIONES)
+            puntuaciones_combinacion = puntuaciones[i, j].reshape(-1, NUM_RECOMENDACIONES)
+            con_costos_combinacion = con_costos[i, j].reshape(-1)
+
+            for inicio in range(0, len(valores), PERFILES_POR_BLOQUE):
+                perfiles = [_perfil(v, experiencia, mercado) for v in valores[inicio:inicio + PERFILES_POR_BLOQUE]]
+                mejores, costos = modelo._puntuar_bloque(datos, perfiles)
+
+                for celda, (filas_perfil, puntuaciones_perfil) in enumerate(mejores, inicio):
+                    n = len(filas_perfil)
+                    filas_combinacion[celda, :n] = filas_perfil
+                    filas_combinacion[celda, n:] = -1
+                    puntuaciones_combinacion[celda, :n] = np.round(puntuaciones_perfil * 100)
+                    puntuaciones_combinacion[celda, n:] = 0
+                con_costos_combinacion[inicio:inicio + len(perfiles)] = costos
+
+    for arreglo in (filas, puntuaciones, con_costos):
+        arreglo.flush()
+
+    metadatos = {
+        'formato': FORMATO_TABLA,
+        'dimensiones': list(DIMENSIONES),
+        'resoluciones': list(resoluciones),
+        'origenes': origenes,
+        'forma': forma,
+        'experiencias': experiencias,
+        'mercados': mercados,
+        'firmas': datos.firmas,
+        'version_datos': datos.version,
+        'construida': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    with open(os.path.join(directorio, 'tabla.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadatos, f, ensure_ascii=False, indent=2)
+
+    return metadatos
+
+
+def reporte_precision(modelo, resoluciones, muestras=2000, rangos=RANGOS_POR_DEFECTO,
+                      experiencias=EXPERIENCIAS_POR_DEFECTO, mercados=MERCADOS_POR_DEFECTO, semilla=42):
+    """
+    Compara, para cada resolución, las recomendaciones del modelo en vivo con las
+    del punto de la grilla más cercano (las que daría una tabla con esa resolución).
+
+    Returns:
+        list: Por resolución, entre los perfiles con algún cultivo recomendado, el
+            porcentaje con el mismo primer cultivo y con la misma lista completa, la
+            coincidencia promedio de los 10 primeros y la diferencia absoluta promedio
+            de la puntuación del primer cultivo
+    """
+    datos = modelo._datos_vigentes()
+    ids = datos.matriz['id_cultivo']
+    rng = np.random.default_rng(semilla)
+
+    valores = np.column_stack([rng.uniform(minimo, maximo, muestras) for minimo, maximo in rangos])
+    categorias = [(experiencias[rng.integers(len(experiencias))], mercados[rng.integers(len(mercados))])
+                  for _ in range(muestras)]
+    exactos = [_perfil(v, e, m) for v, (e, m) in zip(valores.tolist(), categorias)]
+    mejores_exactos, _ = modelo._puntuar_bloque(datos, exactos)
+
+    reporte = []
+    for resolucion in resoluciones:
+        cercanos = [
+            _perfil([_valor_grilla(round(x / r), r) for x, r in zip(v, resolucion)], e, m)
+            for v, (e, m) in zip(valores.tolist(), categorias)
+        ]
+        mejores_cercanos, _ = modelo._puntuar_bloque(datos, cercanos)
+
+        primero = lista = 0
+        coincidencia = diferencia = 0.0
+        con_alguno = con_ambos = 0
+        for (filas_a, punt_a), (filas_b, punt_b) in zip(mejores_exactos, mejores_cercanos):
+            ids_a, ids_b = ids[filas_a].tolist(), ids[filas_b].tolist()
+            # Los perfiles sin cultivos en ninguno de los dos puntos no cuentan
+            if not (ids_a or ids_b):
+                continue
+            con_alguno += 1
+            lista += ids_a == ids_b
+            coincidencia += len(set(ids_a) & set(ids_b)) / max(len(ids_a), len(ids_b))
+            if ids_a and ids_b:
+                con_ambos += 1
+                primero += ids_a[0] == ids_b[0]
+                diferencia += abs(punt_a[0] - punt_b[0])
+
+        celdas = int(np.prod([_puntos_grilla(rango, r)[1] for rango, r in zip(rangos, resolucion)]))
+        reporte.append({
+            'resolucion': list(resolucion),
+            'celdas': celdas * len(experiencias) * len(mercados),
+            'perfiles_con_resultados': con_alguno,
+            'mismo_primero_pct': 100 * primero / max(con_ambos, 1),
+            'misma_lista_pct': 100 * lista / max(con_alguno, 1),
+            'coincidencia_top10_pct': 100 * coincidencia / max(con_alguno, 1),
+            'diferencia_puntuacion': diferencia / max(con_ambos, 1)
+        })
+
+    return reporte
+
+
+def _leer_resolucion(texto):
+    valores = tuple(float(v) for v in texto.split(','))
+    if len(valores) != len(DIMENSIONES) or min(valores) <= 0:
+        raise argparse.ArgumentTypeError("Se esperaban tres resoluciones positivas: temperatura,precipitacion,altitud")
+    return valores
+
+
+def main():
+    from modelo_recomendacion import ModeloRecomendacionCultivos
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='cultivos.db')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    construir = subparsers.add_parser('construir', help='Construye la tabla')
+    construir.add_argument('directorio')
+    construir.add_argument('--resolucion', type=_leer_resolucion, default=RESOLUCION_POR_DEFECTO)
+
+    reporte = subparsers.add_parser('reporte', help='Precisión frente al modelo en vivo según la resolución')
+    reporte.add_argument('--resoluciones', default='0.5,50,50;1,100,100;2,200,200;4,400,400')
+    reporte.add_argument('--muestras', type=int, default=2000)
+    reporte.add_argument('--semilla', type=int, default=42)
+
+    args = parser.parse_args()
+    modelo = ModeloRecomendacionCultivos(args.db)
+
+    if args.comando == 'construir':
+        inicio = time.perf_counter()
+        metadatos = construir_tabla_climatica(modelo, args.directorio, resoluciones=args.resolucion)
+        tamano = sum(os.path.getsize(os.path.join(args.directorio, nombre))
+                     for nombre in ('filas.npy', 'puntuaciones.npy', 'con_costos.npy'))
+        print(f"Tabla {metadatos['forma']} construida en {time.perf_counter() - inicio:.1f} s "
+              f"({tamano / 1e6:.1f} MB) en {args.directorio}")
+    else:
+        resoluciones = [_leer_resolucion(texto) for texto in args.resoluciones.split(';')]
+        print(f"{'resolucion':>18} {'celdas':>12} {'perfiles':>9} {'mismo 1.o':>10} {'misma lista':>12} {'top-10':>8} {'dif. punt.':>11}")
+        for fila in reporte_precision(modelo, resoluciones, args.muestras, semilla=args.semilla):
+            print(f"{','.join(f'{r:g}' for r in fila['resolucion']):>18} {fila['celdas']:>12} {fila['perfiles_con_resultados']:>9} "
+                  f"{fila['mismo_primero_pct']:>9.1f}% {fila['misma_lista_pct']:>11.1f}% "
+                  f"{fila['coincidencia_top10_pct']:>7.1f}% {fila['diferencia_puntuacion']:>11.2f}")
+
+    modelo.cerrar_conexion()
+
+
+if __name__ == "__main__":
+    main()
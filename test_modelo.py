@@ -6,17 +6,43 @@ Script de prueba corregido para validar el modelo de recomendación de cultivos
 """
 
 import sqlite3
+import base64
+import gzip
+import glob
 import json
 import sys
 import os
 import re
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
 
 # Agregar directorio del proyecto al path para importar el modelo
 sys.path.append('/home/ubuntu/proyecto_cultivos/src')
-from modelo_recomendacion import ModeloRecomendacionCultivos
+from modelo_recomendacion import ModeloRecomendacionCultivos, normalizar_departamento
+from serializacion_json import CODIFICADORES, codificador
+from indice_similitud import IndiceSimilitud
+from agrupador_solicitudes import AgrupadorSolicitudes
+from respuestas_http import CacheCuerpos
+from portafolio_cultivos import optimizar_asignacion, redondear_asignacion
+from pool_conexiones import PoolConexiones
+from instantanea_datos import exportar_instantanea
+from tabla_climatica import TablaClimatica, construir_tabla_climatica
+from metricas import RegistroMetricas
+from cache_recomendaciones import CacheRecomendaciones, CUANTIZACION_APROXIMADA
 
 # Configuración
 DB_PATH = '/home/ubuntu/proyecto_cultivos/data/db/cultivos.db'
+# Base de datos incluida en el repositorio, para las pruebas que comparan resultados
+DB_PATH_LOCAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cultivos.db')
 OUTPUT_DIR = '/home/ubuntu/proyecto_cultivos/tests'
 
 # Crear directorio de salida si no existe
@@ -201,7 +227,7 @@ def test_costos_implementacion():
         except Exception as e:
             print(f"Error al calcular costos para cultivo {caso['id_cultivo']}: {e}")
             resultados[f"{caso['id_cultivo']}_{caso['area']}ha"] = {"error": str(e)}
-    
+
     # Guardar resultados en archivo
     with open(os.path.join(OUTPUT_DIR, 'costos_implementacion.json'), 'w', encoding='utf-8') as f:
         json.dump(resultados, f, ensure_ascii=False, indent=2)
@@ -213,6 +239,913 @@ def test_costos_implementacion():
     
     return resultados
 
+def test_tipo_suelo_palabras_clave():
+    """Prueba el filtro de suelo: claves separadas por espacios y modo 'todas'"""
+    modelo = ModeloRecomendacionCultivos(DB_PATH_LOCAL)
+    clima = {"temperatura": 27.0, "precipitacion": 1500, "altitud": 200}
+    
+    # 'Franco-arenoso' es una sola clave: ningún suelo la contiene, así que no se filtra
+    # (como en la versión original, incluida la Papaya)
+    guion = modelo.recomendar_cultivos({**clima, "tipo_suelo": "Franco-arenoso"})
+    assert guion == modelo.recomendar_cultivos(clima)
+    assert {r['id_cultivo'] for r in guion} == {1, 8, 13, 14, 15, 20, 21, 22, 34, 35}
+    
+    # Con espacios, basta alguna de las palabras; con modo 'todas' se exigen todas
+    cualquiera = modelo.recomendar_cultivos({**clima, "tipo_suelo": "franco arcilloso"})
+    todas = modelo.recomendar_cultivos({**clima, "tipo_suelo": "franco arcilloso", "modo_suelo": "todas"})
+    assert all('franco' in r['condiciones_optimas']['tipo_suelo'].lower() or 'arcilloso' in r['condiciones_optimas']['tipo_suelo'].lower() for r in cualquiera)
+    assert todas and all('franco' in r['condiciones_optimas']['tipo_suelo'].lower() and 'arcilloso' in r['condiciones_optimas']['tipo_suelo'].lower() for r in todas)
+    assert {r['id_cultivo'] for r in todas} < {r['id_cultivo'] for r in cualquiera}
+    
+    modelo.cerrar_conexion()
+
+def test_recarga_por_tabla():
+    """Prueba que una tabla modificada crea una versión nueva y las demás se reutilizan"""
+    with tempfile.TemporaryDirectory() as directorio:
+        db_path = os.path.join(directorio, 'cultivos.db')
+        shutil.copy(DB_PATH_LOCAL, db_path)
+        modelo = ModeloRecomendacionCultivos(db_path)
+        anterior = modelo._datos_vigentes()
+        
+        # Sin cambios en los datos no se publica otra versión
+        assert not modelo.recargar(forzar=True)
+        assert modelo._datos_vigentes() is anterior
+        
+        conn = sqlite3.connect(db_path)
+        conn.execute("UPDATE costos SET inversion_min = inversion_min + 1 WHERE id_cultivo = 1")
+        conn.commit()
+        conn.close()
+        
+        assert modelo.recargar()
+        datos = modelo._datos_vigentes()
+        assert datos.version == anterior.version + 1
+        assert modelo.tablas_recargadas == ['costos']
+        assert datos.firmas['costos'] != anterior.firmas['costos']
+        for tabla in ('cultivos', 'condiciones', 'zonas', 'cultivo_zona'):
+            assert datos.tablas[tabla] is anterior.tablas[tabla]
+            assert datos.firmas[tabla] == anterior.firmas[tabla]
+        
+        modelo.cerrar_conexion()
+
+def _ejecutar_en_hilos(agrupador, clave, calcular, hilos):
+    """Llama a agrupador.ejecutar desde varios hilos; retorna los resultados o excepciones."""
+    salidas = [None] * hilos
+    
+    def llamar(i):
+        try:
+            salidas[i] = agrupador.ejecutar(clave, calcular)
+        except Exception as e:
+            salidas[i] = e
+    
+    trabajadores = [threading.Thread(target=llamar, args=(i,)) for i in range(hilos)]
+    for trabajador in trabajadores:
+        trabajador.start()
+    return trabajadores, salidas
+
+def test_agrupador_solicitudes():
+    """Prueba que las solicitudes concurrentes idénticas comparten un solo cálculo"""
+    hilos = 8
+    
+    # Un solo cálculo para todas las llamadas concurrentes, con el mismo resultado
+    agrupador = AgrupadorSolicitudes(operacion='prueba')
+    liberar = threading.Event()
+    llamadas = []
+    
+    def calcular():
+        llamadas.append(1)
+        liberar.wait(5)
+        return {'resultado': len(llamadas)}
+    
+    trabajadores, salidas = _ejecutar_en_hilos(agrupador, 'perfil', calcular, hilos)
+    time.sleep(0.3)
+    liberar.set()
+    for trabajador in trabajadores:
+        trabajador.join(5)
+    assert len(llamadas) == 1
+    assert all(salida is salidas[0] for salida in salidas)
+    assert agrupador.estadisticas()['calculadas'] == 1
+    assert agrupador.estadisticas()['agrupadas'] == hilos - 1
+    assert agrupador.estadisticas()['en_curso'] == 0
+    
+    # Terminado el cálculo, la misma clave se calcula de nuevo
+    assert agrupador.ejecutar('perfil', lambda: 'nuevo') == 'nuevo'
+    
+    # Al agotarse la espera, la solicitud calcula por su cuenta
+    agrupador = AgrupadorSolicitudes(operacion='prueba', tiempo_espera=0.05)
+    liberar = threading.Event()
+    trabajadores, salidas = _ejecutar_en_hilos(agrupador, 'perfil', lambda: liberar.wait(5) and 'lento', 1)
+    time.sleep(0.1)
+    assert agrupador.ejecutar('perfil', lambda: 'propio') == 'propio'
+    assert agrupador.estadisticas()['esperas_agotadas'] == 1
+    liberar.set()
+    trabajadores[0].join(5)
+    assert salidas == ['lento']
+    
+    # La excepción del cálculo llega a todas las solicitudes agrupadas
+    agrupador = AgrupadorSolicitudes(operacion='prueba')
+    liberar = threading.Event()
+    error = ValueError("falla")
+    
+    def fallar():
+        liberar.wait(5)
+        raise error
+    
+    trabajadores, salidas = _ejecutar_en_hilos(agrupador, 'perfil', fallar, hilos)
+    time.sleep(0.3)
+    liberar.set()
+    for trabajador in trabajadores:
+        trabajador.join(5)
+    assert all(salida is error for salida in salidas)
+    assert agrupador.estadisticas()['calculadas'] == 1
+
+def _app_temporal(directorio):
+    """Aplicación del servidor sobre una copia de la base de datos local."""
+    import server
+    db_path = os.path.join(directorio, 'cultivos.db')
+    shutil.copy(DB_PATH_LOCAL, db_path)
+    return server.crear_app({'DB_PATH': db_path, 'INTERVALO_RECARGA_DATOS': 0}), db_path
+
+def test_cuerpos_etag_gzip():
+    """Prueba las respuestas en caché: gzip, ETag, 304 y cambio de versión de los datos"""
+    # Un cuerpo por clave y versión: la misma versión reutiliza el cuerpo, otra lo reconstruye
+    cache = CacheCuerpos()
+    primero = cache.obtener('clave', 1, lambda: b'[1]')
+    assert cache.obtener('clave', 1, lambda: b'[2]') is primero
+    assert cache.obtener('clave', 2, lambda: b'[2]').contenido == b'[2]'
+    assert cache.construcciones == 2 and cache.aciertos == 1
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        app, db_path = _app_temporal(directorio)
+        cliente = app.test_client()
+        
+        plano = cliente.get('/api/cultivos')
+        comprimido = cliente.get('/api/cultivos', headers={'Accept-Encoding': 'gzip'})
+        assert plano.status_code == comprimido.status_code == 200
+        assert comprimido.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(comprimido.get_data()) == plano.get_data()
+        assert plano.headers['ETag'] != comprimido.headers['ETag']
+        
+        # Con el ETag vigente (de cualquiera de las dos versiones) la respuesta es 304 sin cuerpo
+        for respuesta, encabezados in ((plano, {}), (comprimido, {'Accept-Encoding': 'gzip'})):
+            revalidada = cliente.get('/api/cultivos', headers={**encabezados, 'If-None-Match': respuesta.headers['ETag']})
+            assert revalidada.status_code == 304
+            assert revalidada.get_data() == b''
+            assert revalidada.headers['ETag'] == respuesta.headers['ETag']
+        
+        # Al cambiar los datos cambian el cuerpo, su gzip y su ETag
+        conn = sqlite3.connect(db_path)
+        conn.execute("UPDATE cultivos SET descripcion = descripcion || ' (actualizado)' WHERE id_cultivo = 1")
+        conn.commit()
+        conn.close()
+        modelo = app.extensions['cultivos'].modelo
+        assert modelo.recargar()
+        
+        nuevo = cliente.get('/api/cultivos', headers={'Accept-Encoding': 'gzip',
+                                                      'If-None-Match': comprimido.headers['ETag']})
+        assert nuevo.status_code == 200
+        assert nuevo.headers['ETag'] != comprimido.headers['ETag']
+        assert '(actualizado)' in gzip.decompress(nuevo.get_data()).decode()
+        
+        modelo.cerrar_conexion()
+
+def test_catalogo_campos_orden_paginas():
+    """Prueba el catálogo: campos, orden, límite y recorrido por cursor con valores nulos"""
+    with tempfile.TemporaryDirectory() as directorio:
+        app, db_path = _app_temporal(directorio)
+        cliente = app.test_client()
+        
+        # Algunos cultivos sin ciclo, para ordenar por una columna con valores nulos
+        conn = sqlite3.connect(db_path)
+        conn.execute("UPDATE cultivos SET ciclo_dias = NULL WHERE id_cultivo IN (2, 5, 9, 30)")
+        conn.commit()
+        conn.close()
+        app.extensions['cultivos'].modelo.recargar()
+        
+        completos = cliente.get('/api/cultivos').get_json()
+        assert len(completos) > 10
+        
+        # Solo los campos pedidos (id_cultivo siempre) y filtro por tipo
+        parcial = cliente.get('/api/cultivos?fields=nombre,costos&tipo=Frutal').get_json()
+        assert parcial and all(set(cultivo) == {'id_cultivo', 'nombre', 'costos'} for cultivo in parcial)
+        assert {c['id_cultivo'] for c in parcial} == {c['id_cultivo'] for c in completos if c['tipo'] == 'Frutal'}
+        
+        for orden in ('ciclo_dias', '-ciclo_dias', 'nombre', '-tipo', 'id_cultivo'):
+            columna = orden.lstrip('-')
+            descendente = orden.startswith('-')
+            # Orden esperado: nulos al final y empates por id, en el sentido pedido
+            con_valor = sorted((c for c in completos if c[columna] is not None),
+                               key=lambda c: (c[columna], c['id_cultivo']), reverse=descendente)
+            nulos = sorted((c for c in completos if c[columna] is None),
+                           key=lambda c: c['id_cultivo'], reverse=descendente)
+            esperado = [c['id_cultivo'] for c in con_valor + nulos]
+            
+            ordenados = cliente.get(f'/api/cultivos?sort={orden}&fields={columna}').get_json()
+            assert [c['id_cultivo'] for c in ordenados] == esperado
+            
+            # Recorrer las páginas con el cursor entrega cada cultivo una sola vez
+            vistos = []
+            cursor = None
+            while True:
+                url = f'/api/cultivos?sort={orden}&limit=4&fields={columna}' + (f'&cursor={cursor}' if cursor else '')
+                pagina = cliente.get(url)
+                assert pagina.status_code == 200
+                filas = pagina.get_json()
+                assert len(filas) <= 4
+                vistos += [c['id_cultivo'] for c in filas]
+                cursor = pagina.headers.get('X-Siguiente-Cursor')
+                if cursor is None:
+                    break
+            assert vistos == esperado
+        
+        # Parámetros inválidos: campo, orden, límite y cursores mal formados o con valores no escalares
+        cursores = ['no-es-base64!', base64.urlsafe_b64encode(b'[1,2]').decode()]
+        cursores += [
+            base64.urlsafe_b64encode(json.dumps(['nombre', False, valor, 3]).encode()).decode().rstrip('=')
+            for valor in ([1], {'a': 1})
+        ]
+        urls = ['/api/cultivos?fields=clima', '/api/cultivos?sort=precio', '/api/cultivos?limit=0',
+                '/api/cultivos?limit=abc'] + [f'/api/cultivos?sort=nombre&limit=2&cursor={c}' for c in cursores]
+        for url in urls:
+            assert cliente.get(url).status_code == 400, url
+        
+        app.extensions['cultivos'].modelo.cerrar_conexion()
+
+def test_portafolio_restricciones():
+    """Prueba que el portafolio redondeado respeta área, presupuesto y máximo por cultivo"""
+    # Instancias aleatorias de la optimización y el redondeo
+    aleatorio = np.random.default_rng(12)
+    for _ in range(20):
+        n = int(aleatorio.integers(1, 12))
+        inversion = aleatorio.uniform(1e6, 2e7, n)
+        ganancia = inversion * aleatorio.uniform(0.05, 0.6, n)
+        area = float(aleatorio.uniform(0.5, 50))
+        presupuesto = float(aleatorio.uniform(1e6, 3e8))
+        maximo = area * float(aleatorio.uniform(0.1, 1))
+        
+        hectareas = redondear_asignacion(optimizar_asignacion(ganancia, inversion, area, presupuesto, maximo), 0.1)
+        assert np.all(hectareas >= 0)
+        assert hectareas.sum() <= area + 1e-9
+        assert hectareas @ inversion <= presupuesto * (1 + 1e-9)
+        assert np.all(hectareas <= maximo + 1e-9)
+        assert np.allclose(hectareas * 10, np.round(hectareas * 10))
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        app, _ = _app_temporal(directorio)
+        cliente = app.test_client()
+        finca = {"temperatura": 24.0, "precipitacion": 1500, "altitud": 800, "area_disponible": 10}
+        
+        for opciones in ({}, {"presupuesto": 50000000}, {"presupuesto": 50000000, "max_fraccion_por_cultivo": 0.3}):
+            respuesta = cliente.post('/api/portafolio', json={**finca, **opciones})
+            assert respuesta.status_code == 200
+            portafolio = respuesta.get_json()
+            asignaciones = portafolio['asignaciones']
+            maximo = finca['area_disponible'] * opciones.get('max_fraccion_por_cultivo', 0.5)
+            assert asignaciones
+            assert sum(a['hectareas'] for a in asignaciones) <= finca['area_disponible'] + 1e-9
+            assert all(0 < a['hectareas'] <= maximo + 1e-9 for a in asignaciones)
+            assert len({a['id_cultivo'] for a in asignaciones}) == len(asignaciones)
+            if 'presupuesto' in opciones:
+                assert portafolio['inversion_total'] <= opciones['presupuesto']
+        
+        # Entradas inválidas
+        invalidas = [
+            {**finca, "area_disponible": 0}, {**finca, "area_disponible": "abc"},
+            {k: v for k, v in finca.items() if k != 'area_disponible'},
+            {k: v for k, v in finca.items() if k != 'temperatura'},
+            {**finca, "max_fraccion_por_cultivo": "abc"}, {**finca, "max_fraccion_por_cultivo": 0},
+            {**finca, "max_fraccion_por_cultivo": 1.5}, [finca]
+        ]
+        for cuerpo in invalidas:
+            assert cliente.post('/api/portafolio', json=cuerpo).status_code == 400, cuerpo
+        assert cliente.post('/api/portafolio', data='no es JSON', content_type='application/json').status_code == 400
+        
+        app.extensions['cultivos'].modelo.cerrar_conexion()
+
+def test_pool_conexiones():
+    """Prueba que el pool es de solo lectura, reutiliza conexiones y no supera su tamaño"""
+    with tempfile.TemporaryDirectory() as directorio:
+        db_path = os.path.join(directorio, 'cultivos.db')
+        shutil.copy(DB_PATH_LOCAL, db_path)
+        
+        # Las escrituras fallan por query_only y, sin él, por mode=ro
+        for pragmas in (None, {'query_only': 0}):
+            pool = PoolConexiones(db_path, pragmas=pragmas)
+            with pool.conexion() as conn:
+                for sentencia in ("UPDATE cultivos SET nombre = 'x' WHERE id_cultivo = 1",
+                                  "CREATE TABLE prueba (id INTEGER)"):
+                    try:
+                        conn.execute(sentencia)
+                    except sqlite3.OperationalError:
+                        pass
+                    else:
+                        raise AssertionError(f"La escritura no falló: {sentencia}")
+            pool.cerrar()
+        
+        # Préstamos sucesivos reutilizan la misma conexión
+        pool = PoolConexiones(db_path, tamano=3)
+        with pool.conexion() as primera:
+            pass
+        with pool.conexion() as segunda:
+            assert segunda is primera
+        assert pool.estadisticas()['abiertas'] == 1
+        
+        # Con préstamos concurrentes nunca hay más de `tamano` conexiones abiertas ni en uso
+        en_uso = []
+        maximo = [0]
+        usadas = set()
+        lock = threading.Lock()
+        
+        def consultar():
+            with pool.conexion() as conn:
+                with lock:
+                    en_uso.append(conn)
+                    maximo[0] = max(maximo[0], len(en_uso))
+                    usadas.add(id(conn))
+                conn.execute("SELECT COUNT(*) FROM cultivos").fetchone()
+                time.sleep(0.02)
+                with lock:
+                    en_uso.remove(conn)
+        
+        hilos = [threading.Thread(target=consultar) for _ in range(12)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join(10)
+        estadisticas = pool.estadisticas()
+        assert maximo[0] <= 3 and len(usadas) <= 3
+        assert estadisticas['abiertas'] <= 3 and estadisticas['libres'] == estadisticas['abiertas']
+        assert estadisticas['prestamos'] == 14 and estadisticas['esperas'] > 0
+        pool.cerrar()
+        
+        # Pool agotado: la espera termina con TimeoutError; cerrado: RuntimeError
+        pool = PoolConexiones(db_path, tamano=1, timeout_segundos=0.05)
+        with pool.conexion():
+            try:
+                with pool.conexion():
+                    raise AssertionError("Se prestó una conexión de más")
+            except TimeoutError:
+                pass
+        assert pool.estadisticas()['agotamientos'] == 1
+        pool.cerrar()
+        try:
+            with pool.conexion():
+                raise AssertionError("El pool cerrado prestó una conexión")
+        except RuntimeError:
+            pass
+
+def _recomendar_pandas(tablas, parametros):
+    """Reproduce con pandas los filtros y la puntuación fila a fila del modelo original"""
+    df = pd.merge(tablas['cultivos'], tablas['condiciones'], on='id_cultivo')
+    for valor, minimo, maximo, margen in ((parametros['temperatura'], 'temp_min', 'temp_max', 2.0),
+                                          (parametros['precipitacion'], 'precipitacion_min', 'precipitacion_max', 200),
+                                          (parametros['altitud'], 'altitud_min', 'altitud_max', 200)):
+        filtrado = df[(df[minimo] <= valor) & (df[maximo] >= valor)]
+        if filtrado.empty:
+            filtrado = df[(df[minimo] - margen <= valor) & (df[maximo] + margen >= valor)]
+        df = filtrado
+    
+    if parametros.get('tipo_suelo'):
+        palabras = parametros['tipo_suelo'].lower().split()
+        filtrado = df[df['tipo_suelo'].str.lower().apply(lambda x: any(p in x for p in palabras))]
+        df = filtrado if len(filtrado) else df
+    if parametros.get('ph_suelo'):
+        df = df[(df['ph_min'] <= parametros['ph_suelo']) & (df['ph_max'] >= parametros['ph_suelo'])]
+    if parametros.get('presupuesto'):
+        df = pd.merge(df, tablas['costos'], on='id_cultivo')
+        df = df[df['inversion_min'] <= parametros['presupuesto']]
+    if parametros.get('tiempo_disponible'):
+        df = df[df['ciclo_dias'] <= parametros['tiempo_disponible']]
+    if parametros.get('preferencia_mercado'):
+        filtrado = pd.merge(df, tablas['costos'], on='id_cultivo')
+        precio = 'precio_export' if parametros['preferencia_mercado'].lower() == 'exportación' else 'precio_interno'
+        filtrado = filtrado[filtrado[precio].notna()]
+        df = filtrado if len(filtrado) else df
+    if df.empty:
+        return []
+    
+    puntuacion = 100.0
+    for valor, minimo, maximo in ((parametros['temperatura'], 'temp_min', 'temp_max'),
+                                  (parametros['precipitacion'], 'precipitacion_min', 'precipitacion_max'),
+                                  (parametros['altitud'], 'altitud_min', 'altitud_max')):
+        distancia = ((df[minimo] + df[maximo]) / 2 - valor).abs()
+        distancia_max = distancia.max() if distancia.max() > 0 else 1
+        puntuacion = puntuacion - 20 + 20 * (1 - distancia / distancia_max)
+    if 'rentabilidad' in df.columns:
+        rentabilidad_max = df['rentabilidad'].max() if df['rentabilidad'].max() > 0 else 1
+        puntuacion = puntuacion + 20 * (df['rentabilidad'] / rentabilidad_max)
+    if parametros.get('experiencia'):
+        ajustes = {('baja', 'Baja'): 10, ('baja', 'Alta'): -10, ('media', 'Baja'): 5, ('media', 'Media'): 10,
+                   ('alta', 'Media'): 5, ('alta', 'Alta'): 10}
+        dificultad = {'Maíz': 'Baja', 'Fríjol': 'Baja', 'Yuca': 'Baja', 'Plátano': 'Baja',
+                      'Café': 'Alta', 'Cacao': 'Alta', 'Gulupa': 'Alta', 'Arándano': 'Alta'}
+        experiencia = parametros['experiencia'].lower()
+        puntuacion = puntuacion + df['nombre'].map(lambda x: ajustes.get((experiencia, dificultad.get(x, 'Media')), 0))
+    df = df.assign(puntuacion=puntuacion.clip(0, 100))
+    
+    # Empates ordenados por id de cultivo, igual que el motor matricial
+    df = df.sort_values(['puntuacion', 'id_cultivo'], ascending=[False, True], kind='stable').head(10)
+    return list(zip(df['id_cultivo'].tolist(), df['puntuacion'].round(2).tolist()))
+
+def test_paridad_motor_matricial():
+    """Prueba que el motor matricial devuelve el mismo top 10 que el cálculo con pandas"""
+    with sqlite3.connect(DB_PATH_LOCAL) as conn:
+        tablas = {tabla: pd.read_sql(f"SELECT * FROM {tabla}", conn)
+                  for tabla in ('cultivos', 'condiciones', 'costos')}
+    modelo = ModeloRecomendacionCultivos(DB_PATH_LOCAL)
+    
+    # El filtro por departamento queda fuera: el cálculo original fallaba al sumar la
+    # rentabilidad textual de cultivo_zona
+    opcionales = [{}, {'experiencia': 'Baja'}, {'experiencia': 'alta'}, {'ph_suelo': 6.0},
+                  {'tiempo_disponible': 200}, {'tipo_suelo': 'franco arenoso'}, {'presupuesto': 8000000},
+                  {'preferencia_mercado': 'Exportación'}, {'preferencia_mercado': 'Local'},
+                  {'tipo_suelo': 'arcilloso', 'ph_suelo': 5.5, 'experiencia': 'media'}]
+    comparados = 0
+    for temperatura in (12, 18, 24, 28):
+        for precipitacion in (800, 1500, 2500):
+            for altitud in (100, 1200, 2200):
+                for opcional in opcionales:
+                    parametros = dict(temperatura=temperatura, precipitacion=precipitacion, altitud=altitud, **opcional)
+                    esperado = _recomendar_pandas(tablas, parametros)
+                    # Con cultivos repetidos tras las uniones el original no tiene un top 10 definido
+                    if len({id_cultivo for id_cultivo, _ in esperado}) != len(esperado):
+                        continue
+                    obtenido = [(r['id_cultivo'], r['puntuacion']) for r in modelo.recomendar_cultivos(parametros)]
+                    assert obtenido == esperado, parametros
+                    comparados += 1
+    
+    assert comparados > 300
+    modelo.cerrar_conexion()
+
+def test_proveedores_mas_baratos_y_disponibilidad():
+    """Prueba el índice de proveedores contra la consulta SQL de la que se construye"""
+    consulta = """
+        SELECT p.*, pi.id_insumo, pi.precio, pi.disponibilidad, i.nombre as nombre_insumo,
+               i.categoria as categoria_insumo, i.unidad_medida
+        FROM proveedores p
+        JOIN proveedor_insumo pi ON p.id_proveedor = pi.id_proveedor
+        JOIN insumos i ON pi.id_insumo = i.id_insumo
+        WHERE pi.id_insumo IN (SELECT id_insumo FROM insumo_cultivo WHERE id_cultivo = ?)
+    """
+    with tempfile.TemporaryDirectory() as directorio:
+        db_path = os.path.join(directorio, 'cultivos.db')
+        shutil.copy(DB_PATH_LOCAL, db_path)
+        # Precios distintos y disponibilidades variadas para que los filtros tengan efecto
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("UPDATE proveedor_insumo SET precio = precio + rowid")
+            conn.execute("UPDATE proveedor_insumo SET disponibilidad = 'Baja' WHERE rowid % 2 = 0")
+            ids_cultivos = [fila[0] for fila in conn.execute("SELECT DISTINCT id_cultivo FROM insumo_cultivo")]
+            filas = {id_cultivo: conn.execute(consulta, (id_cultivo,)).fetchall() for id_cultivo in ids_cultivos}
+            columnas = [c[0] for c in conn.execute(consulta, (0,)).description]
+        conn.close()
+        
+        modelo = ModeloRecomendacionCultivos(db_path)
+        ofertas = lambda proveedores: {(p['id_proveedor'], i['id_insumo']) for p in proveedores for i in p['insumos']}
+        for id_cultivo in ids_cultivos:
+            registros = [dict(zip(columnas, fila)) for fila in filas[id_cultivo]]
+            
+            # Sin opciones, los mismos proveedores y ofertas que la consulta
+            proveedores = modelo.obtener_proveedores_insumos(id_cultivo)
+            assert ofertas(proveedores) == {(r['id_proveedor'], r['id_insumo']) for r in registros}
+            
+            # La oferta más barata de cada insumo
+            mas_baratas = {}
+            for r in sorted(registros, key=lambda r: r['precio']):
+                mas_baratas.setdefault(r['id_insumo'], (r['id_proveedor'], r['id_insumo']))
+            assert ofertas(modelo.obtener_proveedores_insumos(id_cultivo, max_ofertas_por_insumo=1)) == set(mas_baratas.values())
+            
+            # Filtro por disponibilidad, sin distinguir mayúsculas
+            altas = {(r['id_proveedor'], r['id_insumo']) for r in registros if r['disponibilidad'] == 'Alta'}
+            assert ofertas(modelo.obtener_proveedores_insumos(id_cultivo, disponibilidad='alta')) == altas
+            assert ofertas(modelo.obtener_proveedores_insumos(id_cultivo, disponibilidad=['Alta', 'Baja'])) == ofertas(proveedores)
+        
+        assert modelo.obtener_proveedores_insumos(-1) == {"error": "Información de insumos no disponible"}
+        try:
+            modelo.obtener_proveedores_insumos(ids_cultivos[0], max_ofertas_por_insumo=0)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("max_ofertas_por_insumo=0 debería rechazarse")
+        modelo.cerrar_conexion()
+
+def test_indice_zonas():
+    """Prueba el índice de zonas (por id_zona y por departamento) contra cultivo_zona"""
+    with sqlite3.connect(DB_PATH_LOCAL) as conn:
+        relaciones = conn.execute("""
+            SELECT z.id_zona, z.departamento, cz.id_cultivo, cz.popularidad, cz.rendimiento
+            FROM zonas z LEFT JOIN cultivo_zona cz ON z.id_zona = cz.id_zona
+        """).fetchall()
+    conn.close()
+    
+    # Popularidad máxima y rendimientos de cada cultivo por zona y por departamento
+    por_clave = {}
+    for id_zona, departamento, id_cultivo, popularidad, rendimiento in relaciones:
+        for clave in (('zonas', id_zona), ('departamentos', normalizar_departamento(departamento))):
+            cultivos = por_clave.setdefault(clave, {})
+            if id_cultivo is not None:
+                popularidades, rendimientos = cultivos.setdefault(id_cultivo, ([], []))
+                popularidades.append(popularidad)
+                rendimientos.append(rendimiento)
+    
+    modelo = ModeloRecomendacionCultivos(DB_PATH_LOCAL)
+    datos = modelo._datos_vigentes()
+    ids_filas = datos.matriz['id_cultivo']
+    for (tipo, clave), cultivos in por_clave.items():
+        mascara, popularidad, rendimiento = datos.indice_zonas[tipo][clave]
+        assert set(ids_filas[mascara].tolist()) == set(cultivos)
+        for fila in np.flatnonzero(mascara):
+            popularidades, rendimientos = cultivos[ids_filas[fila]]
+            assert popularidad[fila] == max(popularidades)
+            assert np.isclose(rendimiento[fila], np.mean(rendimientos))
+    
+    # Recomendaciones: cada cultivo una sola vez, con las estadísticas de la zona pedida
+    # (id_zona tiene prioridad sobre el departamento)
+    perfiles = [({'departamento': 'ANTIOQUIA'}, ('departamentos', 'antioquia')),
+                ({'id_zona': 8}, ('zonas', 8)),
+                ({'id_zona': '4', 'departamento': 'Antioquia'}, ('zonas', 4)),
+                ({'departamento': ' Córdoba '}, ('departamentos', 'cordoba'))]
+    for opcional, clave in perfiles:
+        cultivos = por_clave[clave]
+        con_zona = 0
+        for temperatura, precipitacion, altitud in ((21, 2200, 1500), (28, 2500, 100), (16, 2000, 2300)):
+            resultados = modelo.recomendar_cultivos(dict(temperatura=temperatura, precipitacion=precipitacion,
+                                                         altitud=altitud, **opcional))
+            ids = [r['id_cultivo'] for r in resultados]
+            assert len(ids) == len(set(ids))
+            for r in resultados:
+                if r['id_cultivo'] in cultivos:
+                    popularidades, rendimientos = cultivos[r['id_cultivo']]
+                    assert r['zona'] == {'popularidad_max': max(popularidades),
+                                         'rendimiento_promedio': round(float(np.mean(rendimientos)), 2)}
+                    con_zona += 1
+                else:
+                    assert 'zona' not in r
+            # Si algún cultivo de la zona pasa los filtros, solo quedan cultivos de la zona
+            en_zona = [id_cultivo in cultivos for id_cultivo in ids]
+            assert all(en_zona) or not any(en_zona)
+        assert con_zona > 0, opcional
+    
+    modelo.cerrar_conexion()
+
+def test_tabla_climatica():
+    """Prueba que la tabla climática responde como el modelo en vivo y recurre a él fuera de la grilla"""
+    with tempfile.TemporaryDirectory() as directorio:
+        en_vivo = ModeloRecomendacionCultivos(DB_PATH_LOCAL)
+        construir_tabla_climatica(en_vivo, directorio, rangos=((10.0, 30.0), (500.0, 3000.0), (0.0, 3000.0)),
+                                  resoluciones=(2.0, 250.0, 250.0), experiencias=(None, 'alta'),
+                                  mercados=(None, 'exportación'))
+        tabla = TablaClimatica(directorio)
+        modelo = ModeloRecomendacionCultivos(DB_PATH_LOCAL, tabla_climatica=tabla)
+        
+        # Puntos de la grilla: se responden desde la tabla con el mismo resultado
+        puntos = [dict(temperatura=t, precipitacion=p, altitud=a)
+                  for t in (10, 18, 24, 30) for p in (500, 1500, 2750) for a in (0, 1250, 3000)]
+        for perfil in puntos + [dict(p, experiencia='Alta', preferencia_mercado='Exportación') for p in puntos]:
+            assert modelo.recomendar_cultivos(perfil) == en_vivo.recomendar_cultivos(perfil), perfil
+        assert (tabla.aciertos, tabla.fallos) == (2 * len(puntos), 0)
+        
+        # Filtros no tabulados, valores fuera de la grilla o categorías no tabuladas: modelo en vivo
+        otros = [dict(temperatura=24, precipitacion=1500, altitud=1250, ph_suelo=5.5),
+                 dict(temperatura=24, precipitacion=1500, altitud=1250, tipo_suelo='arcilloso'),
+                 dict(temperatura=24, precipitacion=1500, altitud=1250, departamento='Antioquia'),
+                 dict(temperatura=32, precipitacion=1500, altitud=1250),
+                 dict(temperatura=24, precipitacion=1500, altitud=1250, experiencia='media')]
+        for perfil in otros:
+            assert modelo.recomendar_cultivos(perfil) == en_vivo.recomendar_cultivos(perfil), perfil
+        assert (tabla.aciertos, tabla.fallos) == (2 * len(puntos), len(otros))
+        
+        modelo.cerrar_conexion()
+        en_vivo.cerrar_conexion()
+
+def test_instantanea_datos():
+    """Prueba que el modelo cargado desde la instantánea binaria equivale al cargado desde SQLite"""
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'cultivos.snap')
+        exportar_instantanea(DB_PATH_LOCAL, ruta)
+        
+        sqlite = ModeloRecomendacionCultivos(DB_PATH_LOCAL)
+        instantanea = ModeloRecomendacionCultivos(DB_PATH_LOCAL, instantanea=ruta)
+        datos_sqlite, datos_instantanea = sqlite._datos_vigentes(), instantanea._datos_vigentes()
+        assert datos_instantanea.instantanea is not None
+        
+        # Mismas tablas, tipos y firmas
+        assert datos_instantanea.firmas == datos_sqlite.firmas
+        for tabla, df in datos_sqlite.tablas.items():
+            pd.testing.assert_frame_equal(datos_instantanea.tablas[tabla], df)
+        complementarios = sqlite._cargar_complementarios(datos_sqlite)
+        complementarios_instantanea = instantanea._cargar_complementarios(datos_instantanea)
+        assert complementarios_instantanea['firmas'] == complementarios['firmas']
+        for nombre, df in complementarios.items():
+            if isinstance(df, pd.DataFrame):
+                pd.testing.assert_frame_equal(complementarios_instantanea[nombre], df)
+        
+        # Mismas respuestas
+        for parametros in ({'temperatura': 22, 'precipitacion': 1500, 'altitud': 1200},
+                           {'temperatura': 28, 'precipitacion': 2500, 'altitud': 100, 'presupuesto': 8000000,
+                            'experiencia': 'Baja'},
+                           {'temperatura': 14, 'precipitacion': 800, 'altitud': 2800, 'departamento': 'Nariño',
+                            'preferencia_mercado': 'Local'}):
+            assert instantanea.recomendar_cultivos(parametros) == sqlite.recomendar_cultivos(parametros)
+        for id_cultivo in (1, 12, 33):
+            assert instantanea.obtener_detalles_cultivo(id_cultivo) == sqlite.obtener_detalles_cultivo(id_cultivo)
+            assert instantanea.obtener_proveedores_insumos(id_cultivo) == sqlite.obtener_proveedores_insumos(id_cultivo)
+        
+        # Con la base de datos sin cambios, la primera recarga no publica otra versión
+        assert not instantanea.recargar(forzar=True)
+        assert instantanea.errores_recarga == 0
+        assert instantanea._datos_vigentes() is datos_instantanea
+        
+        sqlite.cerrar_conexion()
+        instantanea.cerrar_conexion()
+
+def _esperar(condicion, limite=20):
+    """Espera hasta que `condicion()` sea verdadera o se cumpla el límite en segundos."""
+    fin = time.monotonic() + limite
+    while not condicion():
+        if time.monotonic() > fin:
+            raise AssertionError("Tiempo de espera agotado")
+        time.sleep(0.1)
+
+def test_servidor_prefork():
+    """Prueba que el lanzador pre-fork atiende con varios trabajadores, los reemplaza y se detiene"""
+    if not hasattr(os, 'fork') or not os.path.exists('/proc/self/task'):
+        return
+    
+    def trabajadores(pid):
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return set(map(int, f.read().split()))
+    
+    def recomendar(puerto):
+        solicitud = urllib.request.Request(
+            f'http://127.0.0.1:{puerto}/api/recomendaciones',
+            data=json.dumps({'temperatura': 22, 'precipitacion': 1500, 'altitud': 1200}).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}
+        )
+        with urllib.request.urlopen(solicitud, timeout=10) as respuesta:
+            assert respuesta.status == 200
+            return json.loads(respuesta.read())
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        db_path = os.path.join(directorio, 'cultivos.db')
+        shutil.copy(DB_PATH_LOCAL, db_path)
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            puerto = s.getsockname()[1]
+        
+        entorno = {**os.environ, 'DB_PATH': db_path}
+        entorno.pop('DIRECTORIO_METRICAS', None)
+        proceso = subprocess.Popen(
+            [sys.executable, 'servidor_prefork.py', '--trabajadores', '2', '--host', '127.0.0.1',
+             '--puerto', str(puerto), '--intervalo-recarga', '0', '--tiempo-gracia', '5'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=entorno, stdout=subprocess.PIPE, text=True
+        )
+        try:
+            for linea in proceso.stdout:
+                if linea.startswith('Sirviendo en'):
+                    break
+            else:
+                raise AssertionError("El servidor terminó antes de atender")
+            threading.Thread(target=proceso.stdout.read, daemon=True).start()
+            
+            _esperar(lambda: len(trabajadores(proceso.pid)) == 2)
+            esperado = recomendar(puerto)
+            assert esperado
+            assert all(recomendar(puerto) == esperado for _ in range(10))
+            
+            # Un trabajador que muere se reemplaza
+            iniciales = trabajadores(proceso.pid)
+            caido = min(iniciales)
+            os.kill(caido, signal.SIGKILL)
+            _esperar(lambda: len(trabajadores(proceso.pid)) == 2 and caido not in trabajadores(proceso.pid))
+            assert recomendar(puerto) == esperado
+            
+            # SIGHUP reemplaza a todos los trabajadores sin dejar de atender
+            anteriores = trabajadores(proceso.pid)
+            os.kill(proceso.pid, signal.SIGHUP)
+            _esperar(lambda: len(trabajadores(proceso.pid)) == 2 and not anteriores & trabajadores(proceso.pid))
+            assert recomendar(puerto) == esperado
+            
+            # SIGTERM: apagado ordenado
+            os.kill(proceso.pid, signal.SIGTERM)
+            assert proceso.wait(timeout=30) == 0
+        finally:
+            if proceso.poll() is None:
+                proceso.kill()
+                proceso.wait()
+
+def test_metricas_varios_procesos():
+    """Prueba que la exportación de métricas suma los registros de varios procesos"""
+    if not hasattr(os, 'fork'):
+        return
+    
+    def series(texto):
+        return {linea.rsplit(' ', 1)[0]: float(linea.rsplit(' ', 1)[1])
+                for linea in texto.splitlines() if not linea.startswith('#')}
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        registro = RegistroMetricas(directorio)
+        contador = registro.contador('prueba_consultas_total', 'Consultas de prueba', cache='a')
+        histograma = registro.histograma('prueba_segundos', 'Duración de prueba', limites=(0.1, 1.0))
+        contador.inc(2)
+        histograma.observar(0.05)
+        
+        # El hijo escribe en su propio archivo, empezando en cero, y agrega una serie
+        pid = os.fork()
+        if pid == 0:
+            codigo = 1
+            try:
+                assert series(registro.exportar())['prueba_consultas_total{cache="a"}'] == 2
+                contador.inc(3)
+                histograma.observar_varios(np.array([0.5, 2.0]))
+                registro.contador('prueba_consultas_total', 'Consultas de prueba', cache='b').inc()
+                codigo = 0
+            finally:
+                os._exit(codigo)
+        _, estado = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(estado) == 0
+        
+        esperado = {
+            'prueba_consultas_total{cache="a"}': 5,
+            'prueba_consultas_total{cache="b"}': 1,
+            'prueba_segundos_bucket{le="0.1"}': 1,
+            'prueba_segundos_bucket{le="1"}': 2,
+            'prueba_segundos_bucket{le="+Inf"}': 3,
+            'prueba_segundos_count': 3
+        }
+        sumadas = series(registro.exportar())
+        assert {clave: sumadas[clave] for clave in esperado} == esperado
+        assert np.isclose(sumadas['prueba_segundos_sum'], 2.55)
+        
+        # Al terminar el hijo, sus métricas pasan al padre y sus archivos se eliminan
+        registro.absorber(pid)
+        assert not glob.glob(os.path.join(directorio, f'metricas-{pid}.*'))
+        assert series(registro.exportar()) == sumadas
+
+def test_importaciones_diferidas():
+    """Prueba que crear la aplicación y recomendar no importan scikit-learn hasta buscar similares"""
+    codigo = r"""
+import sys
+import server
+assert 'sklearn' not in sys.modules
+app = server.crear_app({'DB_PATH': sys.argv[1], 'INTERVALO_RECARGA_DATOS': 0, 'PRECARGAR_DATOS': '0'})
+cliente = app.test_client()
+assert cliente.post('/api/recomendaciones', json={'temperatura': 22, 'precipitacion': 1500, 'altitud': 1200}).status_code == 200
+assert cliente.get('/api/cultivos/1').status_code == 200
+assert 'sklearn' not in sys.modules
+assert cliente.get('/api/cultivos/1/similares').status_code == 200
+assert 'sklearn' in sys.modules
+"""
+    with tempfile.TemporaryDirectory() as directorio:
+        db_path = os.path.join(directorio, 'cultivos.db')
+        shutil.copy(DB_PATH_LOCAL, db_path)
+        resultado = subprocess.run([sys.executable, '-c', codigo, db_path], capture_output=True, text=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)), timeout=120)
+        assert resultado.returncode == 0, resultado.stderr
+
+def test_costos_barrido():
+    """Prueba que el barrido de cultivos x áreas coincide con los cálculos individuales"""
+    modelo = ModeloRecomendacionCultivos(DB_PATH_LOCAL)
+    
+    ids_cultivos = [1, 12, 33]
+    areas = [1.0, 2.5, 5.0]
+    barrido = modelo.calcular_costos_barrido(ids_cultivos, areas, formateado=True)
+    
+    assert barrido['areas'] == areas
+    assert [cultivo['id_cultivo'] for cultivo in barrido['cultivos']] == ids_cultivos
+    for cultivo in barrido['cultivos']:
+        assert len(cultivo['formateado']) == len(areas)
+        for formateado, area in zip(cultivo['formateado'], areas):
+            individual = modelo.calcular_costos_implementacion(cultivo['id_cultivo'], area)
+            assert 'error' not in individual
+            assert formateado == individual
+    
+    modelo.cerrar_conexion()
+
+def test_recomendaciones_lote():
+    """Prueba que las recomendaciones por lote coinciden con las individuales"""
+    print("\nProbando recomendaciones por lote...")
+    
+    # Inicializar modelo
+    modelo = ModeloRecomendacionCultivos(DB_PATH_LOCAL)
+    
+    # Perfiles con distintas combinaciones de filtros opcionales, incluido uno inválido (sin altitud)
+    perfiles = [
+        {"temperatura": 21.0, "precipitacion": 2200, "altitud": 1500, "tipo_suelo": "Franco", "preferencia_mercado": "Exportación"},
+        {"temperatura": 28.0, "precipitacion": 1500, "altitud": 200, "presupuesto": 10000000, "experiencia": "Baja"},
+        {"temperatura": 14.0, "precipitacion": 900, "altitud": 2800, "ph_suelo": 5.5, "departamento": "Nariño"},
+        {"temperatura": 27.0, "precipitacion": 2500},
+        {"temperatura": 24.0, "precipitacion": 1500, "altitud": 1200, "tiempo_disponible": 365, "preferencia_mercado": "Local"}
+    ]
+    invalido = 3
+    
+    # Un resultado por perfil, en el orden de entrada, aunque se evalúen por bloques
+    resultados = list(modelo.recomendar_cultivos_lote(perfiles, tamano_bloque=2))
+    assert [resultado['indice'] for resultado in resultados] == list(range(len(perfiles)))
+    
+    individuales = {}
+    for resultado, perfil in zip(resultados, perfiles):
+        if resultado['indice'] == invalido:
+            assert 'error' in resultado
+            continue
+        individuales[resultado['indice']] = modelo.recomendar_cultivos(perfil)
+        assert individuales[resultado['indice']], f"Perfil {resultado['indice']} sin recomendaciones"
+        assert resultado['recomendaciones'] == individuales[resultado['indice']]
+    
+    # El flujo NDJSON del servidor entrega las mismas recomendaciones, una línea por perfil
+    import server
+    app = server.crear_app({'DB_PATH': DB_PATH_LOCAL, 'INTERVALO_RECARGA_DATOS': 0})
+    cuerpo = ''.join(json.dumps(perfil, ensure_ascii=False) + '\n' for perfil in perfiles)
+    respuesta = app.test_client().post('/api/recomendaciones/lote', data=cuerpo.encode(),
+                                       content_type='application/x-ndjson')
+    assert respuesta.status_code == 200
+    lineas = [json.loads(linea) for linea in respuesta.get_data().splitlines()]
+    assert [linea['indice'] for linea in lineas] == list(range(len(perfiles)))
+    assert 'error' in lineas[invalido]
+    for indice, individual in individuales.items():
+        assert lineas[indice]['recomendaciones'] == json.loads(json.dumps(list(individual)))
+    
+    print(f"{len(individuales)} perfiles coinciden con la recomendación individual")
+    
+    # Cerrar conexiones
+    app.extensions['cultivos'].modelo.cerrar_conexion()
+    modelo.cerrar_conexion()
+
+def test_serializacion_json():
+    """Prueba que el JSON armado con fragmentos es igual al de serializar los resultados"""
+    print("\nProbando serialización con fragmentos JSON...")
+    
+    perfiles = [
+        {"temperatura": 21.0, "precipitacion": 2200, "altitud": 1500, "experiencia": "Media"},
+        {"temperatura": 24.0, "precipitacion": 1500, "altitud": 1200, "presupuesto": 50000000},
+        {"temperatura": 14.0, "precipitacion": 900, "altitud": 2800, "departamento": "Nariño"}
+    ]
+    
+    for nombre in CODIFICADORES:
+        codificar = codificador(nombre)
+        modelo = ModeloRecomendacionCultivos(DB_PATH_LOCAL, codificar_json=codificar)
+        for perfil in perfiles:
+            resultados = modelo.recomendar_cultivos(perfil)
+            assert resultados, f"Sin recomendaciones para {perfil}"
+            
+            # Mismo contenido que serializar la lista de diccionarios y mismos bytes
+            # que hacerlo con el mismo codificador
+            cuerpo = resultados.json()
+            assert json.loads(cuerpo) == json.loads(json.dumps(list(resultados)))
+            assert cuerpo == codificar(list(resultados))
+        modelo.cerrar_conexion()
+    
+    print(f"{len(perfiles) * len(CODIFICADORES)} respuestas coinciden con la serialización completa")
+
+def test_indice_similitud_incremental():
+    """Prueba que la actualización del índice de similitud es igual a reconstruirlo"""
+    modelo = ModeloRecomendacionCultivos(DB_PATH_LOCAL)
+    filas_df = modelo._datos_vigentes().filas_df
+    plagas_df = modelo.plagas_df
+    indice = IndiceSimilitud(filas_df, plagas_df)
+    
+    # Costos de un cultivo: cambia la escala de la columna y con ella todos los vectores
+    filas_modificadas = filas_df.copy()
+    cafe = filas_modificadas['id_cultivo'] == 33
+    filas_modificadas.loc[cafe, 'inversion_max'] = filas_modificadas.loc[cafe, 'inversion_max'] * 3
+    
+    # Plagas de un cultivo, con el mismo conjunto de plagas: se actualiza sin reconstruir
+    plagas_modificadas = plagas_df.copy()
+    plagas_modificadas.loc[plagas_modificadas.index[0], 'id_cultivo'] = 33 if plagas_df['id_cultivo'].iloc[0] != 33 else 1
+    
+    for nuevas_filas, nuevas_plagas, actualizaciones in ((filas_modificadas, plagas_df, 0),
+                                                          (filas_df, plagas_modificadas, 1)):
+        actualizado = indice.actualizado(nuevas_filas, nuevas_plagas)
+        completo = IndiceSimilitud(nuevas_filas, nuevas_plagas)
+        
+        assert actualizado.actualizaciones == actualizaciones
+        assert np.array_equal(actualizado.ids, completo.ids)
+        assert np.array_equal(actualizado.vecinos, completo.vecinos)
+        assert np.allclose(actualizado.similitudes, completo.similitudes)
+    
+    modelo.cerrar_conexion()
+
+def test_cache_parametros_pequenos():
+    """Prueba que los valores vacíos o 0 no filtran y que la caché no redondea a 0 los pequeños"""
+    exacto = ModeloRecomendacionCultivos(DB_PATH_LOCAL)
+    base = {"temperatura": 24.0, "precipitacion": 1500, "altitud": 800}
+    
+    # Un parámetro opcional en 0 equivale a no indicarlo, con y sin caché
+    sin_filtros = exacto.recomendar_cultivos(base)
+    assert sin_filtros
+    con_cache = ModeloRecomendacionCultivos(DB_PATH_LOCAL, cache=CacheRecomendaciones())
+    for clave in ("presupuesto", "ph_suelo", "tiempo_disponible"):
+        assert exacto.recomendar_cultivos({**base, clave: 0}) == sin_filtros
+        assert con_cache.recomendar_cultivos({**base, clave: 0}) == sin_filtros
+    
+    # Con cuantización, un valor pequeño se conserva en lugar de redondearse a 0 (sin filtro)
+    aproximado = ModeloRecomendacionCultivos(DB_PATH_LOCAL, cache=CacheRecomendaciones(cuantizacion=CUANTIZACION_APROXIMADA))
+    for clave, valor in (("presupuesto", 30000), ("ph_suelo", 0.04), ("tiempo_disponible", 0.3)):
+        perfil = {**base, clave: valor}
+        assert aproximado.cache.canonizar(perfil)[1][clave] == valor
+        assert aproximado.recomendar_cultivos(perfil) == exacto.recomendar_cultivos(perfil)
+    
+    for modelo in (exacto, con_cache, aproximado):
+        modelo.cerrar_conexion()
+
 def validar_recomendaciones(resultados):
     """Valida la calidad de las recomendaciones generadas"""
     print("\nValidando calidad de las recomendaciones...")
@@ -301,6 +1234,66 @@ def main():
     # Probar cálculo de costos
     test_costos_implementacion()
     
+    # Probar filtro por tipo de suelo
+    test_tipo_suelo_palabras_clave()
+    
+    # Probar recarga de tablas modificadas
+    test_recarga_por_tabla()
+    
+    # Probar agrupación de solicitudes concurrentes
+    test_agrupador_solicitudes()
+    
+    # Probar respuestas en caché con ETag y gzip
+    test_cuerpos_etag_gzip()
+    
+    # Probar consultas del catálogo
+    test_catalogo_campos_orden_paginas()
+    
+    # Probar portafolio de cultivos
+    test_portafolio_restricciones()
+    
+    # Probar pool de conexiones
+    test_pool_conexiones()
+    
+    # Probar paridad del motor matricial
+    test_paridad_motor_matricial()
+    
+    # Probar proveedores de insumos
+    test_proveedores_mas_baratos_y_disponibilidad()
+    
+    # Probar índice de zonas
+    test_indice_zonas()
+    
+    # Probar tabla climática
+    test_tabla_climatica()
+    
+    # Probar instantánea de datos
+    test_instantanea_datos()
+    
+    # Probar servidor pre-fork
+    test_servidor_prefork()
+    
+    # Probar métricas de varios procesos
+    test_metricas_varios_procesos()
+    
+    # Probar importaciones diferidas
+    test_importaciones_diferidas()
+    
+    # Probar barrido de costos
+    test_costos_barrido()
+    
+    # Probar recomendaciones por lote
+    test_recomendaciones_lote()
+    
+    # Probar serialización con fragmentos JSON
+    test_serializacion_json()
+    
+    # Probar caché con valores pequeños
+    test_cache_parametros_pequenos()
+    
+    # Probar actualización del índice de similitud
+    test_indice_similitud_incremental()
+    
     # Validar calidad de recomendaciones
     validar_recomendaciones(resultados)
     
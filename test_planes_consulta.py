@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pruebas de regresión de los planes de consulta
+
+Crea una base de datos sintética con schema.sql (unos 2.000 cultivos y 100.000 filas
+en las tablas de relación, multiplicados por ESCALA_PLANES), ejecuta sobre ella el
+modelo de recomendación y las rutas del servidor registrando cada sentencia SQL, y
+revisa con EXPLAIN QUERY PLAN que ninguna recorra una tabla completa salvo la tabla
+principal de una lectura completa (el ciclo exterior de la consulta) y que SQLite no
+necesite crear índices automáticos.
+
+Uso:
+    python -m pytest test_planes_consulta.py
+    ESCALA_PLANES=10 python -m pytest test_planes_consulta.py
+"""
+
+import os
+import random
+import re
+import sqlite3
+
+import pytest
+
+import server
+from catalogo_cultivos import ConsultaCatalogo
+from modelo_recomendacion import CONSULTAS_COMPLEMENTARIAS, ModeloRecomendacionCultivos
+from pool_conexiones import PoolConexiones
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+ESCALA = int(os.environ.get('ESCALA_PLANES', 1))
+
+# Tablas de relación y sus dos claves
+RELACIONES = {
+    'cultivo_zona': ('id_cultivo', 'id_zona'),
+    'cultivo_plaga': ('id_cultivo', 'id_plaga'),
+    'insumo_cultivo': ('id_insumo', 'id_cultivo'),
+    'proveedor_insumo': ('id_proveedor', 'id_insumo'),
+    'tecnica_cultivo': ('id_tecnica', 'id_cultivo'),
+    'cultivo_certificacion': ('id_cultivo', 'id_certificacion')
+}
+
+# Solicitudes con que se ejercitan las consultas del servidor
+SOLICITUDES = [
+    ('GET', '/api/cultivos', None),
+    ('GET', '/api/cultivos?tipo=Cereal', None),
+    ('GET', '/api/cultivos?tipo=Frutal,Hortaliza&fields=nombre,condiciones,costos', None),
+    ('GET', '/api/cultivos?sort=-nombre&limit=50', None),
+    ('GET', '/api/cultivos?tipo=Frutal&sort=ciclo_dias&limit=20', None),
+    ('GET', '/api/cultivos?limit=100', None),
+    ('GET', '/api/cultivos/1', None),
+    ('GET', '/api/cultivos/1/similares', None),
+    ('GET', '/api/costos/1', None),
+    ('GET', '/api/proveedores/1', None),
+    ('POST', '/api/recomendaciones', {'temperatura': 20, 'precipitacion': 1500, 'altitud': 1000}),
+    ('POST', '/api/portafolio', {'temperatura': 20, 'precipitacion': 1500, 'altitud': 1000, 'area_disponible': 10}),
+    ('POST', '/api/datos/recargar', None)
+]
+
+
+def crear_base_sintetica(ruta, escala=1, semilla=7):
+    """
+    Crea una base de datos con schema.sql y datos aleatorios.
+
+    Args:
+        ruta (str): Archivo de la base de datos
+        escala (int): Multiplica el número de filas de cada tabla
+        semilla (int): Semilla de los datos aleatorios
+    """
+    aleatorio = random.Random(semilla)
+    conn = sqlite3.connect(ruta)
+    with open(SCHEMA_PATH, encoding='utf-8') as archivo:
+        conn.executescript(archivo.read())
+
+    n_cultivos, n_zonas, n_plagas = 2000 * escala, 200 * escala, 500 * escala
+    n_insumos, n_proveedores, n_tecnicas, n_certificaciones = 1000 * escala, 300 * escala, 300 * escala, 50
+
+    tipos = ('Cereal', 'Frutal', 'Hortaliza', 'Leguminosa', 'Tubérculo', 'Industrial')
+    conn.executemany("INSERT INTO cultivos VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+        (i, f"Cultivo {i}", None, "Cultivo sintético", aleatorio.choice(tipos), aleatorio.randint(60, 900),
+         "1 planta/m²", None)
+        for i in range(1, n_cultivos + 1)
+    ])
+
+    condiciones = []
+    for id_cultivo in range(1, n_cultivos + 1):
+        for _ in range(2):
+            temperatura, ph = aleatorio.uniform(5, 30), aleatorio.uniform(4.5, 7.5)
+            precipitacion, altitud = aleatorio.randint(300, 3000), aleatorio.randint(0, 3000)
+            condiciones.append((
+                None, id_cultivo, round(temperatura - 4, 1), round(temperatura + 4, 1),
+                precipitacion - 400, precipitacion + 400, aleatorio.choice(('Franco', 'Arcilloso', 'Arenoso')),
+                round(ph - 0.5, 1), round(ph + 0.5, 1), max(0, altitud - 500), altitud + 500
+            ))
+    conn.executemany("INSERT INTO condiciones VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", condiciones)
+
+    conn.executemany("INSERT INTO costos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        (None, i, 1000000, 3000000, 500000, 2000, 1.5, round(aleatorio.uniform(5, 40), 2), '2025-01-01')
+        for i in range(1, n_cultivos + 1)
+    ])
+    conn.executemany("INSERT INTO zonas VALUES (?, ?, ?, ?, ?, ?, ?)", [
+        (i, f"Zona {i}", f"Departamento {i % 32}", 0, 2000, 20, 1500) for i in range(1, n_zonas + 1)
+    ])
+    conn.executemany("INSERT INTO plagas_enfermedades VALUES (?, ?, ?, ?, ?, ?, ?)", [
+        (i, f"Plaga {i}", None, aleatorio.choice(('Plaga', 'Enfermedad')), None, "Control integrado", None)
+        for i in range(1, n_plagas + 1)
+    ])
+    conn.executemany("INSERT INTO insumos VALUES (?, ?, ?, ?, ?, ?, ?)", [
+        (i, f"Insumo {i}", aleatorio.choice(('Fertilizante', 'Semilla', 'Fungicida')), None, 'kg',
+         round(aleatorio.uniform(1000, 100000)), '2025-01-01')
+        for i in range(1, n_insumos + 1)
+    ])
+    conn.executemany("INSERT INTO proveedores VALUES (?, ?, ?, ?, ?, ?, ?)", [
+        (i, f"Proveedor {i}", 'Distribuidor', None, None, None, None) for i in range(1, n_proveedores + 1)
+    ])
+    conn.executemany("INSERT INTO tecnicas VALUES (?, ?, ?, ?, ?, ?)", [
+        (i, f"Técnica {i}", 'Manejo', None, 'Media', None) for i in range(1, n_tecnicas + 1)
+    ])
+    conn.executemany("INSERT INTO certificaciones VALUES (?, ?, ?, ?, ?, ?)", [
+        (i, f"Certificación {i}", 'Entidad', None, None, '1 año') for i in range(1, n_certificaciones + 1)
+    ])
+
+    def relacionar(tabla, n_primera, n_segunda, por_fila, otras_columnas):
+        """Inserta `por_fila` pares distintos para cada valor de la primera clave."""
+        filas = [
+            (primera, segunda, *otras_columnas())
+            for primera in range(1, n_primera + 1)
+            for segunda in aleatorio.sample(range(1, n_segunda + 1), por_fila)
+        ]
+        marcadores = ', '.join('?' * len(filas[0]))
+        conn.executemany(f"INSERT INTO {tabla} VALUES ({marcadores})", filas)
+
+    relacionar('cultivo_zona', n_cultivos, n_zonas, 10,
+               lambda: (round(aleatorio.uniform(1, 20), 2), 'Alta', aleatorio.randint(1, 5)))
+    relacionar('cultivo_plaga', n_cultivos, n_plagas, 5, lambda: ('Alta', 'Frecuente'))
+    relacionar('insumo_cultivo', n_insumos, n_cultivos, 16, lambda: (2.0, 'Siembra', 'Anual'))
+    relacionar('proveedor_insumo', n_proveedores, n_insumos, 20,
+               lambda: (round(aleatorio.uniform(1000, 100000)), 'Inmediata'))
+    relacionar('tecnica_cultivo', n_tecnicas, n_cultivos, 30, lambda: ('Alta', 'Siembra'))
+    relacionar('cultivo_certificacion', n_cultivos, n_certificaciones, 2, lambda: ('Exportación', 10))
+
+    conn.commit()
+    conn.close()
+
+
+def plan_consulta(conn, sentencia, parametros=()):
+    """
+    Plan de una sentencia.
+
+    Returns:
+        list: Tuplas (id, id del padre, detalle) de EXPLAIN QUERY PLAN
+    """
+    return [(fila[0], fila[1], fila[3]) for fila in conn.execute(f"EXPLAIN QUERY PLAN {sentencia}", parametros)]
+
+
+def recorridos_no_permitidos(plan):
+    """
+    Pasos del plan que recorren una tabla completa sin necesidad.
+
+    Solo el ciclo exterior de la consulta principal puede ser un SCAN (la consulta lee
+    toda esa tabla, o la recorre en orden hasta su LIMIT); las uniones y subconsultas
+    deben buscar con un índice o la clave primaria ('SEARCH ... USING'; un SEARCH sin
+    USING recorre la tabla hasta encontrar la fila) y ningún paso puede usar un índice
+    automático.
+
+    Returns:
+        list: Detalles de los pasos no permitidos
+    """
+    pasos = [(id_paso, padre, detalle) for id_paso, padre, detalle in plan
+             if detalle.startswith(('SCAN', 'SEARCH'))]
+    exterior = next((id_paso for id_paso, padre, _ in pasos if padre == 0), None)
+
+    no_permitidos = []
+    for id_paso, _, detalle in pasos:
+        if ('AUTOMATIC' in detalle or (detalle.startswith('SCAN') and id_paso != exterior)
+                or (detalle.startswith('SEARCH') and ' USING ' not in detalle)):
+            no_permitidos.append(detalle)
+    return no_permitidos
+
+
+def _normalizar(sentencia):
+    return ' '.join(sentencia.split())
+
+
+@pytest.fixture(scope='module')
+def base_sintetica(tmp_path_factory):
+    ruta = str(tmp_path_factory.mktemp('planes') / 'cultivos_sinteticos.db')
+    crear_base_sintetica(ruta, ESCALA)
+    return ruta
+
+
+@pytest.fixture(scope='module')
+def consultas(base_sintetica):
+    """Sentencias SELECT que ejecutan el modelo y el servidor sobre la base sintética."""
+    registradas = []
+    abrir = PoolConexiones._abrir
+
+    def abrir_registrando(pool):
+        conn = abrir(pool)
+        conn.set_trace_callback(registradas.append)
+        return conn
+
+    with pytest.MonkeyPatch.context() as parche:
+        parche.setattr(PoolConexiones, '_abrir', abrir_registrando)
+
+        modelo = ModeloRecomendacionCultivos(base_sintetica, carga_diferida=True)
+        modelo.precargar()
+        modelo.recargar(forzar=True)
+        modelo.cerrar_conexion()
+
+        app = server.crear_app({'DB_PATH': base_sintetica, 'INTERVALO_RECARGA_DATOS': 0, 'PRECARGAR_DATOS': '1'})
+        cliente = app.test_client()
+        for metodo, ruta, cuerpo in SOLICITUDES:
+            respuesta = cliente.open(ruta, method=metodo, json=cuerpo)
+            assert respuesta.status_code == 200, f"{metodo} {ruta}: {respuesta.status_code}"
+            # Recorrer también la página siguiente de las consultas paginadas
+            siguiente = respuesta.headers.get('X-Siguiente-Cursor')
+            if siguiente:
+                separador = '&' if '?' in ruta else '?'
+                assert cliente.get(f"{ruta}{separador}cursor={siguiente}").status_code == 200
+        app.extensions['cultivos'].modelo.cerrar_conexion()
+
+    # Cada sentencia distinta una vez, en el orden en que se ejecutó
+    sentencias = {}
+    for sentencia in registradas:
+        if re.match(r'\s*(SELECT|WITH)\b', sentencia, re.IGNORECASE):
+            sentencias.setdefault(_normalizar(sentencia), sentencia)
+    return list(sentencias.values())
+
+
+def test_consultas_registradas(consultas):
+    """Las consultas registradas incluyen las complementarias y las del catálogo"""
+    normalizadas = {_normalizar(sentencia) for sentencia in consultas}
+    for nombre, consulta in CONSULTAS_COMPLEMENTARIAS.items():
+        assert _normalizar(consulta) in normalizadas, f"No se ejecutó la consulta {nombre}"
+    assert any('FROM cultivos c' in sentencia and 'c.tipo IN' in sentencia for sentencia in consultas)
+    assert any('c.id_cultivo >' in sentencia for sentencia in consultas), "No se recorrió la página siguiente"
+
+
+def test_sin_recorridos_completos(base_sintetica, consultas):
+    """Ninguna consulta recorre tablas completas salvo la tabla principal de su lectura"""
+    conn = sqlite3.connect(base_sintetica)
+    errores = []
+    for sentencia in consultas:
+        no_permitidos = recorridos_no_permitidos(plan_consulta(conn, sentencia))
+        if no_permitidos:
+            errores.append(f"{_normalizar(sentencia)}\n    -> {'; '.join(no_permitidos)}")
+    conn.close()
+    assert not errores, "Consultas con recorridos completos:\n" + '\n'.join(errores)
+
+
+def test_catalogo_filtrado_usa_indices(base_sintetica):
+    """El catálogo filtrado por tipo no recorre ninguna tabla completa"""
+    conn = sqlite3.connect(base_sintetica)
+    for orden in ('id_cultivo', '-nombre', 'ciclo_dias'):
+        consulta = ConsultaCatalogo(tipos=['Frutal'], orden=orden, limite=20)
+        plan = plan_consulta(conn, *consulta.sql())
+        assert not [detalle for _, _, detalle in plan if detalle.startswith('SCAN')], plan
+    conn.close()
+
+
+@pytest.mark.parametrize('tabla', sorted(RELACIONES))
+def test_relaciones_indexadas_por_ambas_claves(base_sintetica, tabla):
+    """Cada tabla de relación se puede recorrer desde cualquiera de sus dos claves con un índice"""
+    conn = sqlite3.connect(base_sintetica)
+    primera, segunda = RELACIONES[tabla]
+    for clave, otra in ((primera, segunda), (segunda, primera)):
+        plan = plan_consulta(conn, f"SELECT {otra} FROM {tabla} WHERE {clave} = 1")
+        detalles = [detalle for _, _, detalle in plan]
+        assert all(detalle.startswith('SEARCH') and 'COVERING INDEX' in detalle for detalle in detalles), \
+            f"{tabla} por {clave}: {detalles}"
+    conn.close()